@@ -0,0 +1,99 @@
+"""
+Bandas de alerta: segment_alerts atual (groupby/agg em pandas) vs matriz segmento × dia do
+kpi_baseline (média/desvio, sazonal mediana/MAD e vários horizontes), para um dia e para um
+backfill de vários dias, sobre o CSV sintético (sem banco).
+
+    python benchmarks/bench_baseline.py --scale 10 [--cardinality 4] [--repeat 5] [--days 30]
+
+Mede com SEGMENT (3 colunas) e com todas as dimensões (milhares de segmentos nas escalas
+maiores) e confere que a banda média da matriz reproduz os z-scores do pandas.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kpi_bot  # noqa: E402
+import kpi_baseline  # noqa: E402
+import synth_data  # noqa: E402
+from populate_db import normalize_chunk  # noqa: E402
+
+
+def _best_of(fn, repeat: int) -> tuple[float, object]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def _zs(alerts: pd.DataFrame, segment: list[str]) -> pd.Series:
+    if alerts.empty:
+        return pd.Series(dtype="float64")
+    key = alerts[segment + ["metric"]].astype(str).agg("|".join, axis=1)
+    return pd.Series(alerts["zscore"].astype(float).to_numpy(), index=key).sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30, help="dias-alvo do backfill")
+    args = parser.parse_args()
+
+    card = args.cardinality or synth_data.auto_cardinality(args.scale)
+    csv_path = f"./.cache/synth/kpi_{args.scale}x_c{card}_s{args.seed}.csv"
+    if not os.path.exists(csv_path):
+        synth_data.write_csv(csv_path, args.scale, card, args.seed)
+    df = normalize_chunk(pd.read_csv(csv_path, low_memory=False))
+    target = df["date"].max()
+    df = df[df["date"] >= target - timedelta(days=91 + args.days)].reset_index(drop=True)
+    metrics = list(kpi_bot.ALERT_METRICS)
+    targets = [target - timedelta(days=i) for i in range(args.days)][::-1]
+    print(f"[bench_baseline] {len(df):,} linhas, alvo {target}, métricas {metrics}")
+
+    for segment in (kpi_bot.SEGMENT, kpi_bot.FILTER_COLUMNS):
+        n_seg = df.groupby(segment, observed=True).ngroups
+
+        def matrix(mode, hz):
+            # inclui o groupby das linhas em somas diárias, como o segment_alerts
+            sums = kpi_bot._window_sums(df, target, segment, metrics, max(hz))
+            return kpi_baseline.score_sums(sums, [target], segment, metrics, kpi_bot.ALERT_METRICS,
+                                           kpi_bot.Z_ALERT, mode, hz)
+
+        rows = [
+            ("pandas média 28d (atual)", lambda: kpi_bot.segment_alerts(df, target, metrics, segment, baseline="mean")),
+            ("matriz média 28d", lambda: matrix("mean", [28])),
+            ("matriz sazonal 8 sem.", lambda: matrix("seasonal", [56])),
+            ("matriz sazonal 28d+91d", lambda: matrix("seasonal", [28, 91])),
+        ]
+        print(f"\n{len(segment)} coluna(s) de segmento: {n_seg:,} segmentos")
+        print(f"{'banda':<28} {'1 dia (ms)':>11} {'alertas':>8}")
+        results = {}
+        for name, fn in rows:
+            secs, out = _best_of(fn, args.repeat)
+            results[name] = out
+            print(f"{name:<28} {secs * 1000:>11.2f} {len(out):>8}")
+        a, b = _zs(results["pandas média 28d (atual)"], segment), _zs(results["matriz média 28d"], segment)
+        same = a.index.equals(b.index) and np.allclose(a.to_numpy(), b.to_numpy())
+        print(f"matriz média == pandas: {'sim' if same else 'NÃO'}")
+
+        if segment == kpi_bot.SEGMENT:
+            secs_p, _ = _best_of(lambda: kpi_bot.segment_alerts_range(df, targets, metrics, baseline="mean"), args.repeat)
+            base_cols = ["amount_transacted", "quantity_transactions", "quantity_of_merchants"]
+            secs_s, out = _best_of(lambda: kpi_baseline.score_sums(
+                df.groupby(["date"] + segment, observed=True)[base_cols].sum(), targets, segment,
+                metrics, kpi_bot.ALERT_METRICS, kpi_bot.Z_ALERT, "seasonal", [56]), args.repeat)
+            print(f"backfill {args.days} dias: pandas média (rolling) {secs_p * 1000:.1f} ms | "
+                  f"matriz sazonal {secs_s * 1000:.1f} ms ({len(out)} alertas)")
+
+
+if __name__ == "__main__":
+    main()
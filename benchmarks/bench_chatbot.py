@@ -0,0 +1,93 @@
+"""
+ChatBot offline (LLM_BACKEND=fake com latência simulada): custo do digest (frio e por
+watermark), tamanho do prompt (digest vs linhas brutas do dia) e N perguntas respondidas uma
+por chamada vs em lotes paralelos, sobre o CSV sintético (sem banco).
+
+    python benchmarks/bench_chatbot.py --scale 10 [--questions 10] [--latency-ms 800] [--batch 1 5 10]
+
+A latência simulada de cada chamada é fixa; na API real ela cresce com os tokens de entrada
+e saída, então o total de tokens de cada linha também entra na comparação.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import chatbot  # noqa: E402
+import kpi_bot  # noqa: E402
+import synth_data  # noqa: E402
+from llm import FakeBackend, SummaryCache  # noqa: E402
+from populate_db import normalize_chunk  # noqa: E402
+
+QUESTIONS = [
+    "Quais são os principais destaques do último dia?",
+    "Quais segmentos merecem atenção e por quê?",
+    "Qual segmento teve a maior queda contra a semana anterior?",
+    "Como o ticket médio evoluiu nos últimos dias?",
+    "O TPV do mês está acima do mês anterior?",
+    "Há algum segmento PF com z-score muito negativo?",
+    "Qual foi o dia de maior TPV nas últimas duas semanas?",
+    "O fim de semana teve comportamento diferente dos dias úteis?",
+    "Quais segmentos cresceram mais de 15% contra W-1?",
+    "Resuma o dia em uma frase para a diretoria.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="latência simulada por chamada")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 5, 10], help="perguntas por chamada")
+    parser.add_argument("--tokens", type=int, default=800, help="orçamento do digest")
+    args = parser.parse_args()
+
+    card = args.cardinality or synth_data.auto_cardinality(args.scale)
+    csv_path = f"./.cache/synth/kpi_{args.scale}x_c{card}_s{args.seed}.csv"
+    if not os.path.exists(csv_path):
+        synth_data.write_csv(csv_path, args.scale, card, args.seed)
+    df = normalize_chunk(pd.read_csv(csv_path, low_memory=False))
+    target = df["date"].max()
+    df = df[df["date"] >= kpi_bot._window_start(target)].reset_index(drop=True)
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    print(f"[bench_chatbot] {len(df):,} linhas, alvo {target}, {len(questions)} perguntas, "
+          f"latência simulada {args.latency_ms:.0f} ms, LLM_MAX_WORKERS={os.getenv('LLM_MAX_WORKERS', 4)}")
+
+    bot = chatbot.ChatBot(backend=FakeBackend(), budget_tokens=args.tokens)
+    t0 = time.perf_counter()
+    digest = bot.digest(df)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    bot.digest(df, chatbot.watermark(df))
+    warm = time.perf_counter() - t0
+    raw = df[df["date"] == target].to_csv(index=False)
+    print(f"digest: {cold * 1000:.0f} ms (frio) | {warm * 1000:.1f} ms (mesmo watermark, incluindo o cálculo dele)")
+    print(f"prompt: digest {len(digest):,} caracteres (~{chatbot.approx_tokens(digest):,} tokens) | "
+          f"linhas brutas do dia {len(raw):,} caracteres (~{chatbot.approx_tokens(raw):,} tokens)")
+
+    print(f"\n{'perguntas/chamada':>17} {'chamadas':>9} {'tempo (s)':>10} {'tokens entrada':>15} "
+          f"{'tokens saída':>13} {'respondidas':>12}")
+    for size in args.batch:
+        backend = FakeBackend(latency_s=args.latency_ms / 1000)
+        cache = SummaryCache(cache_dir=tempfile.mkdtemp(prefix="bench_chatbot_"))
+        bot = chatbot.ChatBot(backend=backend, budget_tokens=args.tokens, batch_size=size, cache=cache)
+        bot.digest(df)  # digest já em cache: mede só as chamadas
+        t0 = time.perf_counter()
+        answers = bot.ask(df, questions)
+        secs = time.perf_counter() - t0
+        answered = sum(a != chatbot.NO_ANSWER for a in answers)
+        print(f"{size:>17} {backend.calls:>9} {secs:>10.2f} "
+              f"{-(-backend.input_chars // chatbot.CHARS_PER_TOKEN):>15,} "
+              f"{-(-backend.output_chars // chatbot.CHARS_PER_TOKEN):>13,} {answered:>12}")
+    t0 = time.perf_counter()
+    bot.ask(df, questions)
+    print(f"repetição (cache de respostas em disco): {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
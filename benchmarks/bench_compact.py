@@ -0,0 +1,76 @@
+"""
+Memória e tempo de groupby: esquema atual (object/date/int64) vs compacto (kpi_schema).
+
+    python benchmarks/bench_compact.py [--scale 1 100]
+
+A cópia Nx empilha o CSV N vezes deslocando as datas (mesmos segmentos, histórico N vezes maior).
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import timedelta
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kpi_bot  # noqa: E402
+from kpi_schema import compact_frame  # noqa: E402
+from populate_db import normalize_chunk  # noqa: E402
+
+CSV_PATH = os.getenv("CSV_PATH", "./data/Operations_analyst_data.csv")
+
+
+def scaled_copy(df: pd.DataFrame, n: int) -> pd.DataFrame:
+    if n == 1:
+        return df
+    span = (max(df["date"]) - min(df["date"])).days + 1
+    parts = []
+    for i in range(n):
+        part = df.copy()
+        part["date"] = part["date"] + timedelta(days=span * i)
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def measure(df: pd.DataFrame) -> dict:
+    target = max(df["date"])
+    if hasattr(target, "date"):
+        target = target.date()
+    grp = ["date"] + kpi_bot.SEGMENT
+    return {
+        "rows": len(df),
+        "mem_mb": df.memory_usage(deep=True).sum() / 2**20,
+        "groupby_s": _best_of(lambda: df.groupby(grp, observed=True)[
+            ["amount_transacted", "quantity_transactions"]].sum()),
+        "kpis_for_day_s": _best_of(lambda: kpi_bot.kpis_for_day(df, target)),
+        "segment_alerts_s": _best_of(lambda: kpi_bot.segment_alerts(df, target)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 100])
+    args = parser.parse_args()
+
+    base = normalize_chunk(pd.read_csv(CSV_PATH, low_memory=False))
+    print(f"{'escala':>6} {'esquema':>8} {'linhas':>10} {'MB':>9} {'groupby':>9} "
+          f"{'kpis_dia':>9} {'alertas':>9}")
+    for n in args.scale:
+        df = scaled_copy(base, n)
+        for name, frame in (("object", df), ("compact", compact_frame(df))):
+            r = measure(frame)
+            print(f"{n:>5}x {name:>8} {r['rows']:>10,} {r['mem_mb']:>9.1f} {r['groupby_s']:>8.3f}s "
+                  f"{r['kpis_for_day_s']:>8.3f}s {r['segment_alerts_s']:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
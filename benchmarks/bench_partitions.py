@@ -0,0 +1,132 @@
+"""
+EXPLAIN ANALYZE das consultas do kpi_bot: tabela única (layout antigo, B-tree em date) vs
+bi.kpi_daily particionada por mês (BRIN em date), com os mesmos dados sintéticos.
+
+    python benchmarks/bench_partitions.py --scale 10 [--seed 0] [--repeat 5]
+
+Usa o banco de benchmark da bench_suite (BENCH_PG_URL / "kpi_bench"): recria bi.kpi_daily
+particionada e uma cópia no layout antigo em bi_heap.kpi_daily.
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import timedelta
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kpi_bot  # noqa: E402
+import populate_db  # noqa: E402
+import synth_data  # noqa: E402
+from bench_suite import bench_url, ensure_database, reset_tables  # noqa: E402
+
+# Layout anterior ao particionamento (sql/00_bootstrap.sql até então)
+HEAP_DDL = """
+DROP SCHEMA IF EXISTS bi_heap CASCADE;
+CREATE SCHEMA bi_heap;
+CREATE TABLE bi_heap.kpi_daily (LIKE bi.kpi_daily INCLUDING DEFAULTS);
+ALTER TABLE bi_heap.kpi_daily ADD PRIMARY KEY (
+  date, entity, product, price_tier, anticipation_method, payment_method, installments);
+CREATE INDEX ON bi_heap.kpi_daily(date);
+CREATE INDEX ON bi_heap.kpi_daily(entity, product, payment_method);
+"""
+
+MAX_DATE_SQL = """
+    SELECT MAX(date) AS max_date
+    FROM bi.kpi_daily
+    WHERE 1=1 AND amount_transacted > 0 AND quantity_transactions > 0
+"""
+
+
+def load_both(engine, csv_path: str):
+    reset_tables(engine)
+    populate_db.load_copy(engine, csv_path, refresh_stats=False)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.execute(HEAP_DDL)
+            cur.execute("INSERT INTO bi_heap.kpi_daily SELECT * FROM bi.kpi_daily ORDER BY date")
+        raw.commit()
+        raw.set_isolation_level(0)  # VACUUM fora de transação
+        with raw.cursor() as cur:
+            cur.execute("VACUUM ANALYZE bi.kpi_daily")
+            cur.execute("VACUUM ANALYZE bi_heap.kpi_daily")
+    finally:
+        raw.close()
+
+
+def explain(engine, sql: str, params: dict, repeat: int) -> dict:
+    """Melhor execução de EXPLAIN (ANALYZE, BUFFERS): tempo, relações lidas e buffers."""
+    best = None
+    with engine.connect() as con:
+        for _ in range(repeat):
+            plan = con.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+            plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+            if best is None or plan["Execution Time"] < best["Execution Time"]:
+                best = plan
+
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(best["Plan"])
+    top = best["Plan"]
+    return {
+        "ms": best["Execution Time"],
+        "planning_ms": best["Planning Time"],
+        "relations": len(relations),
+        "buffers": top.get("Shared Hit Blocks", 0) + top.get("Shared Read Blocks", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    card = args.cardinality or synth_data.auto_cardinality(args.scale)
+    csv_path = f"./.cache/synth/kpi_{args.scale}x_c{card}_s{args.seed}.csv"
+    if not os.path.exists(csv_path):
+        synth_data.write_csv(csv_path, args.scale, card, args.seed)
+
+    url = bench_url()
+    ensure_database(url)
+    engine = create_engine(url)
+    load_both(engine, csv_path)
+
+    target = kpi_bot.get_last_available_date(engine)
+    load_sql = kpi_bot._load_sql(True).text
+    queries = {
+        "load_data (1 dia)": (load_sql, {"start": target, "end": target}),
+        f"load_data ({kpi_bot.WINDOW_DAYS} dias)": (
+            load_sql, {"start": kpi_bot._window_start(target), "end": target}),
+        "load_data (M-1..hoje)": (load_sql, {"start": target - timedelta(days=31), "end": target}),
+        "get_last_available_date": (MAX_DATE_SQL, {}),
+    }
+    with engine.connect() as con:
+        parts = con.execute(text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'bi.kpi_daily'::regclass")).scalar()
+        rows = con.execute(text("SELECT count(*) FROM bi.kpi_daily")).scalar()
+        btree_mb = con.execute(text(
+            "SELECT pg_relation_size('bi_heap.kpi_daily_date_idx')")).scalar() / 2**20
+        brin_mb = con.execute(text(
+            "SELECT COALESCE(SUM(pg_relation_size(inhrelid)), 0) FROM pg_inherits "
+            "WHERE inhparent = 'bi.kpi_daily_brin_date'::regclass")).scalar() / 2**20
+    print(f"[bench_partitions] {rows:,} linhas, {parts} partições, alvo {target}")
+    print(f"[bench_partitions] índice em date: B-tree {btree_mb:.1f} MB | BRIN {brin_mb:.2f} MB")
+    print(f"{'consulta':<26} {'layout':<13} {'exec (ms)':>10} {'plan (ms)':>10} {'relações':>9} {'buffers':>8}")
+    for name, (sql, params) in queries.items():
+        for layout, table in (("tabela única", "bi_heap.kpi_daily"), ("particionada", "bi.kpi_daily")):
+            r = explain(engine, sql.replace("bi.kpi_daily", table), params, args.repeat)
+            print(f"{name:<26} {layout:<13} {r['ms']:>10.2f} {r['planning_ms']:>10.2f} "
+                  f"{r['relations']:>9} {r['buffers']:>8}")
+
+
+if __name__ == "__main__":
+    main()
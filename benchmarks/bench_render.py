@@ -0,0 +1,79 @@
+"""
+Relatórios PDF por segundo: estilos montados a cada relatório (como o save_pdf antigo) vs
+ReportRenderer reutilizado, em arquivo e em BytesIO, e render_many com N processos.
+
+    python benchmarks/bench_render.py [--reports 90] [--workers 1 4]
+
+Os payloads (KPIs, comparações e alertas de cada dia) vêm do CSV, sem banco e sem LLM.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kpi_bot  # noqa: E402
+from daily_index import DailyIndex  # noqa: E402
+from populate_db import normalize_chunk  # noqa: E402
+from report_renderer import ReportRenderer, render_many  # noqa: E402
+
+CSV_PATH = os.getenv("CSV_PATH", "./data/Operations_analyst_data.csv")
+
+
+def build_payloads(n: int) -> list[dict]:
+    df = normalize_chunk(pd.read_csv(CSV_PATH, low_memory=False))
+    df = df[(df["amount_transacted"] > 0) & (df["quantity_transactions"] > 0)]
+    totals = kpi_bot.daily_totals(df)
+    index = DailyIndex.from_totals(totals)
+    days = sorted(totals.index)[-n:]
+    alerts = kpi_bot.segment_alerts_range(df, days)
+    payloads = []
+    for t in days:
+        today, comp_dict = kpi_bot.index_comparisons(index, t)
+        text = kpi_bot.report_text(today, comp_dict, alerts[t])
+        payloads.append(kpi_bot.report_payload(text, alerts[t], today, comp_dict))
+    return payloads
+
+
+def _rate(fn, n: int, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return n / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=90)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.reports)
+    n = len(payloads)
+    out_dir = tempfile.mkdtemp(prefix="bench_render_")
+    paths = [os.path.join(out_dir, f"r{i}.pdf") for i in range(n)]
+    shared = ReportRenderer()
+
+    cases = [
+        ("estilos por relatório, arquivo", lambda: [ReportRenderer().render(p, o) for p, o in zip(payloads, paths)]),
+        ("renderer reutilizado, arquivo", lambda: [shared.render(p, o) for p, o in zip(payloads, paths)]),
+        ("renderer reutilizado, BytesIO", lambda: [shared.render(p) for p in payloads]),
+    ]
+    for w in args.workers:
+        cases.append((f"render_many {w} processo(s), arquivo", lambda w=w: render_many(payloads, paths, workers=w)))
+
+    t0 = time.perf_counter()
+    for _ in range(100):
+        ReportRenderer()
+    print(f"{n} relatórios ({out_dir}) | montagem de estilos: "
+          f"{(time.perf_counter() - t0) * 10:.2f} ms/renderer | {os.cpu_count()} CPU(s)")
+    for name, fn in cases:
+        print(f"{name:<40} {_rate(fn, n):>8.1f} relatórios/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Gerador sintético de kpi_daily a partir do CSV de amostra.
+
+    python benchmarks/synth_data.py --scale 10 [--cardinality 2] [--out ./.cache/synth/x.csv]
+
+Preserva o vocabulário das dimensões, a frequência de cada segmento e a sazonalidade
+semanal (fator por dia da semana) da amostra. A escala N gera ~N vezes as linhas do CSV:
+o histórico cresce N / cardinality vezes (dias terminando na última data da amostra) e cada
+produto ganha `cardinality - 1` clones ("pix_2", "pix_3", ...) com nível próprio.
+"""
+import os
+import sys
+import math
+import argparse
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from populate_db import normalize_chunk, EXPECTED_COLUMNS  # noqa: E402
+
+CSV_PATH = os.getenv("CSV_PATH", "./data/Operations_analyst_data.csv")
+DIMS = ["entity", "product", "price_tier", "anticipation_method", "payment_method", "installments"]
+NOISE_SIGMA = 0.25  # ruído lognormal diário por segmento
+
+
+def auto_cardinality(scale: int) -> int:
+    """1x -> 1, 10x -> 2, 100x -> 4, 1000x -> 8: parte da escala vira mais segmentos."""
+    return max(1, round(scale ** 0.3))
+
+
+def fit_profile(csv_path: str = CSV_PATH) -> dict:
+    """Segmentos da amostra com frequência, nível base (sem sazonalidade) e fatores semanais."""
+    df = normalize_chunk(pd.read_csv(csv_path, low_memory=False))
+    df = df[(df["amount_transacted"] > 0) & (df["quantity_transactions"] > 0)]
+    dates = pd.to_datetime(df["date"])
+    daily = df.groupby(dates)[["amount_transacted", "quantity_transactions"]].sum()
+    weekday = daily.groupby(daily.index.weekday).mean() / daily.mean()
+    f_amount = weekday["amount_transacted"].reindex(range(7)).fillna(1.0).to_numpy()
+    f_tx = weekday["quantity_transactions"].reindex(range(7)).fillna(1.0).to_numpy()
+
+    wd = dates.dt.weekday.to_numpy()
+    df = df.assign(
+        amount_base=df["amount_transacted"] / f_amount[wd],
+        tx_base=df["quantity_transactions"] / f_tx[wd],
+        merchants_base=df["quantity_of_merchants"] / f_tx[wd],
+    )
+    n_days = dates.nunique()
+    seg = df.groupby(DIMS, sort=True).agg(
+        days=("date", "nunique"),
+        amount=("amount_base", "mean"),
+        tx=("tx_base", "mean"),
+        merchants=("merchants_base", "mean"),
+    ).reset_index()
+    seg["freq"] = seg.pop("days") / n_days
+    return {
+        "segments": seg, "f_amount": f_amount, "f_tx": f_tx,
+        "end": dates.max().date(), "days": n_days, "rows": len(df),
+    }
+
+
+def _expand_cardinality(seg: pd.DataFrame, cardinality: int, rng) -> pd.DataFrame:
+    if cardinality <= 1:
+        return seg.assign(level=1.0)
+    parts = [seg.assign(level=1.0)]
+    for k in range(2, cardinality + 1):
+        clone = seg.copy()
+        clone["product"] = clone["product"] + f"_{k}"
+        clone["level"] = rng.uniform(0.3, 1.5, size=len(clone))
+        parts.append(clone)
+    return pd.concat(parts, ignore_index=True)
+
+
+def generate(profile: dict, scale: int = 1, cardinality: int | None = None, seed: int = 0,
+             block_days: int = 30):
+    """Gera DataFrames (blocos de `block_days` dias) no layout do CSV (coluna `day`)."""
+    rng = np.random.default_rng(seed)
+    cardinality = cardinality or auto_cardinality(scale)
+    seg = _expand_cardinality(profile["segments"], cardinality, rng)
+    n_days = max(1, math.ceil(profile["days"] * scale / cardinality))
+    start = profile["end"] - timedelta(days=n_days - 1)
+
+    dims = {c: seg[c].to_numpy() for c in DIMS}
+    freq = seg["freq"].to_numpy()
+    base = {m: (seg[m] * seg["level"]).to_numpy() for m in ("amount", "tx", "merchants")}
+    n_seg = len(seg)
+
+    for b0 in range(0, n_days, block_days):
+        days = [start + timedelta(days=i) for i in range(b0, min(b0 + block_days, n_days))]
+        day_idx = np.repeat(np.arange(len(days)), n_seg)
+        seg_idx = np.tile(np.arange(n_seg), len(days))
+        keep = rng.random(len(seg_idx)) < freq[seg_idx]
+        day_idx, seg_idx = day_idx[keep], seg_idx[keep]
+
+        wd = np.array([d.weekday() for d in days])[day_idx]
+        noise = rng.lognormal(0.0, NOISE_SIGMA, size=len(seg_idx))
+        tx = np.maximum(1, np.rint(base["tx"][seg_idx] * profile["f_tx"][wd] * noise)).astype("int64")
+        merchants = np.maximum(1, np.rint(base["merchants"][seg_idx] * profile["f_tx"][wd] * noise)).astype("int64")
+        amount = np.round(base["amount"][seg_idx] * profile["f_amount"][wd] * noise, 2)
+
+        block = pd.DataFrame({"day": np.array(days, dtype="datetime64[D]")[day_idx]})
+        for c in DIMS:
+            block[c] = dims[c][seg_idx]
+        block["amount_transacted"] = amount
+        block["quantity_transactions"] = tx
+        block["quantity_of_merchants"] = merchants
+        yield block
+
+
+def write_csv(path: str, scale: int = 1, cardinality: int | None = None, seed: int = 0,
+              csv_path: str = CSV_PATH) -> int:
+    """Grava o CSV sintético (em blocos, memória constante). Retorna o nº de linhas."""
+    profile = fit_profile(csv_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    total = 0
+    header = ["day"] + EXPECTED_COLUMNS[1:]
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for i, block in enumerate(generate(profile, scale, cardinality, seed)):
+            block[header].to_csv(f, index=False, header=(i == 0), date_format="%Y-%m-%d")
+            total += len(block)
+    os.replace(tmp, path)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    card = args.cardinality or auto_cardinality(args.scale)
+    out = args.out or f"./.cache/synth/kpi_{args.scale}x_c{card}_s{args.seed}.csv"
+    rows = write_csv(out, args.scale, card, args.seed)
+    print(f"[synth_data] {rows:,} linhas -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,249 @@
-# src/chatbot.py
+import os
+import re
+import argparse
+from collections import OrderedDict
+from datetime import date, timedelta
+import numpy as np
 import pandas as pd
-from openai import OpenAI
+from dotenv import load_dotenv
 from constants import OPENAI_API_KEY, ORGANIZATION_ID
+from llm import DEFAULT_MODEL, get_backend, cached_complete, submit, resolve
+from daily_index import DailyIndex
+from kpi_summary import format_summary, index_comparisons, _fmt_br_number
+import kpi_baseline
+import kpi_bot
 
-API_KEY = OPENAI_API_KEY
-organization_id = ORGANIZATION_ID
-
-class ChatBot(API_KEY, organization_id):
-    def __init__(self):
-        self.API_KEY = API_KEY
-        self.organization_id = organization_id
-    
-
-    def _create_client(self):
-        client = OpenAI(api_key=API_KEY, organization=organization_id)
-        return client
-
-    def get_insights(self, df : pd.DataFrame):
-        client = self._create_client()
-        resp = client.responses.create(
-            model="gpt-4o",
-            input=[
-                {"role": "system", "content": "Você é um assistente técnico e conciso."},
-                {"role": "user", "content": "Teste: me responda em uma frase."}
-            ],
-        )
-        return resp.output_text
+# Perguntas livres sobre um frame kpi_daily. O LLM não recebe as linhas brutas: recebe um
+# digest compacto (resumo do dia, totais diários, maiores variações e z-scores por segmento),
+# calculado em poucas agregações vetoriais, limitado a CHATBOT_DIGEST_TOKENS e guardado por
+# watermark dos dados. As perguntas vão em lotes de CHATBOT_BATCH_SIZE por chamada e os lotes
+# rodam em paralelo (llm.submit). Com LLM_BACKEND=fake tudo roda offline (benchmarks).
+DIGEST_DAYS = 14  # totais diários listados no digest (mais recentes primeiro)
+CHARS_PER_TOKEN = 4  # estimativa de tokens sem tokenizer (PT-BR + números)
+WEEKDAYS = ("seg", "ter", "qua", "qui", "sex", "sáb", "dom")
+NO_ANSWER = "(sem resposta do LLM)"
+DEFAULT_QUESTIONS = [
+    "Quais são os principais destaques do último dia?",
+    "Quais segmentos merecem atenção e por quê?",
+]
+SYSTEM_PROMPT = (
+    "Você é um analista de BI de pagamentos. Responda em PT-BR, de forma curta e objetiva, "
+    "usando apenas os dados do resumo fornecido; se a informação não estiver nele, diga isso."
+)
+_LABEL_RE = re.compile(r"\[P(\d+)\]")
+_NEXT_ITEM_RE = re.compile(r"\n[-*\s]*$")  # início do item seguinte ("\n- **") no fim do trecho
+
+
+def approx_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def watermark(df: pd.DataFrame) -> tuple:
+    # último dia, nº de linhas e TPV total: muda com um dia novo e com a recarga de um dia
+    if df.empty:
+        return (None, 0, 0.0)
+    return (str(df["date"].max()), len(df), round(float(df["amount_transacted"].sum()), 2))
+
+
+def _segment_label(keys: pd.DataFrame) -> pd.Series:
+    return keys.astype(str).agg(" | ".join, axis=1)
+
+
+def _daily_lines(totals: pd.DataFrame) -> list[str]:
+    recent = totals.sort_index(ascending=False).head(DIGEST_DAYS)
+    ticket = recent["tpv"] / recent["tx"].where(recent["tx"] != 0)
+    return [
+        f"- {pd.Timestamp(d):%Y-%m-%d} {WEEKDAYS[pd.Timestamp(d).weekday()]}: TPV R$ {_fmt_br_number(tpv)} | Tx {int(tx):,} | "
+        f"ticket R$ {_fmt_br_number(None if np.isnan(t) else t)}"
+        for d, tpv, tx, t in zip(recent.index, recent["tpv"], recent["tx"], ticket)
+    ]
+
+
+def _mover_lines(sums: pd.DataFrame, day, top_k: int) -> list[str]:
+    """Segmentos com maior variação absoluta de TPV no dia vs W-1 (mesmo segmento)."""
+    days = sums.index.get_level_values("date")
+    tpv = sums["amount_transacted"]
+    today = tpv[days == day].droplevel("date")
+    w_1 = tpv[days == day - timedelta(days=7)].droplevel("date")
+    if today.empty:
+        return []
+    moves = pd.DataFrame({"tpv": today, "w_1": w_1.reindex(today.index).fillna(0.0)})
+    moves["delta"] = moves["tpv"] - moves["w_1"]
+    moves["pct"] = moves["delta"] / moves["w_1"].where(moves["w_1"] != 0) * 100.0
+    moves = moves.loc[moves["delta"].abs().sort_values(ascending=False).index[:top_k]]
+    labels = _segment_label(moves.index.to_frame(index=False))
+    return [
+        f"- {label}: TPV R$ {_fmt_br_number(r.tpv)} (Δ vs W-1 R$ {_fmt_br_number(r.delta)}, "
+        f"{_fmt_br_number(None if np.isnan(r.pct) else r.pct, True)})"
+        for label, r in zip(labels, moves.itertuples())
+    ]
+
+
+def _zscore_lines(sums: pd.DataFrame, day, top_k: int) -> list[str]:
+    """z-scores do dia de todos os segmentos (banda configurada do kpi_bot), mais extremos primeiro."""
+    mode = kpi_baseline.baseline_mode()
+    horizon_days = kpi_baseline.horizons(mode, None, kpi_bot.WINDOW_DAYS)
+    # z_alert infinito: a matriz de kpi_baseline devolve todos os segmentos com z definido
+    scored = kpi_baseline.score_sums(sums, [day], kpi_bot.SEGMENT, kpi_bot.DEFAULT_ALERT_METRICS,
+                                     kpi_bot.ALERT_METRICS, np.inf, mode, horizon_days)
+    if scored.empty:
+        return []
+    z = scored["zscore"].astype(float)
+    scored = scored.loc[z.abs().sort_values(ascending=False).index[:top_k]]
+    labels = _segment_label(scored[kpi_bot.SEGMENT])
+    return [
+        f"- {label} → {kpi_bot.METRIC_LABELS.get(r.metric, r.metric)}: z={r.zscore:.2f} "
+        f"(valor {_fmt_br_number(r.value)}, centro {_fmt_br_number(r.ma)})"
+        for label, r in zip(labels, scored.itertuples())
+    ]
+
+
+def build_digest(df: pd.DataFrame, budget_tokens: int, top_k: int = 10) -> str:
+    """
+    Digest do frame kpi_daily para o prompt: resumo do último dia (format_summary) e, até o
+    orçamento de tokens, totais diários, maiores variações vs W-1 e z-scores por segmento,
+    intercalados por posição para que nenhuma seção fique de fora.
+    """
+    if df.empty:
+        return "(sem dados)"
+    target = pd.Timestamp(df["date"].max()).date()
+    totals = kpi_bot.daily_totals(df)
+    head = format_summary(*index_comparisons(DailyIndex.from_totals(totals), target))
+
+    horizon = max(kpi_baseline.horizons(kpi_baseline.baseline_mode(), None, kpi_bot.WINDOW_DAYS))
+    sums = kpi_bot._window_sums(df, target, kpi_bot.SEGMENT, ["tpv", "avg_ticket"], max(horizon, 7))
+    day = kpi_bot._day_key(df["date"], target)
+    sections = [
+        ("📅 Totais diários", _daily_lines(totals)),
+        ("🔀 Maiores variações de TPV vs W-1 (segmento)", _mover_lines(sums, day, top_k)),
+        ("📐 z-scores do dia por segmento (mais extremos)", _zscore_lines(sums, day, top_k)),
+    ]
+
+    budget = budget_tokens * CHARS_PER_TOKEN - len(head)
+    taken = [[] for _ in sections]
+    full = [False] * len(sections)
+    for i in range(max(len(lines) for _, lines in sections)):
+        for s, (title, lines) in enumerate(sections):
+            if full[s] or i >= len(lines):
+                continue
+            # título + contagem ("— 3 de 10") entram no custo do primeiro item da seção
+            cost = len(lines[i]) + 1 + (len(title) + 16 if i == 0 else 0)
+            if cost > budget:
+                full[s] = True
+                continue
+            taken[s].append(lines[i])
+            budget -= cost
+    parts = [head]
+    for (title, lines), chosen in zip(sections, taken):
+        if chosen:
+            parts.append(f"\n**{title}** — {len(chosen)} de {len(lines)}\n" + "\n".join(chosen))
+    return "\n".join(parts)
+
+
+def _parse_answers(text: str, n: int) -> dict[int, str]:
+    """Respostas por rótulo ([P1]..[Pn]) de uma resposta em lote."""
+    parts = _LABEL_RE.split(text or "")
+    answers = {}
+    for label, body in zip(parts[1::2], parts[2::2]):
+        k = int(label)
+        # "[P1] texto", "**[P1]** texto" ou "- [P1]: texto": tira o marcador do próximo item
+        body = _NEXT_ITEM_RE.sub("", body.lstrip("*: \n")).rstrip()
+        if 1 <= k <= n and body and k not in answers:
+            answers[k] = body
+    return answers
+
+
+class ChatBot:
+    """
+    Perguntas sobre um frame kpi_daily respondidas pelo LLM (llm.get_backend / LLM_BACKEND)
+    a partir do digest compacto de build_digest, em lotes paralelos e com cache de respostas.
+    """
+
+    def __init__(self, backend=None, model: str | None = None, budget_tokens: int | None = None,
+                 batch_size: int | None = None, top_k: int | None = None, cache=None) -> None:
+        load_dotenv()
+        self.backend = backend or get_backend(OPENAI_API_KEY, os.getenv("OPENAI_ORG", ORGANIZATION_ID))
+        self.model = model or os.getenv("LLM_MODEL", DEFAULT_MODEL)
+        self.budget_tokens = int(budget_tokens or os.getenv("CHATBOT_DIGEST_TOKENS", 800))
+        self.batch_size = max(1, int(batch_size or os.getenv("CHATBOT_BATCH_SIZE", 5)))
+        self.top_k = int(top_k or os.getenv("CHATBOT_TOP_K", 10))
+        self.cache = cache  # llm.SummaryCache (padrão: LLM_CACHE_DIR)
+        self._digests: OrderedDict = OrderedDict()
+        self.digest_hits = self.digest_misses = 0
+
+    def digest(self, df: pd.DataFrame, mark: tuple | None = None) -> str:
+        """build_digest com cache por watermark (`mark`, ou watermark(df))."""
+        key = (mark if mark is not None else watermark(df), self.budget_tokens, self.top_k)
+        if key in self._digests:
+            self._digests.move_to_end(key)
+            self.digest_hits += 1
+            return self._digests[key]
+        self.digest_misses += 1
+        text = build_digest(df, self.budget_tokens, self.top_k)
+        self._digests[key] = text
+        if len(self._digests) > int(os.getenv("CHATBOT_DIGEST_CACHE", 8)):
+            self._digests.popitem(last=False)
+        return text
+
+    def _messages(self, digest: str, questions: list[str]) -> list[dict]:
+        asked = "\n".join(f"- [P{k}] {q}" for k, q in enumerate(questions, 1))
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Resumo dos dados (bi.kpi_daily):\n\n{digest}"},
+            {"role": "user", "content": "Responda cada pergunta começando pelo rótulo dela "
+                                        f"([P1], [P2], ...):\n{asked}"},
+        ]
+
+    def ask(self, df: pd.DataFrame, questions: list[str], mark: tuple | None = None) -> list[str]:
+        """Uma resposta por pergunta; lotes de batch_size perguntas por chamada, em paralelo."""
+        if self.backend is None or not questions:
+            return [NO_ANSWER] * len(questions)
+        digest = self.digest(df, mark)
+        batches = [list(range(i, min(i + self.batch_size, len(questions))))
+                   for i in range(0, len(questions), self.batch_size)]
+        futures = [
+            submit(cached_complete, self.backend, self._messages(digest, [questions[j] for j in b]),
+                   self.model, self.cache)
+            for b in batches
+        ]
+        answers = [NO_ANSWER] * len(questions)
+        for b, fut in zip(batches, futures):
+            parsed = _parse_answers(resolve(fut, ""), len(b))
+            for k, j in enumerate(b, 1):
+                answers[j] = parsed.get(k, NO_ANSWER)
+        return answers
+
+    def get_insights(self, df: pd.DataFrame, questions: list[str] | None = None) -> str:
+        """Perguntas e respostas em markdown; sem backend de LLM devolve o próprio digest."""
+        if self.backend is None:
+            return self.digest(df)
+        questions = list(questions or DEFAULT_QUESTIONS)
+        answers = self.ask(df, questions)
+        return "\n\n".join(f"**{q}**\n{a}" for q, a in zip(questions, answers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perguntas sobre os KPIs (digest + LLM).")
+    parser.add_argument("questions", nargs="*", help="perguntas (padrão: destaques e segmentos)")
+    parser.add_argument("--date", type=date.fromisoformat, help="último dia considerado (padrão: último com dados)")
+    parser.add_argument("--tokens", type=int, help="orçamento do digest (padrão: CHATBOT_DIGEST_TOKENS)")
+    parser.add_argument("--digest", action="store_true", help="mostra o digest enviado ao LLM")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from connectors.connectors import SessionConnector
+
+    engine = SessionConnector().session()
+    target = args.date or kpi_bot.get_last_available_date(engine)
+    if target is None:
+        raise SystemExit("[chatbot] ❌ Nenhum dado na base.")
+    df = kpi_bot.load_data(engine, kpi_bot._window_start(target), target)
+    bot = ChatBot(budget_tokens=args.tokens)
+    if args.digest:
+        digest = bot.digest(df)
+        print(f"{digest}\n\n[chatbot] digest: {len(digest)} caracteres (~{approx_tokens(digest)} tokens)\n")
+    print(bot.get_insights(df, args.questions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import text
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+
+# Índice diário agregado: uma linha por dia com TPV/Tx/Avg Ticket e os acumulados desde o
+# início da base. Comparações de um dia viram lookups e as de período (MTD/YTD) a diferença
+# de dois acumulados, sem reler as linhas brutas. Sem pandas: o resumo rápido da CLI
+# (kpi_cli.py summary) só precisa deste módulo, do SQLAlchemy e do NumPy.
+INDEX_TABLE = "bi.kpi_daily_totals"
+# Totais por dia e valor de algumas dimensões (fan-out de relatórios por público)
+BY_TABLE = "bi.kpi_daily_totals_by"
+# Marcas de dias carregados ainda sem refresh do índice (LOAD_REFRESH_STATS=0, carga de
+# arquivos interrompida antes do refresh): enquanto houver marca <= fim do período pedido, os
+# acumulados a partir dela estão desatualizados e a leitura agrega das linhas brutas
+STALE_TABLE = "bi.kpi_daily_totals_stale"
+INDEX_DIMENSIONS = [c.strip() for c in os.getenv("KPI_INDEX_DIMENSIONS", "entity,product").split(",") if c.strip()]
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+  date        date     PRIMARY KEY,
+  tpv         float8   NOT NULL,
+  tx          bigint   NOT NULL,
+  avg_ticket  float8,
+  tpv_cum     numeric  NOT NULL,
+  tx_cum      bigint   NOT NULL
+)
+"""
+
+# Mesmo esquema do stats_store: recalcula a partir de `since`, partindo do último acumulado
+# anterior. Custo proporcional aos dias novos.
+REFRESH_SQL = f"""
+DELETE FROM {INDEX_TABLE} WHERE date >= %(since)s;
+
+INSERT INTO {INDEX_TABLE} (date, tpv, tx, avg_ticket, tpv_cum, tx_cum)
+WITH daily AS (
+  SELECT
+    date,
+    SUM(amount_transacted)     AS tpv,
+    SUM(quantity_transactions) AS tx
+  FROM bi.kpi_daily
+  WHERE date >= %(since)s
+    AND amount_transacted > 0 AND quantity_transactions > 0
+  GROUP BY date
+),
+base AS (
+  SELECT tpv_cum, tx_cum FROM {INDEX_TABLE}
+  WHERE date < %(since)s
+  ORDER BY date DESC LIMIT 1
+)
+SELECT
+  d.date, d.tpv::float8, d.tx, (d.tpv / NULLIF(d.tx, 0))::float8,
+  COALESCE((SELECT tpv_cum FROM base), 0) + SUM(d.tpv) OVER w,
+  COALESCE((SELECT tx_cum FROM base), 0)  + SUM(d.tx) OVER w
+FROM daily d
+WINDOW w AS (ORDER BY d.date ROWS UNBOUNDED PRECEDING);
+"""
+
+BY_DDL = f"""
+CREATE TABLE IF NOT EXISTS {BY_TABLE} (
+  dim    varchar(32)  NOT NULL,
+  value  varchar(64)  NOT NULL,
+  date   date         NOT NULL,
+  tpv    float8       NOT NULL,
+  tx     bigint       NOT NULL,
+  PRIMARY KEY (dim, value, date)
+)
+"""
+
+
+def _by_refresh_sql(dims: list[str]) -> str:
+    # uma passada em bi.kpi_daily para todas as dimensões (GROUPING SETS); só apaga as
+    # linhas dessas dimensões (o backfill de uma dimensão nova não mexe nas demais)
+    in_dims = ", ".join(f"'{c}'" for c in dims)
+    dim = " ".join(f"WHEN GROUPING({c}) = 0 THEN '{c}'" for c in dims)
+    value = " ".join(f"WHEN GROUPING({c}) = 0 THEN CAST({c} AS varchar)" for c in dims)
+    sets = ", ".join(f"(date, {c})" for c in dims)
+    return f"""
+DELETE FROM {BY_TABLE} WHERE date >= %(since)s AND dim IN ({in_dims});
+
+INSERT INTO {BY_TABLE} (dim, value, date, tpv, tx)
+SELECT dim, value, date, tpv, tx FROM (
+  SELECT
+    CASE {dim} END   AS dim,
+    CASE {value} END AS value,
+    date,
+    SUM(amount_transacted)::float8 AS tpv,
+    SUM(quantity_transactions)     AS tx
+  FROM bi.kpi_daily
+  WHERE date >= %(since)s
+    AND amount_transacted > 0 AND quantity_transactions > 0
+  GROUP BY GROUPING SETS ({sets})
+) t
+WHERE value IS NOT NULL;
+"""
+
+
+STALE_DDL = f"""
+CREATE TABLE IF NOT EXISTS {STALE_TABLE} (
+  since      date         NOT NULL,
+  marked_at  timestamptz  NOT NULL DEFAULT now()
+)
+"""
+
+
+# Fallback (índice ausente/desatualizado ou backend embutido): totais por dia agregados no banco
+TOTALS_SQL = """
+    SELECT
+      date,
+      SUM(amount_transacted)     AS tpv,
+      SUM(quantity_transactions) AS tx
+    FROM bi.kpi_daily
+    WHERE date BETWEEN :start AND :end
+      AND amount_transacted > 0 AND quantity_transactions > 0
+    GROUP BY date
+"""
+
+
+def ensure_index_table(cur):
+    cur.execute(DDL)
+    cur.execute(BY_DDL)
+    cur.execute(STALE_DDL)
+
+
+def mark_stale(cur, since: date):
+    """
+    Marca o índice como desatualizado a partir de `since`, na transação que grava as linhas
+    (antes delas ou junto): o refresh que cobrir `since` remove a marca.
+    """
+    cur.execute(STALE_DDL)
+    cur.execute(f"INSERT INTO {STALE_TABLE} (since) VALUES (%s)", (since,))
+
+
+def _dim_first_day_sql(c: str) -> str:
+    # primeiro dia da base com valor na dimensão (mesmo filtro do índice)
+    return f"""
+        SELECT MIN(date) FROM bi.kpi_daily
+        WHERE {c} IS NOT NULL AND amount_transacted > 0 AND quantity_transactions > 0
+    """
+
+
+def _dims_behind(cur) -> dict:
+    """
+    Dimensões de INDEX_DIMENSIONS cujo histórico em BY_TABLE começa depois do primeiro dia
+    da base (ex.: incluída em KPI_INDEX_DIMENSIONS depois da carga): {coluna: primeiro dia}.
+    """
+    behind = {}
+    for c in INDEX_DIMENSIONS:
+        cur.execute(_dim_first_day_sql(c))
+        first = cur.fetchone()[0]
+        if first is None:
+            continue
+        cur.execute(f"SELECT MIN(date) FROM {BY_TABLE} WHERE dim = %s", (c,))
+        have = cur.fetchone()[0]
+        if have is None or have > first:
+            behind[c] = first
+    return behind
+
+
+def refresh_daily_index(cur, since: date):
+    """
+    Atualiza o índice a partir de `since` (inclusive) num cursor DBAPI já aberto,
+    dentro da transação da carga. Dimensões sem o histórico completo em BY_TABLE são
+    recalculadas desde o primeiro dia da base.
+    """
+    ensure_index_table(cur)
+    cur.execute(REFRESH_SQL, {"since": since})
+    if INDEX_DIMENSIONS:
+        behind = _dims_behind(cur)
+        if behind:
+            print(f"[daily_index] backfill de {BY_TABLE}: {', '.join(behind)}")
+            cur.execute(_by_refresh_sql(list(behind)), {"since": min(behind.values())})
+        current = [c for c in INDEX_DIMENSIONS if c not in behind]
+        if current:
+            cur.execute(_by_refresh_sql(current), {"since": since})
+    cur.execute(f"DELETE FROM {STALE_TABLE} WHERE since >= %s", (since,))
+
+
+def index_start(target: date) -> date:
+    """Primeiro dia necessário para as comparações de `target` (YTD do ano anterior)."""
+    return date(target.year - 1, 1, 1)
+
+
+class DailyIndex:
+    """
+    Totais diários num calendário contínuo (dias sem dado = 0) com os acumulados de TPV/Tx:
+    kpi(d) e total(início, fim) são O(1). `since` é o primeiro dia coberto (padrão: o
+    primeiro com dado); antes dele o índice não sabe responder (covers() é False).
+    """
+
+    def __init__(self, dates, tpv, tx, tpv_cum=None, tx_cum=None, since: date | None = None):
+        # date, datetime/Timestamp, datetime64 ou texto ISO (SQLite)
+        days = np.asarray(dates).astype("datetime64[D]").reshape(-1)
+        self.has_data = len(days) > 0
+        self.start = days.min() if self.has_data else np.datetime64("1970-01-01", "D")
+        end = days.max() if self.has_data else self.start
+        n = int((end - self.start).astype(np.int64)) + 1
+        pos = (days - self.start).astype(np.int64)
+        self.tpv, self.tx = np.zeros(n), np.zeros(n, dtype=np.int64)
+        self.present = np.zeros(n, dtype=bool)
+        self.tpv[pos] = np.asarray(tpv, dtype="float64")
+        self.tx[pos] = np.asarray(tx, dtype=np.int64)
+        self.present[pos] = True
+        if tpv_cum is None:
+            self.tpv_cum, self.tx_cum = np.cumsum(self.tpv), np.cumsum(self.tx)
+        else:
+            # acumulados do banco (desde o início da base): propaga sobre os dias sem linha
+            self.tpv_cum, self.tx_cum = np.zeros(n), np.zeros(n, dtype=np.int64)
+            self.tpv_cum[pos] = np.asarray(tpv_cum, dtype="float64")
+            self.tx_cum[pos] = np.asarray(tx_cum, dtype=np.int64)
+            idx = np.maximum.accumulate(np.where(self.present, np.arange(n), 0))
+            self.tpv_cum, self.tx_cum = self.tpv_cum[idx], self.tx_cum[idx]
+        self.since = since or (self.start.astype(object) if self.has_data else None)
+        # acumulado antes do primeiro dia do índice
+        self._tpv_base = self.tpv_cum[0] - self.tpv[0] if n else 0.0
+        self._tx_base = int(self.tx_cum[0] - self.tx[0]) if n else 0
+
+    @classmethod
+    def from_totals(cls, totals, since: date | None = None) -> "DailyIndex":
+        """A partir de totais por dia (índice date, colunas tpv/tx; ex.: kpi_bot.daily_totals)."""
+        return cls(totals.index, totals["tpv"].to_numpy(), totals["tx"].to_numpy(), since=since)
+
+    def covers(self, d: date) -> bool:
+        return self.since is not None and d >= self.since
+
+    def _pos(self, d: date) -> int:
+        return int((np.datetime64(d, "D") - self.start).astype(np.int64))
+
+    def __contains__(self, d: date) -> bool:
+        p = self._pos(d)
+        return 0 <= p < len(self.present) and bool(self.present[p])
+
+    def kpi(self, d: date) -> dict:
+        """KPIs do dia no formato de kpi_bot.kpis_for_day."""
+        if d not in self:
+            return {"date": d, "tpv": 0.0, "tx": 0, "avg_ticket": 0.0}
+        p = self._pos(d)
+        tpv, tx = float(self.tpv[p]), int(self.tx[p])
+        return {"date": d, "tpv": tpv, "tx": tx, "avg_ticket": tpv / tx if tx else 0.0}
+
+    def _cum(self, d: date) -> tuple[float, int]:
+        p = self._pos(d)
+        if p < 0:
+            return float(self._tpv_base), self._tx_base
+        p = min(p, len(self.tpv_cum) - 1)
+        return float(self.tpv_cum[p]), int(self.tx_cum[p])
+
+    def total(self, start: date, end: date) -> dict | None:
+        """
+        TPV/Tx/Avg Ticket somados de start..end (inclusive), pela diferença dos acumulados.
+        None se o período começa antes do que o índice cobre.
+        """
+        if not self.covers(start):
+            return None
+        hi, lo = self._cum(end), self._cum(start - timedelta(days=1))
+        tpv, tx = hi[0] - lo[0], hi[1] - lo[1]
+        return {"start": start, "end": end, "tpv": tpv, "tx": tx, "avg_ticket": tpv / tx if tx else 0.0}
+
+
+def _read_columns(engine, sql, params) -> dict[str, list]:
+    """Resultado de `sql` por coluna ({nome: valores}), sem passar por um DataFrame."""
+    with engine.connect() as con:
+        result = con.execute(sql, params)
+        return dict(zip(result.keys(), map(list, zip(*result.all())))) or {k: [] for k in result.keys()}
+
+
+def _covers(engine, table: str, end: date, where: str = "", params: dict | None = None) -> bool:
+    """
+    True se a tabela existe, já tem `end` e nenhum dia até `end` foi carregado depois do
+    último refresh (marca em STALE_TABLE: backfill ou append anterior ao máximo).
+    """
+    with engine.connect() as con:
+        if not con.execute(text(f"SELECT to_regclass('{table}') IS NOT NULL")).scalar():
+            return False
+        last = con.execute(text(f"SELECT MAX(date) FROM {table} {where}"), params or {}).scalar()
+        if last is None or last < end:
+            return False
+        if not con.execute(text(f"SELECT to_regclass('{STALE_TABLE}') IS NOT NULL")).scalar():
+            return True
+        stale = con.execute(text(f"SELECT MIN(since) FROM {STALE_TABLE}")).scalar()
+    return stale is None or stale > end
+
+
+def load_index(engine, start: date, end: date) -> DailyIndex:
+    """
+    Índice de start..end: lê bi.kpi_daily_totals (uma linha por dia) quando ele cobre `end`;
+    senão (base sem o índice, carga com LOAD_REFRESH_STATS=0 ou backend embutido) agrega os
+    totais por dia no próprio banco. Em ambos os casos só trafegam ~365 linhas por ano.
+    """
+    params = {"start": start, "end": end}
+    if engine.dialect.name == "postgresql" and _covers(engine, INDEX_TABLE, end):
+        cols = _read_columns(engine, text(f"""
+            SELECT date, tpv, tx, tpv_cum::float8 AS tpv_cum, tx_cum
+            FROM {INDEX_TABLE} WHERE date BETWEEN :start AND :end ORDER BY date
+        """), params)
+        return DailyIndex(cols["date"], cols["tpv"], cols["tx"], cols["tpv_cum"], cols["tx_cum"], since=start)
+    cols = _read_columns(engine, text(TOTALS_SQL), params)
+    return DailyIndex(cols["date"], [float(v) for v in cols["tpv"]], cols["tx"], since=start)
+
+
+def _by_covers_start(engine, columns: list[str], start: date) -> bool:
+    """True se o histórico de cada coluna em BY_TABLE começa até `start` (ou no 1º dia dela)."""
+    with engine.connect() as con:
+        for c in columns:
+            have = con.execute(text(f"SELECT MIN(date) FROM {BY_TABLE} WHERE dim = :dim"), {"dim": c}).scalar()
+            if have is None:
+                return False
+            if have > start:
+                first = con.execute(text(_dim_first_day_sql(c))).scalar()
+                if first is None or have > first:
+                    return False
+    return True
+
+
+def load_index_by(engine, columns: list[str], start: date, end: date) -> dict:
+    """
+    Um índice por valor de cada coluna (fan-out de relatórios por público).
+    Lê bi.kpi_daily_totals_by quando todas as colunas estão em KPI_INDEX_DIMENSIONS e o
+    índice cobre `end`; senão agrega no banco (um GROUP BY por coluna, em UNION ALL), o que
+    relê as linhas brutas do período. Uma coluna cujo histórico no índice começa depois de
+    `start` (dimensão incluída após a carga, antes do refresh) também cai na agregação.
+    `columns` precisam ser colunas de bi.kpi_daily já
+    validadas pelo chamador. Retorna {(coluna, str(valor)): DailyIndex}.
+    """
+    params = {"start": start, "end": end, "dims": list(columns)}
+    if (engine.dialect.name == "postgresql" and set(columns) <= set(INDEX_DIMENSIONS)
+            and _covers(engine, BY_TABLE, end, "WHERE dim = ANY(:dims)", params)
+            and _by_covers_start(engine, columns, start)):
+        sql = text(f"""
+            SELECT dim, value, date, tpv, tx FROM {BY_TABLE}
+            WHERE dim = ANY(:dims) AND date BETWEEN :start AND :end
+        """)
+    else:
+        sql = text(" UNION ALL ".join(
+            f"""
+            SELECT '{c}' AS dim, CAST({c} AS varchar) AS value, date,
+                   SUM(amount_transacted) AS tpv, SUM(quantity_transactions) AS tx
+            FROM bi.kpi_daily
+            WHERE date BETWEEN :start AND :end AND {c} IS NOT NULL
+              AND amount_transacted > 0 AND quantity_transactions > 0
+            GROUP BY {c}, date"""
+            for c in columns
+        ))
+    groups: dict = {}
+    with engine.connect() as con:
+        for dim, value, d, tpv, tx in con.execute(sql, params):
+            groups.setdefault((dim, value), []).append((d, float(tpv), tx))
+    return {key: DailyIndex(*zip(*rows), since=start) for key, rows in groups.items()}
+
+
+def rebuild(engine, since: date | None = None):
+    """Reconstrói o índice (todo o histórico por padrão)."""
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            if since is None:
+                cur.execute("SELECT MIN(date) FROM bi.kpi_daily")
+                since = cur.fetchone()[0]
+            if since is not None:
+                refresh_daily_index(cur, since)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return since
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    since = os.getenv("INDEX_SINCE")
+    since = rebuild(SessionConnector().session(), date.fromisoformat(since) if since else None)
+    print(f"OK: {INDEX_TABLE} atualizado a partir de {since}")
@@ -0,0 +1,235 @@
+import os
+import json
+import select
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+from populate_db import NOTIFY_CHANNEL
+from kpi_daemon import _listen, _notified_ranges
+from kpi_bot import (
+    SEGMENT, WINDOW_DAYS, ALERT_METRICS, DEFAULT_ALERT_METRICS, FILTER_COLUMNS,
+    aggregate_window, get_last_available_date, kpis_for_day, comparable_dates, growth,
+    segment_alerts,
+)
+
+API_ENDPOINTS = ("kpis", "comparisons", "alerts")
+
+
+class ResultCache:
+    """LRU de respostas da API, esvaziado quando o watermark de ingestão muda."""
+
+    def __init__(self, maxsize: int | None = None) -> None:
+        self.maxsize = int(maxsize or os.getenv("KPI_API_CACHE_SIZE", 256))
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.watermark: date | None = None
+        self._generation = 0  # incrementa a cada invalidação
+
+    def get_or_compute(self, key: tuple, fn):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            generation = self._generation
+        value = fn()
+        with self._lock:
+            # resultado calculado antes de uma invalidação não entra no cache
+            if generation == self._generation:
+                self._data[key] = value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, watermark: date | None, reason: str):
+        with self._lock:
+            dropped = len(self._data)
+            self._data.clear()
+            self._generation += 1
+            self.watermark = watermark
+        print(f"[kpi_api] cache invalidado ({reason}); watermark={watermark}, {dropped} entrada(s) removida(s)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _csv_param(params: dict, name: str) -> list[str]:
+    return [v.strip() for v in params.get(name, "").split(",") if v.strip()]
+
+
+def parse_query(params: dict, default_date: date | None) -> dict:
+    """Valida os parâmetros da URL: date, window, metrics, segment e filtros por dimensão."""
+    unknown = set(params) - {"date", "window", "metrics", "segment"} - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"parâmetro(s) desconhecido(s): {sorted(unknown)}")
+    if "date" in params:
+        target = date.fromisoformat(params["date"])
+    elif default_date is not None:
+        target = default_date
+    else:
+        raise ValueError("sem dados na base; informe date=AAAA-MM-DD")
+
+    window = int(params.get("window", WINDOW_DAYS))
+    if not 2 <= window <= 366:
+        raise ValueError("window deve estar entre 2 e 366 dias")
+    metrics = _csv_param(params, "metrics") or list(DEFAULT_ALERT_METRICS)
+    segment = _csv_param(params, "segment") or list(SEGMENT)
+    if set(metrics) - set(ALERT_METRICS):
+        raise ValueError(f"métrica inválida (use {list(ALERT_METRICS)})")
+    if set(segment) - set(FILTER_COLUMNS):
+        raise ValueError(f"segmento inválido (use {FILTER_COLUMNS})")
+
+    filters = {}
+    for col in FILTER_COLUMNS:
+        values = _csv_param(params, col)
+        if values:
+            filters[col] = sorted(int(v) for v in values) if col == "installments" else sorted(values)
+    return {"target": target, "window": window, "metrics": metrics,
+            "segment": segment, "filters": filters}
+
+
+class KpiQueryService:
+    """KPIs, comparações e alertas de qualquer dia/filtro, com ResultCache na frente do Postgres."""
+
+    def __init__(self, engine, cache: ResultCache | None = None) -> None:
+        self.engine = engine
+        self.cache = cache or ResultCache()
+        self.cache.invalidate(get_last_available_date(engine, strict_positive=True), "início")
+
+    def _frame(self, start: date, end: date, q: dict) -> pd.DataFrame:
+        return aggregate_window(self.engine, start, end, q["segment"], filters=q["filters"])
+
+    def kpis(self, q: dict) -> dict:
+        return kpis_for_day(self._frame(q["target"], q["target"], q), q["target"])
+
+    def comparisons(self, q: dict) -> dict:
+        target = q["target"]
+        comps = comparable_dates(target)
+        df = self._frame(min(comps.values()), target, q)
+        today = kpis_for_day(df, target)
+        out = {"date": target, "today": today}
+        for name, d in comps.items():
+            other = kpis_for_day(df, d)
+            out[name] = {
+                "kpis": other,
+                "growth": {k: dict(zip(("delta", "pct"), growth(today[k], other[k])))
+                           for k in ("tpv", "tx", "avg_ticket")},
+            }
+        return out
+
+    def alerts(self, q: dict) -> dict:
+        target = q["target"]
+        df = self._frame(target - timedelta(days=q["window"]), target, q)
+        if df.empty:
+            alerts = pd.DataFrame()
+        else:
+            alerts = segment_alerts(df, target, q["metrics"], q["segment"], window_days=q["window"])
+        records = alerts.astype(object).where(alerts.notna(), None).to_dict("records")
+        return {"date": target, "window": q["window"], "alerts": records}
+
+    def query(self, endpoint: str, params: dict) -> dict:
+        q = parse_query(params, self.cache.watermark)
+        filters = tuple((col, tuple(values)) for col, values in q["filters"].items())
+        key = (endpoint, q["target"], filters, q["window"], tuple(q["metrics"]), tuple(q["segment"]))
+        return self.cache.get_or_compute(key, lambda: getattr(self, endpoint)(q))
+
+    def health(self) -> dict:
+        return {"watermark": self.cache.watermark, "cache": self.cache.stats()}
+
+    def watch(self, poll_s: float, channel: str | None = None):
+        """
+        Invalida o cache a cada NOTIFY do populate_db (qualquer recarga, inclusive de dias
+        antigos) e, a cada `poll_s` segundos, se o watermark MAX(date) mudou.
+        Roda numa thread daemon.
+        """
+        conn = None
+        if os.getenv("KPI_API_LISTEN", "1") == "1":
+            _, conn = _listen(self.engine, channel or NOTIFY_CHANNEL)
+        while True:
+            if conn is not None and select.select([conn], [], [], poll_s)[0]:
+                ranges = _notified_ranges(conn)
+                if ranges:
+                    watermark = get_last_available_date(self.engine, strict_positive=True)
+                    self.cache.invalidate(watermark, f"carga {ranges[0][0]}..{ranges[-1][1]}")
+                continue
+            if conn is None:
+                threading.Event().wait(poll_s)
+            watermark = get_last_available_date(self.engine, strict_positive=True)
+            if watermark != self.cache.watermark:
+                self.cache.invalidate(watermark, "watermark mudou")
+
+
+def _json_default(o):
+    if isinstance(o, (date, pd.Timestamp)):
+        return o.isoformat()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"tipo não serializável: {type(o).__name__}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        service: KpiQueryService = self.server.service
+        try:
+            if name == "health":
+                body = service.health()
+            elif name in API_ENDPOINTS:
+                body = service.query(name, params)
+            else:
+                return self._send(404, {"error": f"rota desconhecida: /{name}",
+                                        "rotas": [f"/{e}" for e in API_ENDPOINTS] + ["/health"]})
+        except ValueError as exc:
+            return self._send(400, {"error": str(exc)})
+        self._send(200, body)
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body, default=_json_default, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        print(f"[kpi_api] {self.address_string()} {fmt % args}")
+
+
+def serve(host: str | None = None, port: int | None = None):
+    """
+    Sobe a API JSON local (GET /kpis, /comparisons, /alerts, /health).
+    Ex.: /alerts?date=2025-03-31&entity=PJ&product=pix,tap&window=14&metrics=tpv
+    """
+    load_dotenv()
+    host = host or os.getenv("KPI_API_HOST", "127.0.0.1")
+    port = int(port or os.getenv("KPI_API_PORT", 8765))
+    service = KpiQueryService(SessionConnector().session())
+    poll_s = float(os.getenv("KPI_API_WATERMARK_POLL_S", 10))
+    threading.Thread(target=service.watch, args=(poll_s,), daemon=True, name="kpi_api-watch").start()
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = service
+    print(f"[kpi_api] ouvindo em http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SessionConnector.dispose_all()
+
+
+if __name__ == "__main__":
+    serve()
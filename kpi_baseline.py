@@ -0,0 +1,189 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+# Bandas de alerta calculadas sobre uma matriz densa segmento × dia (NumPy), com os dias sem
+# linha mascarados como NaN. Todos os segmentos (e dias-alvo) são pontuados de uma vez:
+#   - mean:     média/desvio dos últimos N dias (o critério original do segment_alerts);
+#   - seasonal: mediana/MAD do mesmo dia da semana nas últimas N semanas (robusto a dias
+#               atípicos e à sazonalidade semanal).
+# Com vários horizontes (KPI_BASELINE_HORIZONS), vale o z menos extremo: o alerta só dispara
+# se o dia estiver fora da banda em todos eles.
+BASELINE_MODES = ("mean", "seasonal")
+MAD_SCALE = 1.4826  # MAD -> desvio padrão sob normalidade
+DEFAULT_WEEKS = 8
+MAX_BLOCK = 8_000_000  # elementos float64 (~64 MB) por bloco de cálculo da banda
+
+
+def baseline_mode(mode: str | None = None) -> str:
+    mode = (mode or os.getenv("KPI_BASELINE", "mean")).lower()
+    if mode not in BASELINE_MODES:
+        raise ValueError(f"KPI_BASELINE inválido: {mode} (use um de {BASELINE_MODES})")
+    return mode
+
+
+def band_label(mode: str, z_alert: float) -> str:
+    """Descrição da banda de alerta (títulos do texto e do PDF), ex.: "abaixo da banda histórica −2σ"."""
+    sigma = f"{z_alert:g}".replace("-", "−").replace(".", ",") + "σ"
+    if mode == "seasonal":
+        return f"abaixo da banda do mesmo dia da semana: mediana {sigma} robusto"
+    return f"abaixo da banda histórica {sigma}"
+
+
+def horizons(mode: str, window_days: int | None = None, default_window: int = 28) -> list[int]:
+    """
+    Horizontes (em dias) da banda: `window_days` explícito, env KPI_BASELINE_HORIZONS
+    (ex.: "28,91") ou o padrão do modo (mean: janela de alerta; seasonal: KPI_BASELINE_WEEKS
+    semanas, padrão 8).
+    """
+    if window_days:
+        return [int(window_days)]
+    env = os.getenv("KPI_BASELINE_HORIZONS", "")
+    if env.strip():
+        out = sorted({int(h) for h in env.split(",") if h.strip()})
+    elif mode == "seasonal":
+        out = [7 * int(os.getenv("KPI_BASELINE_WEEKS", DEFAULT_WEEKS))]
+    else:
+        out = [default_window]
+    if mode == "seasonal" and min(out) < 7:
+        raise ValueError("horizonte sazonal deve ter ao menos 7 dias (uma semana)")
+    return out
+
+
+def lookback_days(default_window: int = 28) -> int:
+    """Dias de histórico que a banda configurada precisa antes do dia-alvo."""
+    return max(horizons(baseline_mode(), default_window=default_window))
+
+
+def min_obs(mode: str) -> int:
+    # mean: desvio amostral precisa de 2 pontos; seasonal: mediana/MAD de pelo menos 3 semanas
+    return 2 if mode == "mean" else int(os.getenv("KPI_BASELINE_MIN_OBS", 3))
+
+
+def day_matrix(sums: pd.DataFrame, segment: list[str], until=None):
+    """
+    Somas por dia/segmento (índice date + segment) -> (chaves dos segmentos, calendário
+    contínuo datetime64[D], {coluna: matriz segmento × dia}), com NaN nos dias sem linha.
+    `until` estende o calendário até um dia-alvo sem dados.
+    """
+    idx = sums.index
+    days = pd.to_datetime(idx.get_level_values("date")).values.astype("datetime64[D]")
+    start, end = days.min(), days.max()
+    if until is not None:
+        end = max(end, np.datetime64(pd.Timestamp(until).date(), "D"))
+    calendar = np.arange(start, end + 1)
+    col = (days - start).astype(np.int64)
+    if len(segment) > 1:
+        # fatoriza pelos códigos inteiros dos níveis (factorize no MultiIndex monta tuplas)
+        seg_index = idx.droplevel("date")
+        codes = [np.asarray(c, dtype=np.int64) + 1 for c in seg_index.codes]  # NaN: -1 -> 0
+        flat = np.ravel_multi_index(codes, [len(lv) + 1 for lv in seg_index.levels])
+        _, first, row = np.unique(flat, return_index=True, return_inverse=True)
+        keys = seg_index[first].to_frame(index=False)
+    else:
+        row, uniques = pd.factorize(idx.get_level_values(segment[0]), use_na_sentinel=False)
+        keys = pd.DataFrame({segment[0]: uniques})
+    mats = {}
+    for c in sums.columns:
+        m = np.full((len(keys), len(calendar)), np.nan)
+        m[row, col] = sums[c].to_numpy(dtype="float64")
+        mats[c] = m
+    return keys, calendar, mats
+
+
+def metric_matrices(mats: dict, metrics: list[str], metric_defs: dict) -> tuple[dict, dict]:
+    """
+    Matrizes por métrica: (histórico, valor do dia). Como em kpi_bot._metric_values, nas
+    razões o denominador 0 vira NaN no histórico e 0.0 no dia (se houve linha no dia).
+    """
+    hist, today = {}, {}
+    for m in metrics:
+        num, den = metric_defs[m]
+        if den is None:
+            hist[m] = today[m] = mats[num]
+        else:
+            d = mats[den]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = mats[num] / np.where(d != 0, d, np.nan)
+            hist[m] = ratio
+            today[m] = np.where(np.isnan(d), np.nan, np.nan_to_num(ratio, nan=0.0))
+    return hist, today
+
+
+def band(values: np.ndarray, t_pos: np.ndarray, mode: str, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Centro e escala da banda para cada segmento × dia-alvo (posições `t_pos` no calendário),
+    numa única operação sobre o bloco segmento × alvo × defasagem.
+    """
+    lags = np.arange(1, horizon + 1) if mode == "mean" else np.arange(7, horizon + 1, 7)
+    center = np.full((values.shape[0], len(t_pos)), np.nan)
+    scale = np.full_like(center, np.nan)
+    # alvos em blocos: o bloco segmento × alvo × defasagem fica em ~MAX_BLOCK elementos
+    step = max(1, MAX_BLOCK // max(1, values.shape[0] * len(lags)))
+    for i in range(0, len(t_pos), step):
+        cols = t_pos[i:i + step, None] - lags[None, :]  # alvo × defasagem
+        hist = np.where(cols[None] >= 0, values[:, np.clip(cols, 0, None)], np.nan)
+        n = (~np.isnan(hist)).sum(axis=2)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # fatias só com NaN
+            if mode == "mean":
+                c = np.nanmean(hist, axis=2)
+                s = np.nanstd(hist, axis=2, ddof=1)
+            else:
+                c = np.nanmedian(hist, axis=2)
+                s = MAD_SCALE * np.nanmedian(np.abs(hist - c[..., None]), axis=2)
+        s[n < min_obs(mode)] = np.nan
+        center[:, i:i + step], scale[:, i:i + step] = c, s
+    return center, scale
+
+
+def score_sums(sums: pd.DataFrame, targets: list, segment: list[str], metrics: list[str],
+               metric_defs: dict, z_alert: float, mode: str = "seasonal",
+               horizon_days: list[int] | None = None) -> pd.DataFrame:
+    """
+    Alertas (z < z_alert) de todos os segmentos com linha em cada dia-alvo. Colunas:
+    target + segment + metric, value, ma, sd, zscore (ma/sd = centro/escala da banda:
+    média/desvio ou mediana/MAD×1,4826, do horizonte que decidiu o z).
+    """
+    cols = ["target"] + segment + ["metric", "value", "ma", "sd", "zscore"]
+    if sums.empty or not targets:
+        return pd.DataFrame(columns=cols)
+    horizon_days = horizon_days or horizons(mode)
+    keys, calendar, mats = day_matrix(sums, segment, until=max(targets))
+    hist_vals, today_vals = metric_matrices(mats, metrics, metric_defs)
+    t_days = np.array([np.datetime64(pd.Timestamp(t).date(), "D") for t in targets])
+    t_pos = (t_days - calendar[0]).astype(np.int64)
+    in_range = t_pos >= 0
+
+    frames = []
+    for metric in metrics:
+        value = np.full((len(keys), len(targets)), np.nan)
+        value[:, in_range] = today_vals[metric][:, t_pos[in_range]]
+        best_z = best_ma = best_sd = None
+        for h in horizon_days:
+            center, scale = band(hist_vals[metric], np.clip(t_pos, 0, None), mode, h)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = (value - center) / np.where(scale != 0, scale, np.nan)
+            if best_z is None:
+                best_z, best_ma, best_sd = z, center, scale
+            else:
+                # horizonte com o z menos extremo (NaN não decide)
+                take = np.isnan(best_z) | (~np.isnan(z) & (z > best_z))
+                best_z = np.where(take, z, best_z)
+                best_ma = np.where(take, center, best_ma)
+                best_sd = np.where(take, scale, best_sd)
+        seg_i, t_i = np.nonzero(~np.isnan(value) & (best_z < z_alert))
+        if not len(seg_i):
+            continue
+        part = keys.iloc[seg_i].reset_index(drop=True)
+        part.insert(0, "target", [targets[i] for i in t_i])
+        part["metric"] = metric
+        part["value"] = value[seg_i, t_i]
+        part["ma"] = best_ma[seg_i, t_i]
+        part["sd"] = best_sd[seg_i, t_i]
+        part["zscore"] = best_z[seg_i, t_i]
+        frames.append(part)
+    if not frames:
+        return pd.DataFrame(columns=cols)
+    return pd.concat(frames, ignore_index=True)[cols]
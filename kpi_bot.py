@@ -1,78 +1,60 @@
 import os
-from datetime import date, timedelta, datetime, timezone
+import re
+import time
+import argparse
+from datetime import date, timedelta
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from dotenv import load_dotenv
-from connectors.connectors import SessionConnector
+from connectors.connectors import SessionConnector, stream_query
 from constants import OPENAI_API_KEY, ORGANIZATION_ID
+from stats_store import STATS_SEGMENT, segment_alerts_stats
+from daily_index import DailyIndex, load_index, load_index_by, index_start
+from kpi_summary import (  # resumo leve (sem pandas), reexportado para kpi_api/kpi_daemon
+    _today_br, growth, comparable_dates, get_last_available_date, format_summary,
+    build_comparisons, index_comparisons,
+)
+from kpi_schema import compact_frame
+from kpi_cache import load_range_cached, cache_offline, last_cached_date
+from kpi_metrics import timed, span, profiled
+import kpi_baseline
+
+# IA (opcional; backend plugável em llm.py)
+from llm import DEFAULT_MODEL, get_backend, cached_complete, submit, resolver
+
+# PDF (estilos e templates montados uma vez em report_renderer)
+from report_renderer import get_renderer, render_many
 
-# IA (opcional)
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
-
-from sqlalchemy import text as _text
-
-# PDF
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.platypus.flowables import HRFlowable
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-
-THEME_PRIMARY   = colors.HexColor("#5B6CE1")  # azul
-THEME_SUCCESS   = colors.HexColor("#16A34A")  # verde
-THEME_DANGER    = colors.HexColor("#DC2626")  # vermelho
-THEME_TEXT      = colors.HexColor("#1F2937")  # cinza-900
-THEME_MUTED     = colors.HexColor("#6B7280")  # cinza-500
-THEME_BG_CARD   = colors.HexColor("#F3F4F6")  # cinza-100
-
-BRA_TZ = timezone(timedelta(hours=-3))  # America/Sao_Paulo (fixo)
 WINDOW_DAYS = 28
 Z_ALERT = -2.0  # alerta quando zscore < -2
 SEGMENT = ["entity", "product", "payment_method"]  # granularidade de alerta
 REPORT_DIR = "./reports"
-
-
-def _fmt_money_br(x):
-    return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-def _fmt_int_br(x):
-    return f"{int(x):,}".replace(",", ".")
-
-def _today_br() -> date:
-    return datetime.now(BRA_TZ).date()
+# Métricas de alerta: nome -> (numerador, denominador ou None) sobre as colunas brutas
+ALERT_METRICS = {
+    "tpv":        ("amount_transacted", None),
+    "tx":         ("quantity_transactions", None),
+    "merchants":  ("quantity_of_merchants", None),
+    "avg_ticket": ("amount_transacted", "quantity_transactions"),
+}
+METRIC_LABELS = {"tpv": "TPV", "tx": "Tx", "merchants": "Lojistas", "avg_ticket": "Avg Ticket"}
+DEFAULT_ALERT_METRICS = ["tpv", "avg_ticket"]
+# Dimensões de bi.kpi_daily aceitas como filtro (aggregate_window, kpi_api)
+FILTER_COLUMNS = ["entity", "product", "price_tier", "anticipation_method", "payment_method", "installments"]
+KPI_COMPUTE_MODES = ("pandas", "sql", "stats")  # pandas (linhas brutas), Postgres ou store de estatísticas
 
 
 def _ensure_dirs():
     os.makedirs(REPORT_DIR, exist_ok=True)
 
 
-def _fmt_compact_money_br(x: float) -> str:
-    """R$ 243,1 M etc."""
-    absx = abs(x)
-    if absx >= 1_000_000_000:
-        return f"R$ {x/1_000_000_000:,.1f} B".replace(",", "X").replace(".", ",").replace("X", ".")
-    if absx >= 1_000_000:
-        return f"R$ {x/1_000_000:,.1f} M".replace(",", "X").replace(".", ",").replace("X", ".")
-    if absx >= 1_000:
-        return f"R$ {x/1_000:,.1f} k".replace(",", "X").replace(".", ",").replace("X", ".")
-    return _fmt_money_br(x)
-
-def _auto_font(value_str: str) -> int:
-    """Diminui fonte conforme o comprimento do texto."""
-    n = len(value_str)
-    if n <= 8:   return 20
-    if n <= 10:  return 18
-    if n <= 12:  return 16
-    if n <= 16:  return 14
-    return 12
-
+def _day_key(values, d: date):
+    """Converte `d` para o tipo da coluna/índice de datas (date, ou Timestamp no modo compacto)."""
+    return pd.Timestamp(d) if pd.api.types.is_datetime64_any_dtype(values) else d
 
 
+@timed()
 def kpis_for_day(df: pd.DataFrame, d: date) -> dict:
-    day = df[df["date"] == d]
+    day = df[df["date"] == _day_key(df["date"], d)]
     if day.empty:
         return {"date": d, "tpv": 0.0, "tx": 0, "avg_ticket": 0.0}
     tpv = day["amount_transacted"].sum()
@@ -81,39 +63,48 @@ def kpis_for_day(df: pd.DataFrame, d: date) -> dict:
     return {"date": d, "tpv": float(tpv), "tx": int(tx), "avg_ticket": float(avg_ticket)}
 
 
-def growth(a: float, b: float) -> tuple[float, float]:
-    delta = a - b
-    pct = (delta / b * 100.0) if b and b != 0 else None
-    return delta, (round(pct, 2) if pct is not None else None)
-
-
-def comparable_dates(target: date) -> dict:
-    return {
-        "d_1": target - timedelta(days=1),
-        "w_1": target - timedelta(days=7),
-        "m_1": target - timedelta(days=30),
-    }
-
-
-
-def get_last_available_date(engine, strict_positive: bool = True) -> date | None:
+@timed()
+def kpis_for_days_sql(engine, days: list[date], strict_positive: bool = True) -> dict:
     """
-    Retorna o MAX(date) da base (opcionalmente apenas com TPV/Tx > 0).
+    Versão SQL de kpis_for_day: totais diários calculados no banco (GROUP BY date)
+    para vários dias de uma vez. Retorna {date: kpi_dict} no mesmo formato de kpis_for_day.
+    SQL padrão (IN expandido, CAST): roda no Postgres, no DuckDB e no SQLite.
     """
     where_positive = "AND amount_transacted > 0 AND quantity_transactions > 0" if strict_positive else ""
-    sql = _text(f"""
-        SELECT MAX(date) AS max_date
+    sql = text(f"""
+        SELECT
+          date,
+          CAST(SUM(amount_transacted) AS DOUBLE PRECISION) AS tpv,
+          SUM(quantity_transactions)                       AS tx
         FROM bi.kpi_daily
-        WHERE 1=1 {where_positive}
-    """)
+        WHERE date IN :days
+          {where_positive}
+        GROUP BY date
+    """).bindparams(bindparam("days", expanding=True))
     with engine.connect() as con:
-        row = con.execute(sql).mappings().first()
-    return row["max_date"] if row and row["max_date"] else None
+        rows = con.execute(sql, {"days": list(days)}).mappings().all()
+    # SQLite (KPI_BACKEND=sqlite) guarda a data como texto ISO
+    found = {date.fromisoformat(r["date"]) if isinstance(r["date"], str) else r["date"]: r for r in rows}
+
+    out = {}
+    for d in days:
+        r = found.get(d)
+        if r is None:
+            out[d] = {"date": d, "tpv": 0.0, "tx": 0, "avg_ticket": 0.0}
+            continue
+        tpv, tx = float(r["tpv"] or 0.0), int(r["tx"] or 0)
+        out[d] = {"date": d, "tpv": tpv, "tx": tx, "avg_ticket": tpv / tx if tx else 0.0}
+    return out
 
 
-def load_data(engine, start: date, end: date, strict_positive: bool = True) -> pd.DataFrame:
+def _load_sql(strict_positive: bool, filters: dict | None = None):
+    """SELECT das linhas brutas do período; `filters` (coluna -> valores) vira `col = ANY(:f_col)`."""
     where_positive = "AND amount_transacted > 0 AND quantity_transactions > 0" if strict_positive else ""
-    sql = text(f"""
+    for col in filters or {}:
+        if col not in FILTER_COLUMNS:
+            raise ValueError(f"filtro inválido: {col} (use um de {FILTER_COLUMNS})")
+        where_positive += f"\n          AND {col} = ANY(:f_{col})"
+    return text(f"""
         SELECT
           date,
           entity,
@@ -129,80 +120,477 @@ def load_data(engine, start: date, end: date, strict_positive: bool = True) -> p
         WHERE date BETWEEN :start AND :end
           {where_positive}
     """)
-    with engine.connect() as con:
-        df = pd.read_sql(sql, con, params={"start": start, "end": end}, parse_dates=["date"])
 
-    # normalização
-    if not df.empty:
+
+def _normalize_loaded(df: pd.DataFrame, compact: bool) -> pd.DataFrame:
+    if df.empty:
+        return df
+    if not compact:
         df["date"] = df["date"].dt.date
-        df["amount_transacted"]   = pd.to_numeric(df["amount_transacted"], errors="coerce").fillna(0.0)
-        df["quantity_transactions"] = pd.to_numeric(df["quantity_transactions"], errors="coerce").fillna(0).astype(int)
-        df["quantity_of_merchants"] = pd.to_numeric(df["quantity_of_merchants"], errors="coerce").fillna(0).astype(int)
-        df["installments"] = pd.to_numeric(df["installments"], errors="coerce").fillna(0).astype(int)
+    df["amount_transacted"]   = pd.to_numeric(df["amount_transacted"], errors="coerce").fillna(0.0)
+    df["quantity_transactions"] = pd.to_numeric(df["quantity_transactions"], errors="coerce").fillna(0).astype(int)
+    df["quantity_of_merchants"] = pd.to_numeric(df["quantity_of_merchants"], errors="coerce").fillna(0).astype(int)
+    df["installments"] = pd.to_numeric(df["installments"], errors="coerce").fillna(0).astype(int)
+    return compact_frame(df) if compact else df
+
+
+@timed()
+def load_data(engine, start: date, end: date, strict_positive: bool = True,
+              compact: bool | None = None, chunksize: int | None = None,
+              cache: bool | None = None) -> pd.DataFrame:
+    """
+    Linhas brutas de bi.kpi_daily no período. Com compact (ou env KPI_COMPACT=1) devolve o
+    esquema compacto de kpi_schema.compact_frame (categorias, datetime64, int32).
+    Com chunksize (ou env KPI_LOAD_CHUNKSIZE), lê via cursor server-side e normaliza bloco a
+    bloco, evitando manter o resultado bruto do driver inteiro em memória.
+    Com cache (ou env KPI_CACHE=1), lê do cache local por dia (kpi_cache) e só busca no
+    Postgres os dias ausentes ou invalidados.
+    """
+    if compact is None:
+        compact = os.getenv("KPI_COMPACT", "0") == "1"
+    if chunksize is None and os.getenv("KPI_LOAD_CHUNKSIZE"):
+        chunksize = int(os.getenv("KPI_LOAD_CHUNKSIZE"))
+    if cache is None:
+        cache = os.getenv("KPI_CACHE", "0") == "1"
+    sql = _load_sql(strict_positive)
+    params = {"start": start, "end": end}
+
+    if cache:
+        df = load_range_cached(engine, start, end)
+        if strict_positive:
+            df = df[(df["amount_transacted"] > 0) & (df["quantity_transactions"] > 0)]
+        df = _normalize_loaded(df.reset_index(drop=True), compact)
+    elif chunksize:
+        chunks = [
+            _normalize_loaded(chunk, compact)
+            for chunk in stream_query(engine, sql, params, chunksize, parse_dates=["date"])
+        ]
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    else:
+        with engine.connect() as con:
+            df = _normalize_loaded(pd.read_sql(sql, con, params=params, parse_dates=["date"]), compact)
 
     print(f"[load_data] período={start}..{end} rows={len(df)} (strict_positive={strict_positive})")
     return df
 
-def segment_alerts(df: pd.DataFrame, target: date) -> pd.DataFrame:
-    grp_cols = ["date"] + SEGMENT
-    daily = (
-        df.groupby(grp_cols, as_index=False)[["amount_transacted", "quantity_transactions"]]
-        .sum()
-        .rename(columns={"amount_transacted": "tpv", "quantity_transactions": "tx"})
-    )
-    daily["avg_ticket"] = daily.apply(lambda r: (r["tpv"] / r["tx"]) if r["tx"] else 0.0, axis=1)
-    hist = daily[(daily["date"] < target) & (daily["date"] >= (target - timedelta(days=WINDOW_DAYS)))]
-    today = daily[daily["date"] == target].copy()
-    if today.empty:
-        return pd.DataFrame(columns=SEGMENT + ["metric", "value", "ma", "sd", "zscore"])
-
-    def _z(dfh: pd.DataFrame, metric: str):
-        agg = dfh.groupby(SEGMENT)[metric].agg(["mean", "std"]).reset_index()
-        base = today[SEGMENT + [metric]].merge(agg, on=SEGMENT, how="left")
-        base["zscore"] = (base[metric] - base["mean"]) / base["std"].replace({0: pd.NA})
-        base["metric"] = metric
-        base = base.rename(columns={metric: "value", "mean": "ma", "std": "sd"})
-        return base[SEGMENT + ["metric", "value", "ma", "sd", "zscore"]]
-
-    z_tpv = _z(hist, "tpv")
-    z_avg = _z(hist.assign(avg_ticket=hist["tpv"] / hist["tx"].replace({0: pd.NA})), "avg_ticket")
-
-    alerts = pd.concat([z_tpv, z_avg], ignore_index=True)
-    alerts = alerts[(alerts["zscore"].notna()) & (alerts["zscore"] < Z_ALERT)]
+
+@timed()
+def aggregate_window(engine, start: date, end: date, segment: list[str] | None = None,
+                     strict_positive: bool = True, chunksize: int = 50_000,
+                     filters: dict | None = None) -> pd.DataFrame:
+    """
+    Somas por dia/segmento no período, agregadas incrementalmente sobre blocos lidos via
+    cursor server-side: só as somas parciais ficam em memória. O resultado tem as colunas
+    de load_data usadas por kpis_for_day/segment_alerts (somas são reagregáveis).
+    `filters` (coluna de FILTER_COLUMNS -> lista de valores) restringe as linhas no Postgres.
+    """
+    segment = list(segment or SEGMENT)
+    keys = ["date"] + segment
+    vals = ["amount_transacted", "quantity_transactions", "quantity_of_merchants"]
+    partial = None
+    params = {"start": start, "end": end}
+    params.update({f"f_{col}": list(values) for col, values in (filters or {}).items()})
+    for chunk in stream_query(engine, _load_sql(strict_positive, filters), params,
+                              chunksize, parse_dates=["date"]):
+        chunk = _normalize_loaded(chunk, compact=False)
+        sums = chunk.groupby(keys, sort=False)[vals].sum()
+        partial = sums if partial is None else partial.add(sums, fill_value=0)
+    if partial is None:
+        return pd.DataFrame(columns=keys + vals)
+    return partial.astype({"quantity_transactions": "int64", "quantity_of_merchants": "int64"}).reset_index()
+
+
+def _metric_values(sums: pd.DataFrame, metrics: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Métricas (colunas) a partir das somas por dia/segmento, sem callbacks por linha.
+    Retorna (valores para o histórico, valores para o dia-alvo): nas razões, denominador 0
+    vira NaN no histórico (fica fora da média) e 0.0 no dia-alvo.
+    """
+    hist, today = {}, {}
+    for m in metrics:
+        num, den = ALERT_METRICS[m]
+        if den is None:
+            hist[m] = today[m] = sums[num].astype("float64")
+        else:
+            ratio = sums[num] / sums[den].where(sums[den] != 0)
+            hist[m], today[m] = ratio, ratio.fillna(0.0)
+    return pd.DataFrame(hist), pd.DataFrame(today)
+
+
+@timed()
+def segment_alerts(df: pd.DataFrame, target: date, metrics: list[str] | None = None,
+                   segment: list[str] | None = None, window_days: int | None = None,
+                   baseline: str | None = None) -> pd.DataFrame:
+    """
+    z-score do dia-alvo contra a média/desvio dos WINDOW_DAYS dias anteriores (ou
+    `window_days`), para todas as métricas e segmentos num único groupby. `metrics` são
+    chaves de ALERT_METRICS (padrão: DEFAULT_ALERT_METRICS) e `segment` as colunas do
+    segmento (padrão: SEGMENT). `baseline` (ou env KPI_BASELINE) = "seasonal" troca a banda
+    por mediana/MAD do mesmo dia da semana (kpi_baseline); aí `window_days` é o horizonte.
+    """
+    metrics = list(metrics or DEFAULT_ALERT_METRICS)
+    segment = list(segment or SEGMENT)
+    cols = segment + ["metric", "value", "ma", "sd", "zscore"]
+    mode = kpi_baseline.baseline_mode(baseline)
+    horizon_days = kpi_baseline.horizons(mode, window_days, WINDOW_DAYS)
+
+    day = _day_key(df["date"], target)
+    sums = _window_sums(df, target, segment, metrics, max(horizon_days))
+    alerts = _score_sums(sums, day, segment, metrics, mode, horizon_days)
+    if alerts is None:
+        alerts = pd.DataFrame(columns=cols)
+    alerts = alerts.sort_values("zscore")[cols].reset_index(drop=True)
+    alerts.attrs["baseline"] = mode
+    return alerts
+
+
+def _window_sums(df: pd.DataFrame, target: date, segment: list[str], metrics: list[str],
+                 window_days: int | None = None) -> pd.DataFrame:
+    """Somas das colunas base por dia/segmento na janela de alerta (uma passada nas linhas brutas)."""
+    day = _day_key(df["date"], target)
+    start = _day_key(df["date"], target - timedelta(days=window_days or WINDOW_DAYS))
+    window = df[(df["date"] >= start) & (df["date"] <= day)]
+    base_cols = sorted({c for m in metrics for c in ALERT_METRICS[m] if c})
+    return window.groupby(["date"] + segment, sort=False, observed=True)[base_cols].sum()
+
+
+def _score_sums(sums: pd.DataFrame, day, segment: list[str], metrics: list[str],
+                mode: str = "mean", horizon_days: list[int] | None = None) -> pd.DataFrame | None:
+    """
+    z-scores do dia a partir das somas por dia/segmento; só as linhas abaixo de Z_ALERT.
+    A banda média/desvio de uma janela (já recortada em `sums`) é agregada em pandas; as
+    demais (sazonal, vários horizontes) vêm da matriz segmento × dia de kpi_baseline.
+    """
+    is_today = sums.index.get_level_values("date") == day
+    if not is_today.any():
+        return None
+    if mode != "mean" or len(horizon_days or []) > 1:
+        alerts = kpi_baseline.score_sums(sums, [day], segment, metrics, ALERT_METRICS, Z_ALERT,
+                                         mode, horizon_days)
+        return alerts.drop(columns="target")
+
+    hist_vals, today_vals = _metric_values(sums, metrics)
+    stats = hist_vals[~is_today].groupby(level=segment, sort=False, observed=True).agg(["mean", "std"])
+    today = today_vals[is_today].droplevel("date")
+    ma = stats.xs("mean", axis=1, level=1).reindex(index=today.index, columns=metrics)
+    sd = stats.xs("std", axis=1, level=1).reindex(index=today.index, columns=metrics)
+    z = (today - ma) / sd.where(sd != 0)
+
+    scored = pd.DataFrame({
+        "value": today.stack(future_stack=True),
+        "ma": ma.stack(future_stack=True),
+        "sd": sd.stack(future_stack=True),
+        "zscore": z.stack(future_stack=True),
+    })
+    scored.index.names = segment + ["metric"]
+    return scored[scored["zscore"].notna() & (scored["zscore"] < Z_ALERT)].reset_index()
+
+
+@timed()
+def segment_alerts_hierarchy(df: pd.DataFrame, target: date, hierarchy: list[str],
+                             metrics: list[str] | None = None,
+                             baseline: str | None = None) -> pd.DataFrame:
+    """
+    Alertas em todos os níveis de uma hierarquia (ex.: entity → product → payment_method →
+    installments) com uma única passada nas linhas brutas: agrega no nível mais fino e
+    reagrega essas somas (pequenas) para cada prefixo da hierarquia.
+    Colunas: hierarchy + level (1 = só a 1ª coluna) + metric/value/ma/sd/zscore; as colunas
+    abaixo do nível ficam vazias. `baseline` como em segment_alerts.
+    """
+    metrics = list(metrics or DEFAULT_ALERT_METRICS)
+    cols = hierarchy + ["level", "metric", "value", "ma", "sd", "zscore"]
+    mode = kpi_baseline.baseline_mode(baseline)
+    horizon_days = kpi_baseline.horizons(mode, None, WINDOW_DAYS)
+    day = _day_key(df["date"], target)
+    finest = _window_sums(df, target, hierarchy, metrics, max(horizon_days))
+
+    frames = []
+    for level in range(1, len(hierarchy) + 1):
+        keys = hierarchy[:level]
+        sums = finest if level == len(hierarchy) else \
+            finest.groupby(level=["date"] + keys, sort=False, observed=True).sum()
+        alerts = _score_sums(sums, day, keys, metrics, mode, horizon_days)
+        if alerts is not None and not alerts.empty:
+            # object: níveis sem a coluna ficam vazios sem converter inteiros em float
+            frames.append(alerts.assign(level=level).astype({c: object for c in keys}))
+    alerts = pd.concat(frames, ignore_index=True).reindex(columns=cols) if frames else pd.DataFrame(columns=cols)
     alerts = alerts.sort_values("zscore").reset_index(drop=True)
+    alerts.attrs["baseline"] = mode
     return alerts
 
 
-def _fmt_br_number(x, is_pct=False):
-    if x is None:
-        return "n/a"
-    if is_pct:
-        return f"{x:.2f}%"
-    return f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-
-def format_summary(today_kpi, comp_kpis) -> str:
-    d = today_kpi
-    dd = comp_kpis
-    lines = []
-    lines.append(f"📊 **Resumo diário — {d['date']}**")
-    lines.append(f"- TPV: R$ {_fmt_br_number(d['tpv'])} | Tx: {d['tx']:,} | Avg Ticket: R$ {_fmt_br_number(d['avg_ticket'])}")
-    lines.append("")
-    lines.append("📈 **Comparações**")
-    lines.append(f"- vs D-1: Δ R$ {_fmt_br_number(dd['dod_delta'])} ({_fmt_br_number(dd['dod_pct'], True)})")
-    lines.append(f"- vs W-1: Δ R$ {_fmt_br_number(dd['wow_delta'])} ({_fmt_br_number(dd['wow_pct'], True)})")
-    lines.append(f"- vs M-1: Δ R$ {_fmt_br_number(dd['mom_delta'])} ({_fmt_br_number(dd['mom_pct'], True)})")
-    return "\n".join(lines)
+@timed()
+def segment_alerts_sql(engine, target: date, strict_positive: bool = True) -> pd.DataFrame:
+    """
+    Versão SQL de segment_alerts: agrega por dia/segmento, média e desvio (amostral)
+    da janela WINDOW_DAYS e z-score do dia-alvo calculados no Postgres.
+    Só as linhas de alerta trafegam pela rede.
+    """
+    where_positive = "AND amount_transacted > 0 AND quantity_transactions > 0" if strict_positive else ""
+    seg = ", ".join(SEGMENT)
+    sql = text(f"""
+        WITH daily AS (
+          SELECT
+            date, {seg},
+            SUM(amount_transacted)::float8 AS tpv,
+            SUM(quantity_transactions)     AS tx
+          FROM bi.kpi_daily
+          WHERE date BETWEEN :hist_start AND :target
+            {where_positive}
+          GROUP BY date, {seg}
+        ),
+        metrics AS (
+          SELECT d.*, CASE WHEN tx <> 0 THEN tpv / tx END AS avg_ticket
+          FROM daily d
+        ),
+        hist AS (
+          SELECT
+            {seg},
+            AVG(tpv)                 AS tpv_ma,
+            STDDEV_SAMP(tpv)         AS tpv_sd,
+            AVG(avg_ticket)          AS avg_ticket_ma,
+            STDDEV_SAMP(avg_ticket)  AS avg_ticket_sd
+          FROM metrics
+          WHERE date < :target
+          GROUP BY {seg}
+        ),
+        today AS (
+          SELECT * FROM metrics WHERE date = :target
+        ),
+        scored AS (
+          SELECT {seg}, 'tpv' AS metric, t.tpv AS value, h.tpv_ma AS ma, h.tpv_sd AS sd,
+                 (t.tpv - h.tpv_ma) / NULLIF(h.tpv_sd, 0) AS zscore
+          FROM today t LEFT JOIN hist h USING ({seg})
+          UNION ALL
+          SELECT {seg}, 'avg_ticket', COALESCE(t.avg_ticket, 0.0), h.avg_ticket_ma, h.avg_ticket_sd,
+                 (COALESCE(t.avg_ticket, 0.0) - h.avg_ticket_ma) / NULLIF(h.avg_ticket_sd, 0)
+          FROM today t LEFT JOIN hist h USING ({seg})
+        )
+        SELECT * FROM scored
+        WHERE zscore < :z_alert
+        ORDER BY zscore
+    """)
+    params = {
+        "hist_start": target - timedelta(days=WINDOW_DAYS),
+        "target": target,
+        "z_alert": Z_ALERT,
+    }
+    with engine.connect() as con:
+        alerts = pd.read_sql(sql, con, params=params)
+    cols = SEGMENT + ["metric", "value", "ma", "sd", "zscore"]
+    if alerts.empty:
+        return pd.DataFrame(columns=cols)
+    return alerts[cols].reset_index(drop=True)
+
+
+@timed()
+def segment_alerts_hierarchy_sql(engine, target: date, hierarchy: list[str],
+                                 strict_positive: bool = True) -> pd.DataFrame:
+    """
+    Versão SQL de segment_alerts_hierarchy: todos os níveis num único scan com
+    GROUP BY GROUPING SETS; o nível vem de GROUPING() das colunas da hierarquia.
+    """
+    where_positive = "AND amount_transacted > 0 AND quantity_transactions > 0" if strict_positive else ""
+    seg = ", ".join(hierarchy)
+    sets = ", ".join(f"(date, {', '.join(hierarchy[:i])})" for i in range(1, len(hierarchy) + 1))
+    level = f"{len(hierarchy)} - ({' + '.join(f'GROUPING({c})' for c in hierarchy)})"
+    same = " AND ".join(f"h.{c} IS NOT DISTINCT FROM t.{c}" for c in hierarchy)
+    sql = text(f"""
+        WITH daily AS (
+          SELECT
+            date, {seg}, {level} AS level,
+            SUM(amount_transacted)::float8 AS tpv,
+            SUM(quantity_transactions)     AS tx
+          FROM bi.kpi_daily
+          WHERE date BETWEEN :hist_start AND :target
+            {where_positive}
+          GROUP BY GROUPING SETS ({sets})
+        ),
+        metrics AS (
+          SELECT d.*, CASE WHEN tx <> 0 THEN tpv / tx END AS avg_ticket
+          FROM daily d
+        ),
+        hist AS (
+          SELECT
+            level, {seg},
+            AVG(tpv)                 AS tpv_ma,
+            STDDEV_SAMP(tpv)         AS tpv_sd,
+            AVG(avg_ticket)          AS avg_ticket_ma,
+            STDDEV_SAMP(avg_ticket)  AS avg_ticket_sd
+          FROM metrics
+          WHERE date < :target
+          GROUP BY level, {seg}
+        ),
+        today AS (
+          SELECT * FROM metrics WHERE date = :target
+        ),
+        joined AS (
+          SELECT t.*, h.tpv_ma, h.tpv_sd, h.avg_ticket_ma, h.avg_ticket_sd
+          FROM today t
+          LEFT JOIN hist h ON h.level = t.level AND {same}
+        ),
+        scored AS (
+          SELECT {seg}, level, 'tpv' AS metric, tpv AS value, tpv_ma AS ma, tpv_sd AS sd,
+                 (tpv - tpv_ma) / NULLIF(tpv_sd, 0) AS zscore
+          FROM joined
+          UNION ALL
+          SELECT {seg}, level, 'avg_ticket', COALESCE(avg_ticket, 0.0), avg_ticket_ma, avg_ticket_sd,
+                 (COALESCE(avg_ticket, 0.0) - avg_ticket_ma) / NULLIF(avg_ticket_sd, 0)
+          FROM joined
+        )
+        SELECT * FROM scored
+        WHERE zscore < :z_alert
+        ORDER BY zscore
+    """)
+    params = {
+        "hist_start": target - timedelta(days=WINDOW_DAYS),
+        "target": target,
+        "z_alert": Z_ALERT,
+    }
+    with engine.connect() as con:
+        alerts = pd.read_sql(sql, con, params=params)
+    cols = hierarchy + ["level", "metric", "value", "ma", "sd", "zscore"]
+    if alerts.empty:
+        return pd.DataFrame(columns=cols)
+    for c in hierarchy:
+        if pd.api.types.is_float_dtype(alerts[c]):  # colunas inteiras com NULL dos níveis acima
+            alerts[c] = alerts[c].astype("Int64")
+    return alerts[cols].reset_index(drop=True)
+
+
+def daily_totals(df: pd.DataFrame) -> pd.DataFrame:
+    """TPV/Tx por dia (uma linha por data), para comparações por lookup."""
+    return (
+        df.groupby("date", observed=True)[["amount_transacted", "quantity_transactions"]].sum()
+        .rename(columns={"amount_transacted": "tpv", "quantity_transactions": "tx"})
+    )
+
+
+@timed()
+def segment_alerts_range(df: pd.DataFrame, targets: list[date],
+                         metrics: list[str] | None = None, baseline: str | None = None) -> dict:
+    """
+    segment_alerts para vários dias-alvo numa passada: matriz dia × segmento (calendário
+    contínuo) e média/desvio em janelas móveis de WINDOW_DAYS dias, deslocadas de 1 dia.
+    Com `baseline` (ou env KPI_BASELINE) sazonal/vários horizontes, todos os alvos são
+    pontuados de uma vez em kpi_baseline.score_sums.
+    Retorna {target: alerts_df} no mesmo formato de segment_alerts.
+    """
+    metrics = list(metrics or DEFAULT_ALERT_METRICS)
+    cols = SEGMENT + ["metric", "value", "ma", "sd", "zscore"]
+    if df.empty or not targets:
+        return {t: pd.DataFrame(columns=cols) for t in targets}
+
+    base_cols = sorted({c for m in metrics for c in ALERT_METRICS[m] if c})
+    sums = df.groupby(["date"] + SEGMENT, observed=True)[base_cols].sum()
+    keys = [_day_key(df["date"], t) for t in targets]
+    mode = kpi_baseline.baseline_mode(baseline)
+    horizon_days = kpi_baseline.horizons(mode, None, WINDOW_DAYS)
+    if mode != "mean" or horizon_days != [WINDOW_DAYS]:
+        scored = kpi_baseline.score_sums(sums, keys, SEGMENT, metrics, ALERT_METRICS, Z_ALERT,
+                                         mode, horizon_days)
+        by_target = dict(tuple(scored.groupby("target", sort=False)))
+        out = {}
+        for t, key in zip(targets, keys):
+            a = by_target.get(key)
+            a = pd.DataFrame(columns=cols) if a is None else a[cols].sort_values("zscore").reset_index(drop=True)
+            a.attrs["baseline"] = mode
+            out[t] = a
+        return out
+
+    calendar = pd.date_range(min(sums.index.get_level_values("date").min(), min(keys)),
+                             max(keys), freq="D")
+    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        calendar = calendar.date
+    hist_vals, today_vals = _metric_values(sums, metrics)
+    wide = {m: hist_vals[m].unstack(SEGMENT).reindex(calendar) for m in metrics}
+    today_wide = {m: today_vals[m].unstack(SEGMENT).reindex(calendar) for m in metrics}
+
+    frames = []
+    for metric, values in wide.items():
+        roll = values.rolling(WINDOW_DAYS, min_periods=1)
+        ma = roll.mean().shift(1).loc[keys]
+        sd = roll.std().shift(1).loc[keys]
+        val = today_wide[metric].loc[keys]
+        z = (val - ma) / sd.where(sd != 0)
+        long = pd.DataFrame({
+            "value": val.stack(SEGMENT, future_stack=True),
+            "ma": ma.stack(SEGMENT, future_stack=True),
+            "sd": sd.stack(SEGMENT, future_stack=True),
+            "zscore": z.stack(SEGMENT, future_stack=True),
+        })
+        long = long[long["value"].notna()]
+        long["metric"] = metric
+        frames.append(long)
+
+    scored = pd.concat(frames).reset_index()
+    scored = scored.rename(columns={scored.columns[0]: "target"})
+    alerts = scored[scored["zscore"].notna() & (scored["zscore"] < Z_ALERT)]
+
+    out = {}
+    by_target = dict(tuple(alerts.groupby("target")))
+    for t, key in zip(targets, keys):
+        a = by_target.get(key)
+        if a is None:
+            out[t] = pd.DataFrame(columns=cols)
+        else:
+            out[t] = a[cols].sort_values("zscore").reset_index(drop=True)
+    return out
+
+
+def _hierarchy_cols(alerts: pd.DataFrame) -> list[str]:
+    return list(alerts.columns[:alerts.columns.get_loc("level")])
+
+
+def drilldown_order(alerts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ordena alertas hierárquicos como árvore: ramos (1º nível) do mais severo ao menos
+    severo e, dentro de cada ramo, o pai antes dos filhos.
+    """
+    hier = _hierarchy_cols(alerts)
+    branch_z = alerts.groupby(hier[0], observed=True)["zscore"].transform("min")
+    ordered = alerts.assign(_branch_z=branch_z).sort_values(
+        ["_branch_z"] + hier + ["level", "metric"], na_position="first", kind="stable"
+    )
+    return ordered.drop(columns="_branch_z").reset_index(drop=True)
+
+
+def _alert_path(r, hier: list[str]) -> str:
+    return " › ".join(str(r[c]) for c in hier[:int(r["level"])])
+
+
+def _band_label(alerts: pd.DataFrame | None) -> str:
+    # banda do modo em attrs["baseline"] (ou KPI_BASELINE) e limiar Z_ALERT
+    mode = (alerts.attrs.get("baseline") if alerts is not None else None) or kpi_baseline.baseline_mode()
+    return kpi_baseline.band_label(mode, Z_ALERT)
+
+
+def alerts_title(alerts: pd.DataFrame | None) -> str:
+    """Título da seção de alertas (texto e PDF), conforme a banda usada nos alertas."""
+    return f"Alertas ({_band_label(alerts)})"
 
 
 def format_alerts(alerts: pd.DataFrame, limit=5) -> str:
     if alerts.empty:
-        return "✅ Sem alertas: nenhum segmento abaixo da banda histórica."
+        return f"✅ Sem alertas: nenhum segmento {_band_label(alerts)}."
+    lines = [f"⛳ **{alerts_title(alerts)}**"]
+    if "level" in alerts.columns:
+        # drill-down: árvore indentada por nível
+        hier = _hierarchy_cols(alerts)
+        for _, r in drilldown_order(alerts).head(limit).iterrows():
+            metric = METRIC_LABELS.get(r["metric"], r["metric"])
+            indent = "  " * (int(r["level"]) - 1)
+            lines.append(
+                f"{indent}- {_alert_path(r, hier)} → {metric}: valor={r['value']:.2f}, "
+                f"média={r['ma']:.2f}, σ={r['sd']:.2f}, z={r['zscore']:.2f}"
+            )
+        if len(alerts) > limit:
+            lines.append(f"... (+{len(alerts)-limit} alertas)")
+        return "\n".join(lines)
     head = alerts.head(limit)
-    lines = ["⛳ **Alertas (abaixo da banda histórica −2σ)**"]
     for _, r in head.iterrows():
         seg = " | ".join(str(r[c]) for c in SEGMENT)
-        metric = "TPV" if r["metric"] == "tpv" else "Avg Ticket"
+        metric = METRIC_LABELS.get(r["metric"], r["metric"])
         lines.append(
             f"- {seg} → {metric}: valor={r['value']:.2f}, média={r['ma']:.2f}, σ={r['sd']:.2f}, z={r['zscore']:.2f}"
         )
@@ -211,295 +599,435 @@ def format_alerts(alerts: pd.DataFrame, limit=5) -> str:
     return "\n".join(lines)
 
 
+def _summary_prompt(raw_text: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "Você é um assistente de BI. Produza um resumo executivo, claro e objetivo, em PT-BR. Use bullets curtos."},
+        {"role": "user", "content": f"Transforme o texto abaixo em um resumo executivo para diretoria:\n\n{raw_text}"},
+    ]
+
+
+@timed()
 def ai_summarize(raw_text: str) -> str:
+    """
+    Resumo executivo via LLM (backend de llm.get_backend, env LLM_BACKEND), com cache em
+    disco por hash de backend + modelo + prompt. Sem backend disponível devolve o texto original.
+    """
     load_dotenv()
-    api_key = OPENAI_API_KEY
     org = os.getenv("OPENAI_ORG", ORGANIZATION_ID)
-    if not api_key or OpenAI is None:
+    backend = get_backend(OPENAI_API_KEY, org)
+    if backend is None:
         return raw_text
-    client = OpenAI(api_key=api_key, organization=org)
-    prompt = [
-        {"role": "system", "content": "Você é um assistente de BI. Produza um resumo executivo, claro e objetivo, em PT-BR. Use bullets curtos."},
-        {"role": "user", "content": f"Transforme o texto abaixo em um resumo executivo para diretoria:\n\n{raw_text}"},
-    ]
-    resp = client.responses.create(model="gpt-4o-mini", input=prompt)
-    return resp.output_text or raw_text
-
-
-# ---------- PDF helpers ----------
-def _markdown_to_story(md_text: str):
-    """Converte um markdown leve em elementos para o PDF."""
-    styles = getSampleStyleSheet()
-    # Ajustes de estilo
-    styles.add(ParagraphStyle(name='TitleMB', parent=styles['Heading1'], fontSize=16, leading=20, spaceAfter=10))
-    styles.add(ParagraphStyle(name='BodyMB', parent=styles['BodyText'], fontSize=10.5, leading=14))
-    styles.add(ParagraphStyle(name='BulletMB', parent=styles['BodyText'], fontSize=10.5, leading=14, leftIndent=12))
-    story = []
-
-    lines = md_text.strip().splitlines()
-    title_used = False
-    for ln in lines:
-        ln = ln.strip()
-        if not ln:
-            story.append(Spacer(1, 6))
-            continue
-        # títulos markdown simples
-        if ln.startswith("📊 **Resumo diário"):
-            story.append(Paragraph(ln.replace("**", ""), styles['TitleMB']))
-            title_used = True
-            continue
-        if ln.startswith("📈 **Comparações"):
-            story.append(Paragraph(ln.replace("**", ""), styles['Heading2']))
-            continue
-        if ln.startswith("⛳ **Alertas"):
-            story.append(Spacer(1, 8))
-            story.append(Paragraph(ln.replace("**", ""), styles['Heading2']))
-            continue
-        # bullets
-        if ln.startswith("- "):
-            story.append(Paragraph("• " + ln[2:], styles['BulletMB']))
-        else:
-            story.append(Paragraph(ln.replace("**", ""), styles['BodyMB']))
-
-    if not title_used and story:
-        story.insert(0, Paragraph("Relatório de KPIs", styles['TitleMB']))
-    return story
-
-
-def on_page(canvas, doc):
-    # cabeçalho e rodapé
-    canvas.saveState()
-    w, h = A4
-    canvas.setStrokeColor(THEME_PRIMARY)
-    canvas.setFillColor(THEME_PRIMARY)
-    canvas.setLineWidth(1)
-    canvas.line(36, h-48, w-36, h-48)
-
-    canvas.setFillColor(THEME_TEXT)
-    canvas.setFont("Helvetica-Bold", 11)
-    canvas.drawString(36, h-40, "Relatório de KPIs • CloudWalk (demo)")
-    canvas.setFont("Helvetica", 9)
-    canvas.setFillColor(THEME_MUTED)
-    canvas.drawRightString(w-36, 20, f"Página {doc.page}")
-    canvas.restoreState()
+    model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    return cached_complete(backend, _summary_prompt(raw_text), model) or raw_text
+
+
+def ai_summarize_async(raw_text: str):
+    """ai_summarize numa thread; devolve uma função que espera até LLM_DEADLINE_S (fallback: raw_text)."""
+    return resolver(submit(ai_summarize, raw_text), raw_text)
+
+
+# ---------- PDF ----------
+def alert_table(alerts_df: pd.DataFrame | None) -> tuple[str | None, list[list[str]]]:
+    """Linhas já formatadas da tabela de alertas do PDF: ("hierarchy"|"flat"|None, linhas)."""
+    if alerts_df is None or alerts_df.empty:
+        return None, []
+    rows = []
+    if "level" in alerts_df.columns:
+        # drill-down: uma coluna "Segmento" com o caminho indentado por nível
+        hier = _hierarchy_cols(alerts_df)
+        for _, r in drilldown_order(alerts_df).head(20).iterrows():
+            indent = "\u00a0" * 4 * (int(r["level"]) - 1)
+            rows.append([
+                indent + _alert_path(r, hier), METRIC_LABELS.get(r["metric"], r["metric"]),
+                f"{r['value']:.2f}", f"{r['ma']:.2f}", f"{r['sd']:.2f}", f"{r['zscore']:.2f}"
+            ])
+        return "hierarchy", rows
+    for _, r in alerts_df.head(10).iterrows():
+        rows.append([
+            str(r["entity"]), str(r["product"]), str(r["payment_method"]),
+            METRIC_LABELS.get(r["metric"], r["metric"]), f"{r['value']:.2f}", f"{r['ma']:.2f}",
+            f"{r['sd']:.2f}", f"{r['zscore']:.2f}"
+        ])
+    return "flat", rows
+
+
+def report_payload(text, alerts_df: pd.DataFrame | None, today_kpi: dict, comp_dict: dict,
+                   scope: str | None = None) -> dict:
+    """Payload de report_renderer (sem DataFrames: leve para enviar a outros processos)."""
+    return {"text": text, "alerts": alert_table(alerts_df), "alerts_title": alerts_title(alerts_df),
+            "today_kpi": today_kpi, "comp_dict": comp_dict, "scope": scope}
+
 
 def build_kpi_cards(today_kpi: dict, comp: dict):
+    return get_renderer().kpi_cards(today_kpi, comp)
+
+
+@timed()
+def save_pdf(text, pdf_path, alerts_df: pd.DataFrame | None,
+             today_kpi: dict, comp_dict: dict):
     """
-    Três cards em 2 linhas cada: título (pequeno, muted) em cima,
-    valor grande abaixo (alinhado à direita). Evita truncar e permite quebra.
+    Monta e grava o PDF (pdf_path: caminho ou BytesIO). `text` pode ser uma string ou uma
+    função sem argumentos (ex.: ai_summarize_async): nesse caso cards e tabelas são
+    montados antes de esperar o texto.
     """
+    if callable(text):
+        pending = text
 
-    def make_card(title: str, value_str: str):
-        # linhas do card (1 coluna, 2 linhas)
-        title_p = Paragraph(f"<b>{title}</b>", ParagraphStyle(
-            "kpiTitle", fontSize=9, textColor=THEME_MUTED, leading=11))
-        fs = _auto_font(value_str)
-        value_p = Paragraph(
-            f'<para alignment="right"><font size="{fs}"><b>{value_str}</b></font></para>',
-            ParagraphStyle("kpiValue", fontSize=fs, textColor=THEME_TEXT, leading=fs+2)
-        )
-        t = Table([[title_p],[value_p]], colWidths=[170])
-        t.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,-1), THEME_BG_CARD),
-            ("BOX", (0,0), (-1,-1), 0.0, colors.white),
-            ("LEFTPADDING", (0,0), (-1,-1), 10),
-            ("RIGHTPADDING", (0,0), (-1,-1), 10),
-            ("TOPPADDING", (0,0), (-1,-1), 6),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-        ]))
-        return t
-
-    # valores compactos para caber melhor
-    v_tpv = _fmt_compact_money_br(today_kpi["tpv"])
-    v_tx  = _fmt_int_br(today_kpi["tx"])
-    v_avg = _fmt_compact_money_br(today_kpi["avg_ticket"])
-
-    card_tpv = make_card("TPV", v_tpv)
-    card_tx  = make_card("Transações", v_tx)
-    card_avg = make_card("Ticket Médio", v_avg)
-
-    # cards lado a lado (3 colunas)
-    composite = Table([[card_tpv, card_tx, card_avg]], colWidths=[180,180,180])
-    composite.setStyle(TableStyle([("VALIGN", (0,0), (-1,-1), "TOP")]))
-
-    # ----- comparações (mantém a tabela, mas com fonte um pouco menor) -----
-    def arrow_and_color(delta, pct):
-        if delta is None or pct is None:
-            return ("—", THEME_MUTED)
-        if delta >= 0:
-            return (f"▲ {_fmt_compact_money_br(delta)} ({pct:.2f}%)", THEME_SUCCESS)
-        else:
-            return (f"▼ {_fmt_compact_money_br(delta)} ({pct:.2f}%)", THEME_DANGER)
+        def text():
+            # espera pelo LLM medida à parte do layout
+            with span("ai_summarize.wait"):
+                return pending()
+    return get_renderer().render(report_payload(text, alerts_df, today_kpi, comp_dict), pdf_path)
 
-    d1_str, d1_color = arrow_and_color(comp["dod_delta"], comp["dod_pct"])
-    w1_str, w1_color = arrow_and_color(comp["wow_delta"], comp["wow_pct"])
-    m1_str, m1_color = arrow_and_color(comp["mom_delta"], comp["mom_pct"])
 
-    comp_data = [
-        ["vs D-1", d1_str],
-        ["vs W-1", w1_str],
-        ["vs M-1", m1_str],
-    ]
-    comp_tbl = Table(comp_data, colWidths=[70, 470])
-    comp_tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
-        ("TEXTCOLOR", (1,0), (1,0), d1_color),
-        ("TEXTCOLOR", (1,1), (1,1), w1_color),
-        ("TEXTCOLOR", (1,2), (1,2), m1_color),
-        ("BOX", (0,0), (-1,-1), 0.25, colors.HexColor("#E5E7EB")),
-        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.HexColor("#E5E7EB")),
-        ("LEFTPADDING", (0,0), (-1,-1), 6),
-        ("RIGHTPADDING", (0,0), (-1,-1), 6),
-        ("TOPPADDING", (0,0), (-1,-1), 3),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 3),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-    ]))
-
-    return composite, comp_tbl
-
-
-def save_pdf(text: str, pdf_path: str, alerts_df: pd.DataFrame | None,
-             today_kpi: dict, comp_dict: dict):
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='TitleMB', parent=styles['Heading1'],
-                              fontSize=20, textColor=THEME_TEXT, leading=24, spaceAfter=6))
-    styles.add(ParagraphStyle(name='SubMB', parent=styles['BodyText'],
-                              fontSize=10.5, textColor=THEME_MUTED, spaceAfter=8))
-    styles.add(ParagraphStyle(name='H2MB', parent=styles['Heading2'],
-                              fontSize=13, textColor=THEME_TEXT, spaceBefore=10, spaceAfter=6))
-
-    doc = SimpleDocTemplate(
-        pdf_path, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=64, bottomMargin=36
-    )
-    story = []
-
-    # Título + data
-    story.append(Paragraph("Relatório de KPIs", styles['TitleMB']))
-    story.append(Paragraph(f"Resumo Executivo — {today_kpi['date']}", styles['SubMB']))
-    story.append(HRFlowable(width="100%", color=THEME_PRIMARY, thickness=1))
-    story.append(Spacer(1, 8))
-
-    # Cards e comparações
-    cards, comps = build_kpi_cards(today_kpi, comp_dict)
-    story.append(cards)
-    story.append(Spacer(1, 10))
-    story.append(comps)
-
-    # Seção "Insights em texto" (opcional, texto gerado pela IA)
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("Resumo em Texto", styles['H2MB']))
-    # converte bullets simples do markdown em parágrafos
-    for ln in text.strip().splitlines():
-        ln = ln.strip()
-        if not ln:
-            story.append(Spacer(1, 2))
-            continue
-        if ln.startswith("• ") or ln.startswith("- "):
-            story.append(Paragraph("• " + ln[2:], styles['BodyText']))
-        elif ln.startswith(("📈", "📊", "⛳")):
-            story.append(Paragraph(ln, styles['BodyText']))
-        else:
-            story.append(Paragraph(ln, styles['BodyText']))
-
-    # Alertas
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("Alertas (abaixo da banda histórica −2σ)", styles['H2MB']))
-    if alerts_df is not None and not alerts_df.empty:
-        head = alerts_df.head(10).copy()
-        head["metric"] = head["metric"].map({"tpv": "TPV", "avg_ticket": "Avg Ticket"})
-        data = [["Entidade", "Produto", "Método", "Métrica", "Valor", "Média", "σ", "z"]]
-        for _, r in head.iterrows():
-            data.append([
-                str(r["entity"]), str(r["product"]), str(r["payment_method"]),
-                str(r["metric"]), f"{r['value']:.2f}", f"{r['ma']:.2f}",
-                f"{r['sd']:.2f}", f"{r['zscore']:.2f}"
-            ])
-        tbl = Table(data, hAlign="LEFT", colWidths=[60,80,80,60,65,65,35,35])
-        tbl.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#EEF2FF")),
-            ("TEXTCOLOR", (0,0), (-1,0), THEME_PRIMARY),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D1D5DB")),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("FONTSIZE", (0,0), (-1,0), 9),
-            ("FONTSIZE", (0,1), (-1,-1), 8.5),
-            ("ALIGN", (4,1), (-1,-1), "RIGHT"),
-            ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
-        ]))
-        story.append(tbl)
+def _window_start(target: date) -> date:
+    # cobre M-1 (comparações) e o histórico da banda de alerta configurada (KPI_BASELINE*)
+    return target - timedelta(days=max(60, WINDOW_DAYS + 7, kpi_baseline.lookback_days(WINDOW_DAYS) + 7))
+
+
+def compute_report(df: pd.DataFrame, target: date, hierarchy: list[str] | None = None,
+                   index: DailyIndex | None = None) -> tuple[dict, dict, pd.DataFrame]:
+    """
+    Caminho pandas: KPIs do dia, comparações e alertas a partir das linhas brutas.
+    Com hierarchy, os alertas cobrem todos os níveis (segment_alerts_hierarchy).
+    As comparações vêm do índice diário (load_index); sem ele, de um índice montado com os
+    totais da própria janela (Y-1/MTD/YTD que ela não cobre ficam "n/a").
+    """
+    if index is None:
+        index = DailyIndex.from_totals(daily_totals(df), since=_window_start(target))
+    today, comp_dict = index_comparisons(index, target)
+    if hierarchy:
+        alerts_df = segment_alerts_hierarchy(df, target, hierarchy)
+    else:
+        alerts_df = segment_alerts(df, target)
+    return today, comp_dict, alerts_df
+
+
+def compute_report_sql(engine, target: date, use_stats: bool = False,
+                       hierarchy: list[str] | None = None,
+                       index: DailyIndex | None = None) -> tuple[dict, dict, pd.DataFrame]:
+    """
+    Caminho SQL: mesmas saídas de compute_report, agregadas no Postgres.
+    Com use_stats, os alertas vêm de bi.kpi_segment_stats (uma linha por segmento);
+    com hierarchy, de um único GROUPING SETS (segment_alerts_hierarchy_sql).
+    """
+    if index is None:
+        index = load_index(engine, index_start(target), target)
+    today, comp_dict = index_comparisons(index, target)
+    if hierarchy:
+        if use_stats:
+            raise ValueError("Alertas hierárquicos não são suportados com compute=stats.")
+        alerts_df = segment_alerts_hierarchy_sql(engine, target, hierarchy)
+    elif use_stats:
+        if SEGMENT != STATS_SEGMENT:
+            raise ValueError(f"SEGMENT {SEGMENT} difere da granularidade do store {STATS_SEGMENT}")
+        alerts_df = segment_alerts_stats(engine, target, WINDOW_DAYS, Z_ALERT)
     else:
-        story.append(Paragraph("✅ Sem alertas para hoje.", styles['BodyText']))
+        alerts_df = segment_alerts_sql(engine, target)
+    return today, comp_dict, alerts_df
+
+
+def report_text(today: dict, comp_dict: dict, alerts_df: pd.DataFrame, scope: str | None = None) -> str:
+    summary   = format_summary(today, comp_dict, scope)
+    alerts_msg= format_alerts(alerts_df, limit=15 if "level" in alerts_df.columns else 5)
+    return f"{summary}\n\n{alerts_msg}"
+
+
+def _report_paths(target: date, suffix: str = "") -> tuple[str, str]:
+    _ensure_dirs()
+    name = f"kpi_report_{target.isoformat()}" + (f"_{suffix}" if suffix else "")
+    md_path  = os.path.join(REPORT_DIR, f"{name}.md")
+    pdf_path = os.path.join(REPORT_DIR, f"{name}.pdf")
+    return md_path, pdf_path
+
+
+def _write_markdown(jobs: list[tuple]) -> tuple[list[tuple[str, str]], list[dict], list[str]]:
+    """
+    Espera os textos (LLM) e grava os MDs de jobs (md_path, pdf_path, texto futuro, payload);
+    devolve (caminhos, payloads com texto, caminhos dos PDFs) para o render_many.
+    """
+    results, payloads, pdf_paths = [], [], []
+    for md_path, pdf_path, pretty_text, payload in jobs:
+        payload["text"] = pretty_text()
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(payload["text"] + "\n")
+        results.append((md_path, pdf_path))
+        payloads.append(payload)
+        pdf_paths.append(pdf_path)
+    return results, payloads, pdf_paths
+
+
+@timed()
+def write_report(target: date, today: dict, comp_dict: dict,
+                 alerts_df: pd.DataFrame) -> tuple[str, str]:
+    full_text = report_text(today, comp_dict, alerts_df)
+    # LLM roda em paralelo à montagem do PDF; com prazo, cai no texto original
+    pretty_text = ai_summarize_async(full_text)
+    md_path, pdf_path = _report_paths(target)
+
+    # >>> usa a versão nova do save_pdf (que monta os cards)
+    save_pdf(pretty_text, pdf_path, alerts_df=alerts_df, today_kpi=today, comp_dict=comp_dict)
+    pretty = pretty_text()
+
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(pretty + "\n")
+
+    print(pretty)
+    print(f"[OK] Salvo:\n- {md_path}\n- {pdf_path}")
+    return md_path, pdf_path
+
+
+def _alert_hierarchy(hierarchy: list[str] | str | None = None) -> list[str]:
+    """Hierarquia de drill-down dos alertas (parâmetro ou env KPI_ALERT_HIERARCHY, separada por vírgula)."""
+    if hierarchy is None:
+        hierarchy = os.getenv("KPI_ALERT_HIERARCHY", "")
+    if isinstance(hierarchy, str):
+        hierarchy = [c.strip() for c in hierarchy.split(",") if c.strip()]
+    return list(hierarchy)
+
+
+def _check_compute_backend(compute: str, engine) -> None:
+    """
+    Os alertas em SQL usam STDDEV_SAMP e GROUPING SETS (sem equivalente no SQLite) e o
+    compute=stats lê bi.kpi_segment_stats (mantido só no Postgres): falha antes de consultar.
+    """
+    dialect = engine.dialect.name
+    if compute == "stats" and dialect != "postgresql":
+        raise ValueError(f"compute=stats requer Postgres (KPI_BACKEND={dialect}; use compute=pandas ou sql)")
+    if compute == "sql" and dialect == "sqlite":
+        raise ValueError("compute=sql não roda no SQLite (KPI_BACKEND=sqlite; use compute=pandas ou DuckDB)")
 
-    doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
 
+def _last_available_date(engine) -> date | None:
+    # offline (KPI_CACHE_OFFLINE=1): último dia do cache local, sem consultar o banco
+    return last_cached_date() if cache_offline() else get_last_available_date(engine, strict_positive=True)
 
 
-def run_kpi_bot(target: date | None = None) -> tuple[str, str] | str:
+def _load_index(engine, df: pd.DataFrame, start: date, end: date) -> DailyIndex:
+    """Índice diário do banco (load_index); offline, dos totais da janela já lida do cache."""
+    if cache_offline():
+        return DailyIndex.from_totals(daily_totals(df))
+    return load_index(engine, start, end)
+
+
+@timed()
+def run_kpi_bot(target: date | None = None, compute: str | None = None,
+                hierarchy: list[str] | str | None = None) -> tuple[str, str] | str:
+    """
+    Gera o relatório do dia-alvo.
+    compute="pandas" (padrão) carrega as linhas brutas da janela e agrega em pandas;
+    compute="sql" agrega no Postgres e só traz os totais/alertas;
+    compute="stats" usa o SQL para os totais e bi.kpi_segment_stats para os alertas.
+    Também via env KPI_COMPUTE. `hierarchy` (ou env KPI_ALERT_HIERARCHY) ativa os alertas
+    em drill-down, ex.: "entity,product,payment_method,installments".
+    """
     load_dotenv()
+    compute = (compute or os.getenv("KPI_COMPUTE", "pandas")).lower()
+    hierarchy = _alert_hierarchy(hierarchy)
+    if compute not in KPI_COMPUTE_MODES:
+        raise ValueError(f"compute inválido: {compute} (use um de {KPI_COMPUTE_MODES})")
+    if compute != "pandas" and kpi_baseline.baseline_mode() != "mean":
+        raise ValueError("KPI_BASELINE=seasonal requer compute=pandas (a banda sazonal é calculada em NumPy)")
+    if compute != "pandas" and cache_offline():
+        raise ValueError("KPI_CACHE_OFFLINE=1 requer compute=pandas (compute=sql/stats consulta o banco)")
     engine = SessionConnector().session()
+    _check_compute_backend(compute, engine)
 
     # alvo padrão = ontem em BRT
     requested_target = target or (_today_br() - timedelta(days=1))
 
-    # janela inicial em torno do requested_target
-    start = requested_target - timedelta(days=max(60, WINDOW_DAYS + 7))
-    end   = requested_target
-
-    df = load_data(engine, start, end, strict_positive=True)
+    if compute in ("sql", "stats"):
+        has_data = kpis_for_days_sql(engine, [requested_target])[requested_target]["tx"] > 0
+    else:
+        # janela inicial em torno do requested_target
+        df = load_data(engine, _window_start(requested_target), requested_target, strict_positive=True)
+        has_data = not (df.empty or df[df["date"] == _day_key(df["date"], requested_target)].empty)
 
     # Se não houver dados para o dia solicitado, usa o último dia disponível na base
-    if df.empty or df[df["date"] == requested_target].empty:
-        last_day = get_last_available_date(engine, strict_positive=True)
+    if not has_data:
+        last_day = _last_available_date(engine)
         if last_day is None:
             print("[run_kpi_bot] ❌ Nenhum dado na base.")
             return "NO_DATA"
         if last_day != requested_target:
             print(f"[run_kpi_bot] ⚠️ Dia {requested_target} sem dados. Usando último dia disponível: {last_day}.")
-            # Recarrega janela alinhada ao novo target
             requested_target = last_day
-            start = requested_target - timedelta(days=max(60, WINDOW_DAYS + 7))
-            end   = requested_target
-            df = load_data(engine, start, end, strict_positive=True)
+            if compute == "pandas":
+                # Recarrega janela alinhada ao novo target
+                df = load_data(engine, _window_start(requested_target), requested_target, strict_positive=True)
 
-    # KPIs do dia (agora garantido existir)
+    # KPIs do dia (agora garantido existir); comparações pelo índice diário (até 2 anos)
     target = requested_target
-    comps = comparable_dates(target)
-    today = kpis_for_day(df, target)
-    d_1   = kpis_for_day(df, comps["d_1"])
-    w_1   = kpis_for_day(df, comps["w_1"])
-    m_1   = kpis_for_day(df, comps["m_1"])
-
-    dod_delta, dod_pct = growth(today["tpv"], d_1["tpv"])
-    wow_delta, wow_pct = growth(today["tpv"], w_1["tpv"])
-    mom_delta, mom_pct = growth(today["tpv"], m_1["tpv"])
-
-    comp_dict = {
-        "dod_delta": dod_delta, "dod_pct": dod_pct,
-        "wow_delta": wow_delta, "wow_pct": wow_pct,
-        "mom_delta": mom_delta, "mom_pct": mom_pct,
-    }
+    if compute in ("sql", "stats"):
+        index = load_index(engine, index_start(target), target)
+        today, comp_dict, alerts_df = compute_report_sql(
+            engine, target, use_stats=(compute == "stats"), hierarchy=hierarchy, index=index
+        )
+    else:
+        index = _load_index(engine, df, index_start(target), target)
+        today, comp_dict, alerts_df = compute_report(df, target, hierarchy=hierarchy, index=index)
 
-    alerts_df = segment_alerts(df, target)
+    return write_report(target, today, comp_dict, alerts_df)
 
-    summary   = format_summary(today, comp_dict)
-    alerts_msg= format_alerts(alerts_df)
-    full_text = f"{summary}\n\n{alerts_msg}"
-    pretty    = ai_summarize(full_text)
 
-    _ensure_dirs()
-    md_path  = os.path.join(REPORT_DIR, f"kpi_report_{target.isoformat()}.md")
-    pdf_path = os.path.join(REPORT_DIR, f"kpi_report_{target.isoformat()}.pdf")
+@timed()
+def run_kpi_bot_range(start: date, end: date, workers: int | None = None) -> list[tuple[str, str]]:
+    """
+    Backfill: gera os relatórios de start..end (inclusive) com uma única carga da janela
+    união. Comparações por lookup num único índice diário; z-scores vetorizados para todos
+    os dias; os resumos de LLM rodam em threads e os PDFs em paralelo (render_many).
+    """
+    load_dotenv()
+    t_start = time.perf_counter()
+    engine = SessionConnector().session()
 
-    with open(md_path, "w", encoding="utf-8") as f:
-        f.write(pretty + "\n")
+    df = load_data(engine, _window_start(start), end, strict_positive=True)
+    t_load = time.perf_counter()
+
+    index = _load_index(engine, df, index_start(start), end)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    targets = [d for d in days if d in index]
+    skipped = sorted(set(days) - set(targets))
+    if skipped:
+        print(f"[run_kpi_bot_range] ⚠️ {len(skipped)} dia(s) sem dados ignorados: "
+              f"{skipped[0]}..{skipped[-1]}")
+    if not targets:
+        print("[run_kpi_bot_range] ❌ Nenhum dado no período.")
+        return []
+
+    alerts = segment_alerts_range(df, targets)
+    jobs = []  # (md, pdf, texto futuro do LLM, payload sem texto)
+    for t in targets:
+        today, comp_dict = index_comparisons(index, t)
+        pretty_text = ai_summarize_async(report_text(today, comp_dict, alerts[t]))
+        jobs.append((*_report_paths(t), pretty_text, report_payload(None, alerts[t], today, comp_dict)))
+    t_compute = time.perf_counter()
+
+    results, payloads, pdf_paths = _write_markdown(jobs)
+    t_text = time.perf_counter()
+
+    render_many(payloads, pdf_paths, workers=workers)
+    t_end = time.perf_counter()
+
+    print(
+        f"[run_kpi_bot_range] {len(results)} relatórios em {t_end - t_start:.2f}s "
+        f"(carga {t_load - t_start:.2f}s | cálculo {t_compute - t_load:.2f}s | "
+        f"texto {t_text - t_compute:.2f}s | render {t_end - t_text:.2f}s) | "
+        f"{(t_end - t_start) / len(results):.3f}s/relatório, "
+        f"{len(results) / (t_end - t_text):.1f} PDFs/s"
+    )
+    return results
 
-    # >>> usa a versão nova do save_pdf (que monta os cards)
-    save_pdf(pretty, pdf_path, alerts_df=alerts_df, today_kpi=today, comp_dict=comp_dict)
 
-    print(pretty)
-    print(f"[OK] Salvo:\n- {md_path}\n- {pdf_path}")
-    return md_path, pdf_path
+def _fanout_columns(by: list[str] | str | None = None) -> list[str]:
+    """Colunas do fan-out (parâmetro ou env KPI_FANOUT, separadas por vírgula)."""
+    if by is None:
+        by = os.getenv("KPI_FANOUT", "")
+    if isinstance(by, str):
+        by = [c.strip() for c in by.split(",") if c.strip()]
+    bad = [c for c in by if c not in FILTER_COLUMNS]
+    if not by or bad:
+        raise ValueError(f"fan-out inválido: {bad or by} (use colunas de {FILTER_COLUMNS})")
+    return list(dict.fromkeys(by))
+
+
+def _scope_suffix(column: str, value) -> str:
+    # sufixo do arquivo: entity-PF, product-pix, ...
+    return f"{column}-" + re.sub(r"[^0-9A-Za-z_.-]+", "_", str(value))
+
+
+@timed()
+def run_kpi_bot_fanout(target: date | None = None, by: list[str] | str | None = None,
+                       hierarchy: list[str] | str | None = None,
+                       workers: int | None = None) -> list[tuple[str, str]]:
+    """
+    Fan-out por público: um relatório por valor de cada coluna de `by` (ou env KPI_FANOUT,
+    ex.: "entity,product" -> PF, PJ, pix, pos, ...), com uma única carga da janela.
+    A janela é particionada em memória (groupby); os alertas saem de um único segment_alerts
+    com a coluna no segmento, as comparações de um índice diário por valor (load_index_by,
+    uma consulta) e os PDFs são renderizados em paralelo (render_many).
+    Grava kpi_report_<dia>_<coluna>-<valor>.md/.pdf.
+    """
+    load_dotenv()
+    columns = _fanout_columns(by)
+    hierarchy = _alert_hierarchy(hierarchy)
+    t_start = time.perf_counter()
+    engine = SessionConnector().session()
+
+    target = target or (_today_br() - timedelta(days=1))
+    df = load_data(engine, _window_start(target), target, strict_positive=True)
+    if df.empty or df[df["date"] == _day_key(df["date"], target)].empty:
+        last_day = _last_available_date(engine)
+        if last_day is None:
+            print("[run_kpi_bot_fanout] ❌ Nenhum dado na base.")
+            return []
+        print(f"[run_kpi_bot_fanout] ⚠️ Dia {target} sem dados. Usando último dia disponível: {last_day}.")
+        target = last_day
+        df = load_data(engine, _window_start(target), target, strict_positive=True)
+    # offline: sem índice por valor; cada partição usa os totais da própria janela
+    indexes = {} if cache_offline() else load_index_by(engine, columns, index_start(target), target)
+    t_load = time.perf_counter()
+
+    jobs = []  # (md, pdf, texto futuro do LLM, payload sem texto)
+    for column in columns:
+        if not hierarchy:
+            # um groupby para todas as partições: com a coluna no segmento, os alertas de
+            # cada valor são os mesmos de rodar segment_alerts só nas linhas dele
+            alerts_all = segment_alerts(df, target, segment=SEGMENT + [column] if column not in SEGMENT else SEGMENT)
+        for value, part in df.groupby(column, observed=True, sort=True):
+            if part[part["date"] == _day_key(part["date"], target)].empty:
+                print(f"[run_kpi_bot_fanout] ⚠️ {column}={value} sem dados em {target}; ignorado.")
+                continue
+            index = indexes.get((column, str(value)))
+            if index is None:
+                index = DailyIndex.from_totals(daily_totals(part), since=_window_start(target))
+            today, comp_dict = index_comparisons(index, target)
+            if hierarchy:
+                alerts = segment_alerts_hierarchy(part, target, hierarchy)
+            else:
+                alerts = alerts_all[alerts_all[column] == value].reset_index(drop=True)
+                alerts.attrs = dict(alerts_all.attrs)
+            scope = f"{column}={value}"
+            pretty_text = ai_summarize_async(report_text(today, comp_dict, alerts, scope=scope))
+            jobs.append((*_report_paths(target, _scope_suffix(column, value)), pretty_text,
+                         report_payload(None, alerts, today, comp_dict, scope=scope)))
+    t_compute = time.perf_counter()
+
+    results, payloads, pdf_paths = _write_markdown(jobs)
+    t_text = time.perf_counter()
+    render_many(payloads, pdf_paths, workers=workers)
+    t_end = time.perf_counter()
+
+    print(
+        f"[run_kpi_bot_fanout] {len(results)} relatórios ({', '.join(columns)}) de {target} em "
+        f"{t_end - t_start:.2f}s (carga {t_load - t_start:.2f}s | cálculo {t_compute - t_load:.2f}s | "
+        f"texto {t_text - t_compute:.2f}s | render {t_end - t_text:.2f}s)"
+    )
+    for md_path, pdf_path in results:
+        print(f"- {md_path}\n- {pdf_path}")
+    return results
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Relatório diário de KPIs (MD + PDF).")
+    parser.add_argument("--date", type=date.fromisoformat, help="dia-alvo (padrão: ontem em BRT)")
+    parser.add_argument("--compute", choices=KPI_COMPUTE_MODES, help="onde agregar (padrão: KPI_COMPUTE)")
+    parser.add_argument("--hierarchy", help="drill-down dos alertas, ex.: entity,product,payment_method,installments")
+    parser.add_argument("--start", type=date.fromisoformat, help="backfill: primeiro dia")
+    parser.add_argument("--end", type=date.fromisoformat, help="backfill: último dia")
+    parser.add_argument("--fanout", help="um relatório por valor de cada coluna, ex.: entity,product")
+    parser.add_argument("--workers", type=int, help="backfill/fan-out: processos de renderização")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    run_kpi_bot()
+    args = _parse_args()
+    with profiled("kpi_bot"):
+        if args.start or args.end:
+            if not (args.start and args.end):
+                raise SystemExit("Backfill exige --start e --end.")
+            run_kpi_bot_range(args.start, args.end, workers=args.workers)
+        elif args.fanout or os.getenv("KPI_FANOUT"):
+            run_kpi_bot_fanout(args.date, by=args.fanout, hierarchy=args.hierarchy, workers=args.workers)
+        else:
+            run_kpi_bot(args.date, compute=args.compute, hierarchy=args.hierarchy)
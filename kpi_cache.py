@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import shutil
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+# Cache local de bi.kpi_daily particionado por dia: uma pasta por data com um .npy por
+# coluna (lido com mmap) + meta.json. Guarda as linhas brutas (sem filtro strict_positive).
+CACHE_COLUMNS = {
+    "entity": "U",
+    "product": "U",
+    "price_tier": "U",
+    "anticipation_method": "U",
+    "payment_method": "U",
+    "installments": "int64",
+    "amount_transacted": "float64",
+    "quantity_transactions": "int64",
+    "quantity_of_merchants": "int64",
+}
+
+
+class DayCache:
+    def __init__(self, cache_dir: str | None = None, max_mb: float | None = None) -> None:
+        self.cache_dir = cache_dir or os.getenv("KPI_CACHE_DIR", "./.cache/kpi_daily")
+        self.max_bytes = int(float(max_mb or os.getenv("KPI_CACHE_MAX_MB", 512)) * 2**20)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _dir(self, d: date) -> str:
+        return os.path.join(self.cache_dir, d.isoformat())
+
+    def _meta_path(self, d: date) -> str:
+        return os.path.join(self._dir(d), "meta.json")
+
+    def days(self) -> list[date]:
+        out = []
+        for name in os.listdir(self.cache_dir):
+            if os.path.exists(os.path.join(self.cache_dir, name, "meta.json")):
+                out.append(date.fromisoformat(name))
+        return sorted(out)
+
+    def row_count(self, d: date) -> int | None:
+        try:
+            with open(self._meta_path(d), encoding="utf-8") as f:
+                return json.load(f)["row_count"]
+        except FileNotFoundError:
+            return None
+
+    def get(self, d: date) -> pd.DataFrame | None:
+        """Partição do dia (colunas memory-mapped) ou None. Marca o acesso para o LRU."""
+        if self.row_count(d) is None:
+            return None
+        base = self._dir(d)
+        cols = {c: np.load(os.path.join(base, f"{c}.npy"), mmap_mode="r") for c in CACHE_COLUMNS}
+        df = pd.DataFrame(cols)
+        df.insert(0, "date", pd.Timestamp(d))
+        os.utime(self._meta_path(d))
+        return df
+
+    def put(self, d: date, df: pd.DataFrame):
+        """Grava a partição do dia (escrita atômica: pasta temporária + rename)."""
+        final = self._dir(d)
+        tmp = f"{final}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        for c, kind in CACHE_COLUMNS.items():
+            values = df[c]
+            if kind == "U":
+                arr = values.fillna("").astype(str).to_numpy(dtype=str)
+            else:
+                arr = pd.to_numeric(values, errors="coerce").fillna(0).to_numpy(dtype=kind)
+            np.save(os.path.join(tmp, f"{c}.npy"), arr)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"row_count": int(len(df)), "written_at": time.time()}, f)
+        self.drop(d)
+        os.replace(tmp, final)
+
+    def drop(self, d: date):
+        shutil.rmtree(self._dir(d), ignore_errors=True)
+
+    def size_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return total
+
+    def evict(self, keep: set | None = None):
+        """Remove partições menos recentemente usadas até caber em max_bytes."""
+        keep = keep or set()
+        total = self.size_bytes()
+        if total <= self.max_bytes:
+            return
+        by_access = sorted(
+            (d for d in self.days() if d not in keep),
+            key=lambda d: os.path.getmtime(self._meta_path(d)),
+        )
+        for d in by_access:
+            if total <= self.max_bytes:
+                break
+            size = sum(os.path.getsize(os.path.join(self._dir(d), f)) for f in os.listdir(self._dir(d)))
+            self.drop(d)
+            total -= size
+
+
+def cache_offline() -> bool:
+    """KPI_CACHE=1 com KPI_CACHE_OFFLINE=1: linhas, índice e último dia só do cache local."""
+    return os.getenv("KPI_CACHE", "0") == "1" and os.getenv("KPI_CACHE_OFFLINE", "0") == "1"
+
+
+def _positive_sums(cache: DayCache, d: date) -> tuple[float, int] | None:
+    # TPV/Tx do dia em cache com o filtro strict_positive (None se o dia não está em cache)
+    if cache.row_count(d) is None:
+        return None
+    base = cache._dir(d)
+    tpv = np.load(os.path.join(base, "amount_transacted.npy"), mmap_mode="r")
+    tx = np.load(os.path.join(base, "quantity_transactions.npy"), mmap_mode="r")
+    keep = (tpv > 0) & (tx > 0)
+    return float(tpv[keep].sum()), int(tx[keep].sum())
+
+
+def cached_daily_totals(start: date, end: date, cache: DayCache | None = None) -> pd.DataFrame:
+    """
+    TPV/Tx por dia (índice date, como kpi_bot.daily_totals) dos dias de start..end em cache,
+    lendo só as duas colunas do memory map. Para o índice diário offline.
+    """
+    cache = cache or DayCache()
+    rows = {}
+    for d in cache.days():
+        if start <= d <= end:
+            sums = _positive_sums(cache, d)
+            if sums and sums[1]:
+                rows[d] = sums
+    return pd.DataFrame.from_dict(rows, orient="index", columns=["tpv", "tx"]).rename_axis("date")
+
+
+def last_cached_date(cache: DayCache | None = None) -> date | None:
+    """Último dia em cache com TPV/Tx > 0 (get_last_available_date offline)."""
+    cache = cache or DayCache()
+    for d in reversed(cache.days()):
+        sums = _positive_sums(cache, d)
+        if sums and sums[1]:
+            return d
+    return None
+
+
+def _as_date(value) -> date | None:
+    # SQLite (KPI_BACKEND=sqlite) devolve a data como texto ISO; alguns drivers, como datetime
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _db_day_counts(engine, start: date, end: date) -> tuple[dict, date | None]:
+    """Nº de linhas por dia no período + watermark (MAX(date) da tabela inteira)."""
+    sql = text("""
+        SELECT date, COUNT(*) AS n
+        FROM bi.kpi_daily
+        WHERE date BETWEEN :start AND :end
+        GROUP BY date
+    """)
+    with engine.connect() as con:
+        counts = {_as_date(r["date"]): r["n"] for r in con.execute(sql, {"start": start, "end": end}).mappings()}
+        watermark = _as_date(con.execute(text("SELECT MAX(date) FROM bi.kpi_daily")).scalar())
+    return counts, watermark
+
+
+def _fetch_days(engine, days: list[date]) -> pd.DataFrame:
+    sql = text(f"""
+        SELECT date, {", ".join(CACHE_COLUMNS)}
+        FROM bi.kpi_daily
+        WHERE date IN :days
+    """).bindparams(bindparam("days", expanding=True))
+    with engine.connect() as con:
+        df = pd.read_sql(sql, con, params={"days": list(days)})
+    df["date"] = df["date"].map(_as_date)
+    return df
+
+
+def load_range_cached(engine, start: date, end: date, cache: DayCache | None = None,
+                      offline: bool | None = None) -> pd.DataFrame:
+    """
+    Linhas brutas de start..end (date em datetime64, sem filtro strict_positive) lidas do
+    cache. Online, valida cada dia pela contagem de linhas no Postgres e busca numa única
+    consulta só os dias ausentes/invalidados e o dia do watermark (ainda aberto).
+    Offline (env KPI_CACHE_OFFLINE=1), não toca no banco.
+    """
+    cache = cache or DayCache()
+    if offline is None:
+        offline = os.getenv("KPI_CACHE_OFFLINE", "0") == "1"
+
+    if offline:
+        wanted = [d for d in cache.days() if start <= d <= end]
+        fetched = 0
+    else:
+        counts, watermark = _db_day_counts(engine, start, end)
+        for d in cache.days():
+            if start <= d <= end and d not in counts:
+                cache.drop(d)
+        stale = [
+            d for d, n in counts.items()
+            if cache.row_count(d) != n or (watermark is not None and d >= watermark)
+        ]
+        if stale:
+            fresh = _fetch_days(engine, stale)
+            for d, part in fresh.groupby("date"):
+                cache.put(d, part)
+        wanted = sorted(counts)
+        fetched = len(stale)
+
+    parts = [cache.get(d) for d in wanted]
+    parts = [p for p in parts if p is not None]
+    cache.evict(keep=set(wanted))
+    print(f"[kpi_cache] {start}..{end}: {len(parts)} dia(s) do cache, {fetched} buscado(s) no banco"
+          f"{' (offline)' if offline else ''}")
+    if not parts:
+        return pd.DataFrame(columns=["date"] + list(CACHE_COLUMNS))
+    df = pd.concat(parts, ignore_index=True)
+    df["date"] = df["date"].astype("datetime64[ns]")
+    for c, kind in CACHE_COLUMNS.items():
+        if kind == "U":
+            df[c] = df[c].astype(object)
+    return df
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import argparse
+import contextlib
+from datetime import date, timedelta
+
+# CLI com subcomandos. Cada um importa só o que usa, dentro da função: `summary` e
+# `last-date` não carregam pandas, reportlab nem o SDK da OpenAI (ver README, seção 5.20).
+#
+#   python kpi_cli.py report [--date D] [--compute sql] [--fanout entity] ...
+#   python kpi_cli.py summary [--date D]
+#   python kpi_cli.py last-date [--include-zero]
+#   python kpi_cli.py alerts [--date D] [--hierarchy ...] [--json]
+
+
+def _engine():
+    from dotenv import load_dotenv
+    from connectors.connectors import SessionConnector
+
+    load_dotenv()
+    return SessionConnector().session()
+
+
+def cmd_report(args) -> int:
+    import kpi_bot
+    from kpi_metrics import profiled
+
+    with profiled("kpi_bot"):
+        if args.start or args.end:
+            if not (args.start and args.end):
+                raise SystemExit("Backfill exige --start e --end.")
+            kpi_bot.run_kpi_bot_range(args.start, args.end, workers=args.workers)
+        elif args.fanout or os.getenv("KPI_FANOUT"):
+            kpi_bot.run_kpi_bot_fanout(args.date, by=args.fanout, hierarchy=args.hierarchy, workers=args.workers)
+        elif kpi_bot.run_kpi_bot(args.date, compute=args.compute, hierarchy=args.hierarchy) == "NO_DATA":
+            return 1
+    return 0
+
+
+def cmd_summary(args) -> int:
+    from kpi_summary import summary
+
+    text = summary(args.date, _engine())
+    if text is None:
+        return 1
+    print(text)
+    return 0
+
+
+def cmd_last_date(args) -> int:
+    from kpi_summary import get_last_available_date
+
+    last_day = get_last_available_date(_engine(), strict_positive=not args.include_zero)
+    if last_day is None:
+        print("[kpi_cli] ❌ Nenhum dado na base.", file=sys.stderr)
+        return 1
+    print(last_day.isoformat())
+    return 0
+
+
+def _json_default(value):
+    # date/Timestamp e escalares NumPy das colunas do DataFrame de alertas
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"não serializável em JSON: {type(value).__name__}")
+
+
+def _alerts(args):
+    import kpi_bot
+
+    engine = _engine()
+    target = args.date or (kpi_bot._today_br() - timedelta(days=1))
+    df = kpi_bot.load_data(engine, kpi_bot._window_start(target), target, strict_positive=True)
+    if df.empty or df[df["date"] == kpi_bot._day_key(df["date"], target)].empty:
+        last_day = kpi_bot._last_available_date(engine)  # offline: último dia do cache
+        if last_day is None:
+            return None, None
+        if last_day != target:
+            print(f"[kpi_cli] ⚠️ Dia {target} sem dados. Usando último dia disponível: {last_day}.")
+            target = last_day
+            df = kpi_bot.load_data(engine, kpi_bot._window_start(target), target, strict_positive=True)
+    hierarchy = kpi_bot._alert_hierarchy(args.hierarchy)
+    if hierarchy:
+        return target, kpi_bot.segment_alerts_hierarchy(df, target, hierarchy)
+    return target, kpi_bot.segment_alerts(df, target)
+
+
+def cmd_alerts(args) -> int:
+    # com --json, os logs das funções do kpi_bot vão para o stderr e o stdout fica só com o JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        target, alerts = _alerts(args)
+    if alerts is None:
+        print("[kpi_cli] ❌ Nenhum dado na base.", file=sys.stderr)
+        return 1
+    if args.json:
+        records = alerts.astype(object).where(alerts.notna(), None).to_dict("records")
+        json.dump({"date": target.isoformat(), "alerts": records}, sys.stdout,
+                  ensure_ascii=False, default=_json_default)
+        print()
+    else:
+        from kpi_bot import format_alerts
+
+        print(format_alerts(alerts, limit=args.limit))
+    return 0
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="KPIs diários: relatório, resumo, último dia e alertas.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("report", help="relatório completo (MD + PDF), como o kpi_bot.py")
+    p.add_argument("--date", type=date.fromisoformat, help="dia-alvo (padrão: ontem em BRT)")
+    p.add_argument("--compute", choices=("pandas", "sql", "stats"), help="onde agregar (padrão: KPI_COMPUTE)")
+    p.add_argument("--hierarchy", help="drill-down dos alertas, ex.: entity,product,payment_method,installments")
+    p.add_argument("--start", type=date.fromisoformat, help="backfill: primeiro dia")
+    p.add_argument("--end", type=date.fromisoformat, help="backfill: último dia")
+    p.add_argument("--fanout", help="um relatório por valor de cada coluna, ex.: entity,product")
+    p.add_argument("--workers", type=int, help="backfill/fan-out: processos de renderização")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("summary", help="resumo do dia pelo índice diário (sem PDF nem LLM)")
+    p.add_argument("--date", type=date.fromisoformat, help="dia-alvo (padrão: ontem em BRT)")
+    p.set_defaults(func=cmd_summary)
+
+    p = sub.add_parser("last-date", help="último dia com dados em bi.kpi_daily")
+    p.add_argument("--include-zero", action="store_true", help="considera dias com TPV/Tx zerados")
+    p.set_defaults(func=cmd_last_date)
+
+    p = sub.add_parser("alerts", help="alertas de segmento do dia")
+    p.add_argument("--date", type=date.fromisoformat, help="dia-alvo (padrão: ontem em BRT)")
+    p.add_argument("--hierarchy", help="drill-down dos alertas, ex.: entity,product,payment_method,installments")
+    p.add_argument("--json", action="store_true", help="todos os alertas em JSON (stdout)")
+    p.add_argument("--limit", type=int, default=5, help="alertas listados no texto (padrão: 5)")
+    p.set_defaults(func=cmd_alerts)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    sys.exit(args.func(args))
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import select
+import signal
+from datetime import date, timedelta
+import pandas as pd
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+from populate_db import NOTIFY_CHANNEL
+from daily_index import load_index, index_start
+from kpi_bot import (
+    SEGMENT, aggregate_window, get_last_available_date, compute_report, write_report,
+    _window_start, _alert_hierarchy,
+)
+
+
+class WarmWindow:
+    """
+    Janela deslizante em memória com as somas por dia/segmento (aggregate_window) de
+    _window_start(watermark)..watermark. Dias novos ou recarregados são reagregados
+    individualmente; dias que saem da janela são descartados.
+    """
+
+    def __init__(self, engine, segment: list[str] | None = None) -> None:
+        self.engine = engine
+        self.segment = list(segment or SEGMENT)
+        self.frame = pd.DataFrame()
+        self.watermark: date | None = None
+
+    def days(self) -> list[date]:
+        if self.frame.empty:
+            return []
+        return sorted(pd.to_datetime(self.frame["date"].unique()).date)
+
+    def load(self, watermark: date):
+        """Carga completa da janela que termina em `watermark`."""
+        self.frame = aggregate_window(self.engine, _window_start(watermark), watermark, self.segment)
+        self.watermark = watermark
+
+    def refresh(self, start: date, end: date) -> list[date]:
+        """
+        Reagrega start..end (limitado à janela) e avança o watermark. Retorna os dias com
+        dados no intervalo.
+        """
+        if self.watermark is None or _window_start(end) > self.watermark:
+            # nova janela sem interseção com a atual: recarga completa
+            self.load(end)
+            return [d for d in self.days() if start <= d <= end]
+        watermark = max(self.watermark, end)
+        start = max(start, _window_start(watermark))
+        fresh = aggregate_window(self.engine, start, end, self.segment)
+        dates = pd.to_datetime(self.frame["date"]) if not self.frame.empty else pd.Series(dtype="datetime64[ns]")
+        keep = ~dates.between(pd.Timestamp(start), pd.Timestamp(end)) & (dates >= pd.Timestamp(_window_start(watermark)))
+        self.frame = pd.concat([self.frame[keep], fresh], ignore_index=True)
+        self.watermark = watermark
+        return sorted(pd.to_datetime(fresh["date"].unique()).date)
+
+
+def _listen(engine, channel: str):
+    """Conexão psycopg2 dedicada, em autocommit, escutando `channel`."""
+    if not channel.replace("_", "").isalnum():
+        raise ValueError(f"canal inválido: {channel}")
+    raw = engine.raw_connection()
+    conn = raw.dbapi_connection
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {channel}")
+    return raw, conn
+
+
+def _notified_ranges(conn) -> list[tuple[date, date]]:
+    conn.poll()
+    ranges = []
+    while conn.notifies:
+        n = conn.notifies.pop(0)
+        try:
+            p = json.loads(n.payload)
+            ranges.append((date.fromisoformat(p["start"]), date.fromisoformat(p["end"])))
+        except (ValueError, KeyError, TypeError):
+            print(f"[kpi_daemon] ⚠️ payload ignorado: {n.payload!r}")
+    return ranges
+
+
+def run_daemon(poll_s: float | None = None, channel: str | None = None,
+               hierarchy: list[str] | str | None = None, report_on_start: bool | None = None):
+    """
+    Serviço residente: mantém engine e WarmWindow aquecidos e gera o relatório assim que
+    um dia novo chega. Gatilhos: NOTIFY do populate_db (canal KPI_NOTIFY_CHANNEL) e, a cada
+    KPI_DAEMON_POLL_S segundos sem notificação, o watermark MAX(date). Com
+    KPI_DAEMON_LISTEN=0 funciona só por polling. Um dia recarregado só gera relatório se
+    for o mais recente (o último já reportado).
+    """
+    load_dotenv()
+    poll_s = float(poll_s or os.getenv("KPI_DAEMON_POLL_S", 30))
+    channel = channel or NOTIFY_CHANNEL
+    hierarchy = _alert_hierarchy(hierarchy)
+    if report_on_start is None:
+        report_on_start = os.getenv("KPI_DAEMON_REPORT_ON_START", "0") == "1"
+    engine = SessionConnector().session()
+
+    def _stop(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, _stop)
+
+    t0 = time.perf_counter()
+    window = WarmWindow(engine, SEGMENT + [c for c in hierarchy if c not in SEGMENT])
+    watermark = get_last_available_date(engine, strict_positive=True)
+    if watermark is not None:
+        window.load(watermark)
+    print(f"[kpi_daemon] janela aquecida até {watermark} ({len(window.frame)} linhas agregadas) "
+          f"em {time.perf_counter() - t0:.2f}s")
+    reported = watermark
+    if report_on_start and watermark is not None:
+        write_report(watermark, *compute_report(
+            window.frame, watermark, hierarchy=hierarchy,
+            index=load_index(engine, index_start(watermark), watermark)))
+
+    raw = conn = None
+    if os.getenv("KPI_DAEMON_LISTEN", "1") == "1":
+        raw, conn = _listen(engine, channel)
+        print(f"[kpi_daemon] LISTEN {channel} | polling a cada {poll_s:.0f}s")
+    try:
+        while True:
+            ranges = []
+            if conn is not None and select.select([conn], [], [], poll_s)[0]:
+                ranges = _notified_ranges(conn)
+            else:
+                if conn is None:
+                    time.sleep(poll_s)
+                latest = get_last_available_date(engine, strict_positive=True)
+                if latest is not None and (window.watermark is None or latest > window.watermark):
+                    start = window.watermark + timedelta(days=1) if window.watermark else latest
+                    ranges = [(start, latest)]
+            for start, end in ranges:
+                t_event = time.perf_counter()
+                days = window.refresh(start, end)
+                targets = [d for d in days if reported is None or d >= reported]
+                for d in targets:
+                    write_report(d, *compute_report(window.frame, d, hierarchy=hierarchy,
+                                                    index=load_index(engine, index_start(d), d)))
+                    reported = max(reported or d, d)
+                print(f"[kpi_daemon] {start}..{end}: {len(days)} dia(s) reagregado(s), "
+                      f"{len(targets)} relatório(s) em {time.perf_counter() - t_event:.2f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if raw is not None:
+            raw.invalidate()  # não devolve ao pool uma conexão em autocommit/LISTEN
+        SessionConnector.dispose_all()
+        print("[kpi_daemon] encerrado.")
+
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import pstats
+import resource
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime, timezone
+import pandas as pd
+
+# Instrumentação por etapa (spans). Desligada por padrão: só grava com KPI_METRICS_DIR
+# definido, ao fim do processo: kpi_metrics_<pid>.json (todos os spans) e
+# kpi_metrics_<pid>.prom (agregado por etapa, formato texto do Prometheus).
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans: list[dict] = []
+_totals: dict = {}  # etapa -> {count, seconds, rows, bytes, frame_bytes}
+_started = time.time()
+_registered = False
+MAX_SPANS = int(os.getenv("KPI_METRICS_MAX_SPANS", 10_000))
+
+
+def metrics_dir() -> str | None:
+    return os.getenv("KPI_METRICS_DIR") or None
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux: KiB
+
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class Span:
+    """
+    Etapa em andamento; set() anexa contadores antes de fechar: rows, bytes (transferidos,
+    ex.: payload do COPY) e frame_bytes (memória dos DataFrames, de frame_stats).
+    """
+
+    def __init__(self, name: str, attrs: dict) -> None:
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **attrs):
+        for k, v in attrs.items():
+            self.attrs[k] = self.attrs.get(k, 0) + v
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Mede uma etapa: duração, RSS atual/pico e contadores (rows/bytes via Span.set/add).
+    Spans aninhados guardam o pai (por thread). Sem KPI_METRICS_DIR não registra nada.
+    """
+    if metrics_dir() is None:
+        yield Span(name, attrs)
+        return
+    _register()
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    sp = Span(name, attrs)
+    stack.append(name)
+    t0 = time.perf_counter()
+    start = time.time()
+    try:
+        yield sp
+    finally:
+        seconds = time.perf_counter() - t0
+        stack.pop()
+        record = {
+            "name": name, "parent": parent, "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "start": start, "seconds": seconds,
+            "rss_bytes": _rss_bytes(), "peak_rss_bytes": _peak_rss_bytes(),
+            **sp.attrs,
+        }
+        with _lock:
+            if len(_spans) < MAX_SPANS:
+                _spans.append(record)
+            tot = _totals.setdefault(name, {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0,
+                                            "frame_bytes": 0})
+            tot["count"] += 1
+            tot["seconds"] += seconds
+            tot["rows"] += int(sp.attrs.get("rows", 0) or 0)
+            tot["bytes"] += int(sp.attrs.get("bytes", 0) or 0)
+            tot["frame_bytes"] += int(sp.attrs.get("frame_bytes", 0) or 0)
+
+
+def frame_stats(df) -> dict:
+    """
+    rows/frame_bytes (memória rasa) de um DataFrame, para anexar a um span. Não é o volume
+    transferido do banco: esse vai em `bytes`, medido onde o payload existe.
+    """
+    if isinstance(df, pd.DataFrame):
+        return {"rows": len(df), "frame_bytes": int(df.memory_usage(index=False).sum())}
+    return {}
+
+
+def timed(name: str | None = None):
+    """
+    Decorator: um span por chamada. Se a função devolve um DataFrame, registra rows/frame_bytes
+    dele; senão, os do primeiro DataFrame recebido como argumento.
+    """
+    def deco(fn):
+        stage = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if metrics_dir() is None:
+                return fn(*args, **kwargs)
+            with span(stage) as sp:
+                out = fn(*args, **kwargs)
+                stats = frame_stats(out) or next(
+                    (frame_stats(a) for a in args if isinstance(a, pd.DataFrame)), {})
+                sp.set(**stats)
+                return out
+        return wrapper
+    return deco
+
+
+def to_prometheus() -> str:
+    """Agregado por etapa no formato texto do Prometheus (ex.: node_exporter textfile)."""
+    lines = [
+        "# HELP kpi_stage_seconds_total Tempo total por etapa.",
+        "# TYPE kpi_stage_seconds_total counter",
+    ]
+    with _lock:
+        totals = {k: dict(v) for k, v in _totals.items()}
+    for stage, t in sorted(totals.items()):
+        lines.append(f'kpi_stage_seconds_total{{stage="{stage}"}} {t["seconds"]:.6f}')
+    for metric, key, help_text in (
+        ("kpi_stage_calls_total", "count", "Chamadas por etapa."),
+        ("kpi_stage_rows_total", "rows", "Linhas processadas por etapa."),
+        ("kpi_stage_bytes_total", "bytes", "Bytes transferidos por etapa (ex.: payload do COPY)."),
+        ("kpi_stage_frame_bytes_total", "frame_bytes", "Memória dos DataFrames produzidos por etapa."),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for stage, t in sorted(totals.items()):
+            lines.append(f'{metric}{{stage="{stage}"}} {t[key]}')
+    lines += [
+        "# HELP kpi_process_peak_rss_bytes Pico de RSS do processo.",
+        "# TYPE kpi_process_peak_rss_bytes gauge",
+        f"kpi_process_peak_rss_bytes {_peak_rss_bytes()}",
+        "# HELP kpi_process_start_time_seconds Início do processo (epoch).",
+        "# TYPE kpi_process_start_time_seconds gauge",
+        f"kpi_process_start_time_seconds {_started:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def flush(out_dir: str | None = None) -> tuple[str, str] | None:
+    """Grava JSON + .prom dos spans deste processo (chamado no atexit)."""
+    out_dir = out_dir or metrics_dir()
+    pid = os.getpid()
+    with _lock:
+        spans = [s for s in _spans if s["pid"] == pid]
+    if out_dir is None or not spans:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = os.path.join(out_dir, f"kpi_metrics_{pid}.json")
+    prom_path = os.path.join(out_dir, f"kpi_metrics_{pid}.prom")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "pid": pid, "argv": sys.argv,
+            "started_at": datetime.fromtimestamp(_started, timezone.utc).isoformat(),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "spans": spans,
+        }, f, ensure_ascii=False, indent=1, default=str)
+    with open(prom_path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus())
+    print(f"[kpi_metrics] {len(spans)} span(s) -> {json_path} | {prom_path}")
+    return json_path, prom_path
+
+
+def _register():
+    global _registered
+    if not _registered:
+        _registered = True
+        atexit.register(flush)
+
+
+def _reset_after_fork():
+    # processo filho (fork): não herda os spans do pai nem um lock possivelmente preso
+    global _lock
+    _lock = threading.Lock()
+    _spans.clear()
+    _totals.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def profiled(label: str = "run"):
+    """
+    Perfil opcional do bloco, via env KPI_PROFILE=cprofile|pyinstrument. Saída em
+    KPI_METRICS_DIR (ou ./reports): <label>_<pid>.pstats (+ top 20 no stdout) ou .html.
+    """
+    mode = os.getenv("KPI_PROFILE", "").lower()
+    if not mode:
+        yield
+        return
+    out_dir = metrics_dir() or "./reports"
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f"{label}_{os.getpid()}")
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[kpi_metrics] ⚠️ pyinstrument não instalado; usando cProfile.")
+            mode = "cprofile"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(f"{base}.html", "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+                print(f"[kpi_metrics] perfil -> {base}.html")
+            return
+    if mode != "cprofile":
+        raise ValueError(f"KPI_PROFILE inválido: {mode} (use cprofile ou pyinstrument)")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{base}.pstats")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        print(f"[kpi_metrics] perfil -> {base}.pstats")
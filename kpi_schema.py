@@ -0,0 +1,48 @@
+import pandas as pd
+
+# Vocabulário fixo das dimensões de bi.kpi_daily (valores vistos no CSV de origem).
+# Valores novos não são descartados: entram no fim do vocabulário (ver compact_frame).
+DIM_VOCAB = {
+    "entity": ["PF", "PJ"],
+    "product": ["bank_slip", "link", "pix", "pos", "tap"],
+    "price_tier": ["aggressive", "domination", "intermediary", "normal"],
+    "anticipation_method": ["Bank Slip", "D0/Nitro", "D1Anticipation", "Pix"],
+    "payment_method": ["credit", "debit", "uninformed"],
+}
+
+# Tipos numéricos compactos (amount_transacted fica em float64)
+COMPACT_INTS = {
+    "installments": "int16",
+    "quantity_transactions": "int32",
+    "quantity_of_merchants": "int32",
+}
+
+
+def _dim_dtype(col: str, values: pd.Series) -> pd.CategoricalDtype:
+    vocab = DIM_VOCAB[col]
+    extra = sorted(set(values.dropna().unique()) - set(vocab))
+    return pd.CategoricalDtype(vocab + extra)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte um frame de kpi_daily para o esquema compacto: dimensões categóricas com
+    vocabulário fixo, `date` em datetime64 e contagens em int32/int16.
+    Colunas ausentes são ignoradas; o frame original não é alterado.
+    """
+    out = df.copy()
+    if "date" in out.columns:
+        out["date"] = pd.to_datetime(out["date"])
+    for col in DIM_VOCAB:
+        if col in out.columns:
+            out[col] = out[col].astype(_dim_dtype(col, out[col]))
+    for col, dtype in COMPACT_INTS.items():
+        if col in out.columns:
+            out[col] = out[col].astype(dtype)
+    if "amount_transacted" in out.columns:
+        out["amount_transacted"] = out["amount_transacted"].astype("float64")
+    return out
+
+
+def is_compact(df: pd.DataFrame) -> bool:
+    return "date" in df.columns and pd.api.types.is_datetime64_any_dtype(df["date"])
@@ -0,0 +1,175 @@
+import os
+from datetime import date, timedelta, datetime, timezone
+from sqlalchemy import text
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+from daily_index import DailyIndex, load_index, index_start
+
+# Resumo diário a partir do índice agregado (daily_index), sem pandas, PDF nem LLM: é o que
+# `kpi_cli.py summary` / `last-date` importam. O kpi_bot reexporta estas funções.
+BRA_TZ = timezone(timedelta(hours=-3))  # America/Sao_Paulo (fixo)
+
+
+def _today_br() -> date:
+    return datetime.now(BRA_TZ).date()
+
+
+def growth(a: float, b: float) -> tuple[float, float]:
+    delta = a - b
+    pct = (delta / b * 100.0) if b and b != 0 else None
+    return delta, (round(pct, 2) if pct is not None else None)
+
+
+def comparable_dates(target: date) -> dict:
+    return {
+        "d_1": target - timedelta(days=1),
+        "w_1": target - timedelta(days=7),
+        "m_1": target - timedelta(days=30),
+    }
+
+
+def comparable_periods(target: date) -> dict:
+    """
+    Comparações de longo prazo do dia-alvo, como períodos (início, fim) inclusivos:
+    Y-1 (mesmo dia da semana, 52 semanas antes), MTD e YTD e os equivalentes anteriores
+    (até o mesmo dia do mês/ano, limitado ao fim do mês anterior / 28/02).
+    """
+    y_1 = target - timedelta(days=364)
+    prev_month_end = target.replace(day=1) - timedelta(days=1)
+    # 29/02 -> 28/02 do ano anterior
+    prev_year_day = date(target.year - 1, target.month, target.day - (target.month == 2 and target.day == 29))
+    return {
+        "y_1": (y_1, y_1),
+        "mtd": (target.replace(day=1), target),
+        "mtd_prev": (prev_month_end.replace(day=1), prev_month_end.replace(day=min(target.day, prev_month_end.day))),
+        "ytd": (date(target.year, 1, 1), target),
+        "ytd_prev": (date(target.year - 1, 1, 1), prev_year_day),
+    }
+
+
+def get_last_available_date(engine, strict_positive: bool = True) -> date | None:
+    """
+    Retorna o MAX(date) da base (opcionalmente apenas com TPV/Tx > 0).
+    """
+    where_positive = "AND amount_transacted > 0 AND quantity_transactions > 0" if strict_positive else ""
+    sql = text(f"""
+        SELECT MAX(date) AS max_date
+        FROM bi.kpi_daily
+        WHERE 1=1 {where_positive}
+    """)
+    with engine.connect() as con:
+        row = con.execute(sql).mappings().first()
+    if not row or not row["max_date"]:
+        return None
+    # SQLite (KPI_BACKEND=sqlite) guarda a data como texto ISO
+    return date.fromisoformat(row["max_date"]) if isinstance(row["max_date"], str) else row["max_date"]
+
+
+def _fmt_br_number(x, is_pct=False):
+    if x is None:
+        return "n/a"
+    if is_pct:
+        return f"{x:.2f}%"
+    return f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def format_summary(today_kpi, comp_kpis, scope: str | None = None) -> str:
+    d = today_kpi
+    dd = comp_kpis
+    lines = []
+    lines.append(f"📊 **Resumo diário — {d['date']}" + (f" — {scope}" if scope else "") + "**")
+    lines.append(f"- TPV: R$ {_fmt_br_number(d['tpv'])} | Tx: {d['tx']:,} | Avg Ticket: R$ {_fmt_br_number(d['avg_ticket'])}")
+    lines.append("")
+    lines.append("📈 **Comparações**")
+    lines.append(f"- vs D-1: Δ R$ {_fmt_br_number(dd['dod_delta'])} ({_fmt_br_number(dd['dod_pct'], True)})")
+    lines.append(f"- vs W-1: Δ R$ {_fmt_br_number(dd['wow_delta'])} ({_fmt_br_number(dd['wow_pct'], True)})")
+    lines.append(f"- vs M-1: Δ R$ {_fmt_br_number(dd['mom_delta'])} ({_fmt_br_number(dd['mom_pct'], True)})")
+    if "yoy_delta" in dd:
+        # comparações do índice diário (index_comparisons)
+        if dd["yoy_delta"] is None:
+            lines.append("- vs Y-1 (mesmo dia da semana): n/a (sem dados)")
+        else:
+            lines.append(f"- vs Y-1 (mesmo dia da semana): Δ R$ {_fmt_br_number(dd['yoy_delta'])} ({_fmt_br_number(dd['yoy_pct'], True)})")
+        for key, label, prev in (("mtd", "MTD", "no mês anterior"), ("ytd", "YTD", "no ano anterior")):
+            line = f"- {label}: R$ {_fmt_br_number(dd[f'{key}_tpv'])}"
+            if dd[f"{key}_prev_tpv"] is None:
+                lines.append(f"{line} (sem dados {prev})")
+            else:
+                lines.append(f"{line} vs R$ {_fmt_br_number(dd[f'{key}_prev_tpv'])} {prev} "
+                             f"({_fmt_br_number(dd[f'{key}_pct'], True)})")
+    return "\n".join(lines)
+
+
+def build_comparisons(today: dict, d_1: dict, w_1: dict, m_1: dict) -> dict:
+    dod_delta, dod_pct = growth(today["tpv"], d_1["tpv"])
+    wow_delta, wow_pct = growth(today["tpv"], w_1["tpv"])
+    mom_delta, mom_pct = growth(today["tpv"], m_1["tpv"])
+    return {
+        "dod_delta": dod_delta, "dod_pct": dod_pct,
+        "wow_delta": wow_delta, "wow_pct": wow_pct,
+        "mom_delta": mom_delta, "mom_pct": mom_pct,
+    }
+
+
+def index_comparisons(index: DailyIndex, target: date) -> tuple[dict, dict]:
+    """
+    KPIs do dia e comparações por lookup no índice diário: D-1/W-1/M-1 (build_comparisons),
+    Y-1 no mesmo dia da semana, MTD e YTD contra o mesmo trecho do mês/ano anterior.
+    Períodos que o índice não cobre, ou sem nenhuma transação (ex.: Y-1 no primeiro ano da
+    base), ficam como None ("n/a").
+    """
+    comps = comparable_dates(target)
+    today = index.kpi(target)
+    comp_dict = build_comparisons(today, *(index.kpi(comps[k]) for k in ("d_1", "w_1", "m_1")))
+    periods = {k: index.total(*p) for k, p in comparable_periods(target).items()}
+    periods = {k: p if p and p["tx"] else None for k, p in periods.items()}
+    y_1 = periods["y_1"]
+    comp_dict["yoy_delta"], comp_dict["yoy_pct"] = growth(today["tpv"], y_1["tpv"]) if y_1 else (None, None)
+    for key in ("mtd", "ytd"):
+        cur, prev = periods[key], periods[f"{key}_prev"]
+        comp_dict[f"{key}_tpv"] = cur["tpv"] if cur else None
+        comp_dict[f"{key}_prev_tpv"] = prev["tpv"] if prev else None
+        comp_dict[f"{key}_delta"], comp_dict[f"{key}_pct"] = (
+            growth(cur["tpv"], prev["tpv"]) if cur and prev else (None, None))
+    return today, comp_dict
+
+
+def _offline() -> bool:
+    # kpi_cache.cache_offline sem importar o kpi_cache (e o pandas) no caminho online
+    return os.getenv("KPI_CACHE", "0") == "1" and os.getenv("KPI_CACHE_OFFLINE", "0") == "1"
+
+
+def _summary_index(engine, target: date) -> DailyIndex:
+    if _offline():
+        from kpi_cache import cached_daily_totals
+
+        return DailyIndex.from_totals(cached_daily_totals(index_start(target), target))
+    return load_index(engine, index_start(target), target)
+
+
+def summary(target: date | None = None, engine=None) -> str | None:
+    """
+    Texto do resumo diário (format_summary) do dia-alvo (padrão: ontem em BRT; sem dados,
+    o último dia disponível), só com lookups no índice diário. None se a base está vazia.
+    Com KPI_CACHE=1 e KPI_CACHE_OFFLINE=1, o índice sai do cache local, sem o banco.
+    """
+    if engine is None:
+        load_dotenv()
+        engine = SessionConnector().session()
+    target = target or (_today_br() - timedelta(days=1))
+    index = _summary_index(engine, target)
+    if not index.kpi(target)["tx"]:
+        if _offline():
+            from kpi_cache import last_cached_date
+
+            last_day = last_cached_date()
+        else:
+            last_day = get_last_available_date(engine, strict_positive=True)
+        if last_day is None:
+            print("[kpi_summary] ❌ Nenhum dado na base.")
+            return None
+        if last_day != target:
+            print(f"[kpi_summary] ⚠️ Dia {target} sem dados. Usando último dia disponível: {last_day}.")
+            target = last_day
+            index = _summary_index(engine, target)
+    return format_summary(*index_comparisons(index, target))
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import hashlib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from dotenv import load_dotenv
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _openai_class():
+    """SDK da OpenAI (opcional), importado só quando o backend openai é usado: ~0,5 s de import."""
+    try:
+        from openai import OpenAI
+    except Exception:
+        return None
+    return OpenAI
+
+
+class OpenAIBackend:
+    """OpenAI Responses API. Com base_url (LLM_BASE_URL) aponta para um servidor compatível local."""
+    name = "openai"
+
+    def __init__(self, api_key: str, organization: str | None = None,
+                 base_url: str | None = None, timeout: float = 30.0) -> None:
+        self.base_url = base_url or None
+        self.client = _openai_class()(api_key=api_key, organization=organization or None,
+                                      base_url=base_url or None, timeout=timeout)
+
+    def complete(self, messages: list[dict], model: str) -> str:
+        resp = self.client.responses.create(model=model, input=messages)
+        return resp.output_text or ""
+
+
+class FakeBackend:
+    """
+    Backend determinístico para testes/benchmarks offline: devolve os bullets da última
+    mensagem, com latência simulada opcional (LLM_FAKE_LATENCY_MS) e contagem de uso.
+    """
+    name = "fake"
+    base_url = None
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self.latency_s = latency_s
+        self.calls = 0
+        self.input_chars = 0
+        self.output_chars = 0
+
+    def complete(self, messages: list[dict], model: str) -> str:
+        self.calls += 1
+        self.input_chars += sum(len(m["content"]) for m in messages)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        text = messages[-1]["content"]
+        bullets = [ln.strip() for ln in text.splitlines() if ln.strip().startswith("- ")]
+        out = "\n".join(["### Resumo Executivo (fake)"] + bullets[:10])
+        self.output_chars += len(out)
+        return out
+
+
+def get_backend(api_key: str = "", organization: str | None = None, name: str | None = None):
+    """
+    Backend escolhido por LLM_BACKEND: "openai" (padrão), "fake" ou "none".
+    Retorna None quando não há backend utilizável (sem chave ou sem o pacote openai).
+    """
+    load_dotenv()
+    name = (name or os.getenv("LLM_BACKEND", "openai")).lower()
+    if name == "fake":
+        return FakeBackend(latency_s=float(os.getenv("LLM_FAKE_LATENCY_MS", 0)) / 1000)
+    if name == "openai":
+        api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+        if not api_key or _openai_class() is None:
+            return None
+        return OpenAIBackend(api_key, organization, base_url=os.getenv("LLM_BASE_URL"),
+                             timeout=float(os.getenv("LLM_TIMEOUT_S", 30)))
+    return None
+
+
+class SummaryCache:
+    """Cache em disco endereçado por conteúdo (sha256 de backend + modelo + prompt), com TTL e limite de entradas."""
+
+    def __init__(self, cache_dir: str | None = None, ttl_s: float | None = None,
+                 max_entries: int | None = None) -> None:
+        self.cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR", "./.cache/llm")
+        self.ttl_s = float(ttl_s if ttl_s is not None else os.getenv("LLM_CACHE_TTL_S", 7 * 24 * 3600))
+        self.max_entries = int(max_entries or os.getenv("LLM_CACHE_MAX_ENTRIES", 500))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, messages: list[dict], backend: str = "", base_url: str | None = None) -> str:
+        # backend e base_url na chave: a resposta do fake (ou de outro servidor) não serve a openai
+        payload = json.dumps({"backend": backend, "base_url": base_url, "model": model, "messages": messages},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry["created"] > self.ttl_s:
+            # outro worker pode ter removido a entrada antes: não é erro
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+        return entry["text"]
+
+    def put(self, key: str, text: str):
+        tmp = f"{self._path(key)}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "text": text}, f, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.cache_dir):
+            if e.name.endswith(".json"):
+                with contextlib.suppress(FileNotFoundError):  # removida em paralelo
+                    entries.append((e.stat().st_mtime, e.path))
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def cached_complete(backend, messages: list[dict], model: str, cache: SummaryCache | None = None) -> str:
+    """Resposta do backend para `messages`, reaproveitando o cache quando possível."""
+    cache = cache or SummaryCache()
+    key = SummaryCache.key(model, messages, getattr(backend, "name", type(backend).__name__),
+                           getattr(backend, "base_url", None))
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    text = backend.complete(messages, model)
+    if text:
+        cache.put(key, text)
+    return text
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """Executa `fn` num pool de threads compartilhado (chamadas de LLM em paralelo ao resto)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_MAX_WORKERS", 4)),
+                                       thread_name_prefix="llm")
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def resolve(future: Future, fallback: str, deadline_s: float | None = None) -> str:
+    """Resultado do future até o prazo; em timeout/erro devolve o fallback."""
+    if deadline_s is None:
+        deadline_s = float(os.getenv("LLM_DEADLINE_S", 20))
+    try:
+        return future.result(timeout=deadline_s) or fallback
+    except FutureTimeout:
+        print(f"[llm] ⚠️ prazo de {deadline_s:.0f}s excedido; usando o texto original.")
+    except Exception as exc:
+        print(f"[llm] ⚠️ falha no resumo ({exc.__class__.__name__}); usando o texto original.")
+    return fallback
+
+
+def resolver(future: Future, fallback: str, deadline_s: float | None = None):
+    """Função sem argumentos que resolve o future (uma única vez) com prazo e fallback."""
+    result = []
+
+    def _get() -> str:
+        if not result:
+            result.append(resolve(future, fallback, deadline_s))
+        return result[0]
+    return _get
@@ -0,0 +1,148 @@
+import os
+import re
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+
+# Particionamento mensal de bi.kpi_daily (ver sql/00_bootstrap.sql): uma partição
+# bi.kpi_daily_pAAAAMM por mês, criada antes de cada carga do populate_db.py.
+PARENT = "bi.kpi_daily"
+# Meses criados à frente do último dia carregado: o DDL de um mês novo acontece na carga
+# anterior, não na primeira carga do mês
+PREMAKE_MONTHS = int(os.getenv("KPI_PARTITION_PREMAKE", 1))
+MIGRATION_SQL = os.path.join(os.path.dirname(__file__), "sql", "01_partition_kpi_daily.sql")
+_NAME_RE = re.compile(r"^kpi_daily_p(\d{4})(\d{2})$")
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def month_range(start: date, end: date) -> list[date]:
+    """Meses (1º dia) de start..end, inclusive."""
+    out, month = [], month_start(start)
+    while month <= end:
+        out.append(month)
+        month = add_months(month, 1)
+    return out
+
+
+def partition_name(month: date) -> str:
+    return f"kpi_daily_p{month:%Y%m}"
+
+
+def is_partitioned(cur) -> bool:
+    """True se bi.kpi_daily já é a tabela particionada (False: base antiga, ainda sem migração)."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (PARENT,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def existing_partitions(cur) -> list[date]:
+    """Meses (1º dia) que já têm partição, em ordem."""
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        (PARENT,),
+    )
+    months = []
+    for (name,) in cur.fetchall():
+        m = _NAME_RE.match(name)
+        if m:
+            months.append(date(int(m.group(1)), int(m.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_partitions(cur, start: date | None, end: date | None,
+                      premake: int | None = None) -> list[str]:
+    """
+    Cria, no cursor DBAPI já aberto (dentro da transação da carga), as partições mensais que
+    faltam de `start` até `end` + `premake` meses. Sem efeito numa base ainda não migrada.
+    Retorna os nomes das partições criadas.
+    """
+    if start is None or not is_partitioned(cur):
+        return []
+    premake = PREMAKE_MONTHS if premake is None else premake
+    have = set(existing_partitions(cur))
+    created = []
+    month, last = month_start(start), add_months(month_start(end or start), premake)
+    while month <= last:
+        if month not in have:
+            name = partition_name(month)
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS bi.{name} PARTITION OF {PARENT} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            created.append(name)
+        month = add_months(month, 1)
+    if created:
+        print(f"[partitions] criadas: {', '.join(created)}")
+    return created
+
+
+def ensure_months(cur, start: date | None, end: date | None, ensured: set) -> list[str]:
+    """
+    ensure_partitions para start..end só se algum mês do intervalo ainda não está em
+    `ensured` (meses já garantidos nesta carga; atualizado aqui). Um conjunto, e não o
+    intervalo mín..máx já visto: blocos/arquivos fora de ordem podem deixar meses no meio.
+    """
+    if start is None:
+        return []
+    months = month_range(start, end or start)
+    if ensured.issuperset(months):
+        return []
+    created = ensure_partitions(cur, start, end)
+    ensured.update(months)
+    return created
+
+
+def migrate(engine):
+    """Aplica sql/01_partition_kpi_daily.sql (tabela única -> particionada; idempotente)."""
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            with open(MIGRATION_SQL, encoding="utf-8") as f:
+                cur.execute(f.read())
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partições mensais de bi.kpi_daily.")
+    parser.add_argument("--migrate", action="store_true", help="migra uma base antiga (tabela única)")
+    parser.add_argument("--ensure", nargs=2, metavar=("INICIO", "FIM"),
+                        help="cria as partições de INICIO..FIM (AAAA-MM-DD) + KPI_PARTITION_PREMAKE")
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = SessionConnector().session()
+    if args.migrate:
+        migrate(engine)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            if args.ensure:
+                ensure_partitions(cur, *(date.fromisoformat(d) for d in args.ensure))
+            if not is_partitioned(cur):
+                print(f"{PARENT} ainda não é particionada (rode com --migrate)")
+            else:
+                months = existing_partitions(cur)
+                print(f"{PARENT}: {len(months)} partição(ões)"
+                      + (f", {months[0]:%Y-%m}..{months[-1]:%Y-%m}" if months else ""))
+        raw.commit()
+    finally:
+        raw.close()
+
+
+if __name__ == "__main__":
+    main()
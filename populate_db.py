@@ -1,57 +1,635 @@
+import io
 import os
+import glob
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import closing
 import pandas as pd
 from dotenv import load_dotenv
 from connectors.connectors import SessionConnector
+from stats_store import refresh_segment_stats
+from daily_index import refresh_daily_index, mark_stale
+from partitions import ensure_partitions, ensure_months
+from kpi_schema import compact_frame
+from kpi_metrics import span, profiled
 
-def main():
-    load_dotenv()
-    csv_path = os.getenv("CSV_PATH", "./data/Operations_analyst_data.csv")
+# Colunas exatamente como no CSV (com date no lugar de day)
+EXPECTED_COLUMNS = [
+    "date",
+    "entity",
+    "product",
+    "price_tier",
+    "anticipation_method",
+    "payment_method",
+    "installments",
+    "amount_transacted",
+    "quantity_transactions",
+    "quantity_of_merchants",
+]
+INT_COLUMNS = ["installments", "quantity_transactions", "quantity_of_merchants"]
+KEY_COLUMNS = EXPECTED_COLUMNS[:7]  # PK de bi.kpi_daily (dia + dimensões)
+
+LOAD_MODES = ("copy", "incremental", "append")
+DEFAULT_CHUNKSIZE = 50_000
+# Canal do NOTIFY emitido ao fim de cada carga (escutado pelo kpi_daemon)
+NOTIFY_CHANNEL = os.getenv("KPI_NOTIFY_CHANNEL", "kpi_daily_loaded")
 
-    # 1) Ler CSV
-    df = pd.read_csv(csv_path, low_memory=False)
 
-    # 2) Normalizar nomes (evita espaços/case) e mapear day -> date
+def normalize_chunk(df: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
+    """
+    Normaliza nomes (day -> date), valida colunas e aplica a tipagem básica.
+    Com compact, devolve o esquema compacto (kpi_schema.compact_frame).
+    """
+    # Normalizar nomes (evita espaços/case) e mapear day -> date
     df.columns = df.columns.str.strip().str.lower()
     if "day" not in df.columns:
         raise ValueError("A coluna 'day' não foi encontrada no CSV.")
     df = df.rename(columns={"day": "date"})
 
-    # 3) Confirmar colunas (exatamente as do CSV, com date no lugar de day)
-    expected = [
-        "date",
-        "entity",
-        "product",
-        "price_tier",
-        "anticipation_method",
-        "payment_method",
-        "installments",
-        "amount_transacted",
-        "quantity_transactions",
-        "quantity_of_merchants",
-    ]
-    missing = [c for c in expected if c not in df.columns]
+    # Confirmar colunas
+    missing = [c for c in EXPECTED_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f"Colunas faltando no CSV: {missing}")
 
-    # 4) Tipagem básica
-    df = df[expected].copy()
+    # Tipagem básica
+    df = df[EXPECTED_COLUMNS].copy()
     df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
     if df["date"].isna().any():
         raise ValueError("Existem datas inválidas após o parse em 'date'.")
 
-    for c in ["installments", "quantity_transactions", "quantity_of_merchants"]:
+    for c in INT_COLUMNS:
         df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
 
     df["amount_transacted"] = pd.to_numeric(df["amount_transacted"], errors="coerce").fillna(0.0)
+    return compact_frame(df) if compact else df
 
-    # 5) Inserir no Postgres (DB analytics, schema bi, tabela kpi_daily)
-    engine = SessionConnector().session()
-    df.to_sql(
-        "kpi_daily", engine, schema="bi",
-        if_exists="append", index=False,
-        method="multi", chunksize=10000
+
+def iter_csv_chunks(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE, compact: bool = False):
+    """Lê o CSV em blocos de tamanho fixo, já normalizados (memória constante)."""
+    reader = iter(pd.read_csv(csv_path, chunksize=chunksize, low_memory=False))
+    while True:
+        with span("populate_db.read_chunk") as sp:
+            chunk = next(reader, None)
+            if chunk is None:
+                return
+            chunk = normalize_chunk(chunk, compact=compact)
+            sp.set(rows=len(chunk))
+        yield chunk
+
+
+def copy_csv(cursor, buf, table: str = "bi.kpi_daily"):
+    """COPY FROM STDIN de um buffer CSV (sem cabeçalho, colunas de EXPECTED_COLUMNS)."""
+    cols = ", ".join(EXPECTED_COLUMNS)
+    cursor.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def copy_chunk(cursor, df: pd.DataFrame, table: str = "bi.kpi_daily") -> int:
+    """Envia um bloco via COPY FROM STDIN (formato CSV) no cursor psycopg2."""
+    with span("populate_db.copy_chunk", rows=len(df)) as sp:
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False)
+        sp.set(bytes=buf.tell())
+        buf.seek(0)
+        copy_csv(cursor, buf, table)
+    return len(df)
+
+
+def insert_chunk(raw, cursor, df: pd.DataFrame, dialect: str, table: str = "bi.kpi_daily") -> int:
+    """
+    Insere um bloco pelo caminho rápido de cada backend: COPY no Postgres, DataFrame
+    registrado + INSERT ... SELECT no DuckDB e executemany no SQLite (backends embutidos).
+    """
+    if dialect == "postgresql":
+        return copy_chunk(cursor, df, table)
+    cols = ", ".join(EXPECTED_COLUMNS)
+    with span("populate_db.insert_chunk", rows=len(df), backend=dialect):
+        if dialect == "duckdb":
+            con = raw.dbapi_connection
+            con.register("_kpi_chunk", df.assign(date=pd.to_datetime(df["date"])))
+            try:
+                cursor.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM _kpi_chunk")
+            finally:
+                con.unregister("_kpi_chunk")
+        elif dialect == "sqlite":
+            rows = df.assign(date=pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")).astype(object)
+            marks = ", ".join("?" * len(EXPECTED_COLUMNS))
+            cursor.executemany(f"INSERT INTO {table} ({cols}) VALUES ({marks})",
+                               rows.itertuples(index=False, name=None))
+        else:
+            raise ValueError(f"backend sem carga em bloco: {dialect}")
+    return len(df)
+
+
+def delete_days(cursor, days: list, dialect: str, table: str = "bi.kpi_daily") -> None:
+    """
+    Remove os dias de `days` antes de inseri-los de novo (backends embutidos, sem PK):
+    recarregar o mesmo CSV substitui os dias em vez de duplicar as linhas.
+    """
+    if not days:
+        return
+    marks = ", ".join("?" * len(days))
+    values = [d.isoformat() for d in days] if dialect == "sqlite" else list(days)
+    cursor.execute(f"DELETE FROM {table} WHERE date IN ({marks})", values)
+
+
+def notify_loaded(cur, start, end):
+    """
+    NOTIFY com o intervalo de dias carregado ({"start", "end"} em ISO). Dentro da transação
+    da carga, só é entregue aos ouvintes (LISTEN) no commit.
+    """
+    if start is None or os.getenv("LOAD_NOTIFY", "1") != "1":
+        return
+    payload = json.dumps({"start": start.isoformat(), "end": end.isoformat()})
+    cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
+
+
+def load_copy(engine, csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+              report_rate: bool = False, refresh_stats: bool = True,
+              compact: bool = False) -> int:
+    """
+    Carga em streaming: CSV em blocos -> COPY FROM STDIN, numa única transação.
+    Antes de cada bloco com algum mês ainda não garantido nesta carga, cria as partições
+    mensais que faltam (partitions.ensure_months; vale também para CSV fora de ordem).
+    Com refresh_stats, atualiza bi.kpi_segment_stats e bi.kpi_daily_totals a partir do menor
+    dia carregado; sem ele, marca o índice como desatualizado (daily_index.mark_stale).
+    Nos backends embutidos (KPI_BACKEND=duckdb|sqlite) usa insert_chunk, sem stats nem NOTIFY,
+    e apaga antes cada dia ainda não visto nesta carga (delete_days): sem PK, é o que torna a
+    recarga idempotente.
+    Retorna o total de linhas inseridas.
+    """
+    t0 = time.perf_counter()
+    total = 0
+    min_date = max_date = None
+    ensured: set = set()  # meses com partição garantida nesta carga
+    cleared: set = set()  # dias já apagados nesta carga (backends embutidos)
+    dialect = engine.dialect.name
+    postgres = dialect == "postgresql"
+    raw = engine.raw_connection()
+    try:
+        with closing(raw.cursor()) as cur:
+            for chunk in iter_csv_chunks(csv_path, chunksize, compact=compact):
+                if not chunk.empty:
+                    lo = pd.Timestamp(chunk["date"].min()).date()
+                    hi = pd.Timestamp(chunk["date"].max()).date()
+                    if postgres:
+                        ensure_months(cur, lo, hi, ensured)
+                    else:
+                        days = {pd.Timestamp(d).date() for d in chunk["date"].unique()} - cleared
+                        delete_days(cur, sorted(days), dialect)
+                        cleared |= days
+                    min_date = lo if min_date is None else min(min_date, lo)
+                    max_date = hi if max_date is None else max(max_date, hi)
+                total += insert_chunk(raw, cur, chunk, dialect)
+                if report_rate:
+                    elapsed = time.perf_counter() - t0
+                    print(f"[load_copy] {total} linhas | {total / elapsed:,.0f} linhas/s")
+            if postgres and min_date is not None:
+                if refresh_stats:
+                    with span("populate_db.refresh_stats"):
+                        refresh_segment_stats(cur, min_date)
+                        refresh_daily_index(cur, min_date)
+                else:
+                    mark_stale(cur, min_date)
+            if postgres:
+                notify_loaded(cur, min_date, max_date)
+        with span("populate_db.commit"):
+            raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    if report_rate:
+        elapsed = time.perf_counter() - t0
+        print(f"[load_copy] total={total} em {elapsed:.2f}s ({total / elapsed:,.0f} linhas/s)")
+    return total
+
+
+def _ensure_manifest(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS bi.kpi_daily_manifest (
+          date          date        PRIMARY KEY,
+          row_count     int         NOT NULL,
+          content_hash  varchar(16) NOT NULL,
+          loaded_at     timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def day_fingerprints(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> dict:
+    """
+    Uma passada em streaming pelo CSV: por dia, nº de linhas e um hash de conteúdo
+    independente da ordem (soma mod 2^64 dos hashes de linha).
+    Retorna {date: (row_count, content_hash_hex)}.
+    """
+    acc: dict = {}
+    for chunk in iter_csv_chunks(csv_path, chunksize):
+        h = pd.util.hash_pandas_object(chunk, index=False)
+        grp = h.groupby(chunk["date"].values)
+        sizes, sums = grp.size(), grp.sum()
+        for d, n, s in zip(sizes.index, sizes.values, sums.values):
+            n0, s0 = acc.get(d, (0, 0))
+            acc[d] = (n0 + int(n), (s0 + int(s)) % 2**64)
+    return {d: (n, f"{s:016x}") for d, (n, s) in acc.items()}
+
+
+def load_incremental(engine, csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                     report_rate: bool = False, refresh_stats: bool = True) -> tuple[list, int]:
+    """
+    Carga incremental/idempotente por dia:
+      1) calcula o fingerprint (linhas + hash) de cada dia do CSV;
+      2) compara com bi.kpi_daily_manifest e separa os dias novos/alterados;
+      3) faz COPY apenas desses dias para uma staging temporária;
+      4) DELETE + INSERT por dia em bi.kpi_daily e atualiza o manifest;
+      5) (refresh_stats) atualiza bi.kpi_segment_stats e bi.kpi_daily_totals a partir do 1º
+         dia alterado.
+    Tudo numa única transação. Retorna (dias aplicados, linhas inseridas).
+    """
+    t0 = time.perf_counter()
+    with span("populate_db.fingerprints") as sp:
+        fingerprints = day_fingerprints(csv_path, chunksize)
+        sp.set(days=len(fingerprints))
+    if not fingerprints:
+        return [], 0
+
+    total = 0
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            _ensure_manifest(cur)
+            # manifest só vale se a tabela ainda tiver o nº de linhas registrado
+            # (protege contra TRUNCATE/DELETE feitos fora do loader)
+            cur.execute(
+                """
+                SELECT m.date, m.row_count, m.content_hash
+                FROM bi.kpi_daily_manifest m
+                JOIN (
+                  SELECT date, COUNT(*) AS n FROM bi.kpi_daily
+                  WHERE date BETWEEN %(start)s AND %(end)s GROUP BY date
+                ) k ON k.date = m.date AND k.n = m.row_count
+                WHERE m.date BETWEEN %(start)s AND %(end)s
+                """,
+                {"start": min(fingerprints), "end": max(fingerprints)},
+            )
+            known = {d: (n, h) for d, n, h in cur.fetchall()}
+            changed = sorted(d for d, fp in fingerprints.items() if known.get(d) != fp)
+            if not changed:
+                raw.commit()
+                return [], 0
+
+            ensure_partitions(cur, changed[0], changed[-1])
+            cur.execute(
+                "CREATE TEMP TABLE kpi_daily_stage "
+                "(LIKE bi.kpi_daily INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            changed_set = set(changed)
+            for chunk in iter_csv_chunks(csv_path, chunksize):
+                part = chunk[chunk["date"].isin(changed_set)]
+                if not part.empty:
+                    total += copy_chunk(cur, part, table="kpi_daily_stage")
+
+            cols = ", ".join(EXPECTED_COLUMNS)
+            with span("populate_db.swap", rows=total, days=len(changed)):
+                cur.execute("DELETE FROM bi.kpi_daily WHERE date = ANY(%s)", (changed,))
+                cur.execute(f"INSERT INTO bi.kpi_daily ({cols}) SELECT {cols} FROM kpi_daily_stage")
+            cur.executemany(
+                """
+                INSERT INTO bi.kpi_daily_manifest (date, row_count, content_hash, loaded_at)
+                VALUES (%s, %s, %s, now())
+                ON CONFLICT (date) DO UPDATE
+                  SET row_count = EXCLUDED.row_count,
+                      content_hash = EXCLUDED.content_hash,
+                      loaded_at = EXCLUDED.loaded_at
+                """,
+                [(d, *fingerprints[d]) for d in changed],
+            )
+            if refresh_stats:
+                with span("populate_db.refresh_stats"):
+                    refresh_segment_stats(cur, changed[0])
+                    refresh_daily_index(cur, changed[0])
+            else:
+                mark_stale(cur, changed[0])
+            notify_loaded(cur, changed[0], changed[-1])
+        with span("populate_db.commit"):
+            raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    if report_rate:
+        elapsed = time.perf_counter() - t0
+        print(f"[load_incremental] {len(changed)}/{len(fingerprints)} dias, {total} linhas "
+              f"em {elapsed:.2f}s ({total / elapsed:,.0f} linhas/s)")
+    return changed, total
+
+
+def load_append(engine, csv_path: str, compact: bool = False, refresh_stats: bool = True) -> int:
+    """
+    Caminho antigo: CSV inteiro em memória + DataFrame.to_sql (INSERT multi).
+    Com refresh_stats, atualiza bi.kpi_segment_stats e bi.kpi_daily_totals a partir do
+    menor dia carregado. O índice é marcado como desatualizado antes do INSERT (transações
+    separadas): sem o refresh, o kpi_bot não lê totais velhos.
+    """
+    with span("populate_db.read_chunk") as sp:
+        df = normalize_chunk(pd.read_csv(csv_path, low_memory=False), compact=compact)
+        sp.set(rows=len(df))
+    postgres = engine.dialect.name == "postgresql"
+    if postgres and not df.empty:
+        lo, hi = pd.Timestamp(df["date"].min()).date(), pd.Timestamp(df["date"].max()).date()
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                ensure_partitions(cur, lo, hi)
+                mark_stale(cur, lo)
+            raw.commit()
+        finally:
+            raw.close()
+    with span("populate_db.to_sql", rows=len(df)):
+        df.to_sql(
+            "kpi_daily", engine, schema="bi",
+            if_exists="append", index=False,
+            method="multi", chunksize=10000
+        )
+    if postgres and not df.empty:
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                if refresh_stats:
+                    with span("populate_db.refresh_stats"):
+                        refresh_segment_stats(cur, lo)
+                        refresh_daily_index(cur, lo)
+                notify_loaded(cur, lo, hi)
+            raw.commit()
+        finally:
+            raw.close()
+    return len(df)
+
+
+def resolve_csv_paths(csv_path: str) -> list[str]:
+    """CSV_PATH como diretório (todos os *.csv) ou glob -> arquivos em ordem de nome."""
+    if os.path.isdir(csv_path):
+        paths = glob.glob(os.path.join(csv_path, "*.csv"))
+    else:
+        paths = glob.glob(csv_path)
+    return sorted(os.path.realpath(p) for p in paths)
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _ensure_file_log(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS bi.kpi_load_files (
+          file_path     text        PRIMARY KEY,
+          file_hash     varchar(64) NOT NULL,
+          status        varchar(8)  NOT NULL,
+          row_count     int,
+          min_date      date,
+          max_date      date,
+          error         text,
+          seconds       float8,
+          loaded_at     timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def _record_file(cur, r: dict):
+    cur.execute(
+        """
+        INSERT INTO bi.kpi_load_files
+          (file_path, file_hash, status, row_count, min_date, max_date, error, seconds, loaded_at)
+        VALUES (%(path)s, %(hash)s, %(status)s, %(rows)s, %(min_date)s, %(max_date)s,
+                %(error)s, %(seconds)s, now())
+        ON CONFLICT (file_path) DO UPDATE
+          SET file_hash = EXCLUDED.file_hash, status = EXCLUDED.status,
+              row_count = EXCLUDED.row_count, min_date = EXCLUDED.min_date,
+              max_date = EXCLUDED.max_date, error = EXCLUDED.error,
+              seconds = EXCLUDED.seconds, loaded_at = EXCLUDED.loaded_at
+        """,
+        r,
     )
-    print(f"OK: inseridas {len(df)} linhas em analytics.bi.kpi_daily")
+
+
+def _parse_file(path: str, chunksize: int) -> dict:
+    """
+    (processo do pool) Lê e valida um CSV inteiro e devolve o conteúdo já normalizado em
+    CSV pronto para o COPY, com nº de linhas e intervalo de datas.
+    """
+    buf = io.StringIO()
+    rows, lo, hi = 0, None, None
+    with span("populate_db.parse_file"):
+        for chunk in iter_csv_chunks(path, chunksize):
+            if chunk.empty:
+                continue
+            chunk.to_csv(buf, index=False, header=False)
+            rows += len(chunk)
+            d0, d1 = pd.Timestamp(chunk["date"].min()).date(), pd.Timestamp(chunk["date"].max()).date()
+            lo, hi = (d0, d1) if lo is None else (min(lo, d0), max(hi, d1))
+    return {"rows": rows, "min_date": lo, "max_date": hi, "payload": buf.getvalue()}
+
+
+def load_files(engine, paths: list[str], workers: int | None = None,
+               connections: int | None = None, chunksize: int = DEFAULT_CHUNKSIZE,
+               refresh_stats: bool = True, force: bool = False) -> list[dict]:
+    """
+    Carga de vários CSVs: leitura/validação em paralelo num pool de `workers` processos e
+    COPY em até `connections` conexões do pool ao mesmo tempo, uma transação por arquivo.
+    O resultado de cada arquivo (ok/erro) fica em bi.kpi_load_files: numa nova execução, os
+    arquivos já carregados com o mesmo conteúdo (sha256) são pulados (exceto com `force`) e
+    só os novos/alterados/com erro são carregados. Arquivo novo cujos dias ainda não têm
+    linhas vai direto por COPY; um arquivo com qualquer registro anterior (ok ou erro), com
+    dias que já têm linhas ou que se sobrepõem a outro arquivo desta carga passa por
+    staging + upsert na PK, então recarregar é idempotente (linhas removidas do arquivo não
+    são apagadas da tabela).
+    Ao fim, atualiza as stats e emite um NOTIFY do intervalo carregado.
+    Retorna um dict por arquivo (path, status, rows, min_date, max_date, error, seconds).
+    """
+    workers = workers or int(os.getenv("LOAD_WORKERS", os.cpu_count() or 1))
+    connections = connections or int(os.getenv("LOAD_CONNECTIONS", 4))
+    hashes = {p: file_sha256(p) for p in paths}
+
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            _ensure_file_log(cur)
+            cur.execute("SELECT file_path, file_hash, status FROM bi.kpi_load_files")
+            records = cur.fetchall()
+        raw.commit()
+    finally:
+        raw.close()
+    done = {p: h for p, h, status in records if status == "ok"}
+    seen = {p for p, _, _ in records}  # qualquer registro anterior, inclusive com erro
+    pending = [p for p in paths if force or done.get(p) != hashes[p]]
+    skipped = len(paths) - len(pending)
+    print(f"[load_files] {len(paths)} arquivo(s): {len(pending)} a carregar, {skipped} já carregado(s)")
+
+    lock = threading.Lock()
+    # meses com partição já garantida (conjunto: arquivos terminam fora de ordem e um mês
+    # dentro do intervalo mín..máx já visto pode ainda não ter partição)
+    ensured: set = set()
+    claimed: list = []  # (min_date, max_date) dos arquivos desta carga já enviados ao COPY
+
+    def needs_upsert(cur, path, lo, hi) -> bool:
+        # upsert se o arquivo já teve algum registro, se outro arquivo desta carga cobre
+        # algum dos dias ou se o intervalo já tem linhas (arquivos diferentes, mesmas chaves)
+        with lock:
+            overlap = any(a <= hi and lo <= b for a, b in claimed)
+            claimed.append((lo, hi))
+        if path in seen or overlap:
+            return True
+        cur.execute("SELECT EXISTS (SELECT 1 FROM bi.kpi_daily WHERE date BETWEEN %s AND %s)", (lo, hi))
+        return cur.fetchone()[0]
+
+    def ensure_range(cur, lo, hi):
+        # DDL serializado e em transação própria: duas cargas criando a mesma partição
+        # dentro das suas transações de COPY se bloqueariam
+        with lock:
+            ensure_months(cur, lo, hi, ensured)
+            cur.connection.commit()
+
+    def record_error(r: dict):
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                _record_file(cur, r)
+            raw.commit()
+        finally:
+            raw.close()
+
+    def upsert(cur, payload: str):
+        cur.execute("CREATE TEMP TABLE kpi_daily_stage (LIKE bi.kpi_daily) ON COMMIT DROP")
+        copy_csv(cur, io.StringIO(payload), table="kpi_daily_stage")
+        cols = ", ".join(EXPECTED_COLUMNS)
+        cur.execute(f"""
+            INSERT INTO bi.kpi_daily ({cols}) SELECT {cols} FROM kpi_daily_stage
+            ON CONFLICT ({", ".join(KEY_COLUMNS)}) DO UPDATE
+              SET amount_transacted = EXCLUDED.amount_transacted,
+                  quantity_transactions = EXCLUDED.quantity_transactions,
+                  quantity_of_merchants = EXCLUDED.quantity_of_merchants
+        """)
+
+    def copy_file(path: str, parsed: dict, t0: float) -> dict:
+        r = {"path": path, "hash": hashes[path], "status": "ok", "error": None,
+             **{k: parsed[k] for k in ("rows", "min_date", "max_date")}}
+        raw = engine.raw_connection()
+        try:
+            with span("populate_db.copy_file", rows=parsed["rows"], bytes=len(parsed["payload"])):
+                with raw.cursor() as cur:
+                    if parsed["min_date"] is not None:
+                        ensure_range(cur, parsed["min_date"], parsed["max_date"])
+                        if needs_upsert(cur, path, parsed["min_date"], parsed["max_date"]):
+                            upsert(cur, parsed["payload"])
+                        else:
+                            copy_csv(cur, io.StringIO(parsed["payload"]))
+                        # o refresh do fim da carga remove a marca (transação separada)
+                        mark_stale(cur, parsed["min_date"])
+                    r["seconds"] = time.perf_counter() - t0
+                    _record_file(cur, r)
+                raw.commit()
+        except Exception as exc:
+            raw.rollback()
+            r.update(status="error", error=str(exc).strip(), seconds=time.perf_counter() - t0)
+            record_error(r)
+        finally:
+            raw.close()
+        return r
+
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending) or 1))) as parse_pool, \
+            ThreadPoolExecutor(max_workers=max(1, connections), thread_name_prefix="load") as copy_pool:
+        parses = {parse_pool.submit(_parse_file, p, chunksize): p for p in pending}
+        copies = []
+        for fut in as_completed(parses):
+            path = parses[fut]
+            try:
+                parsed = fut.result()
+            except Exception as exc:
+                r = {"path": path, "hash": hashes[path], "status": "error", "rows": None,
+                     "min_date": None, "max_date": None, "error": str(exc).strip(),
+                     "seconds": time.perf_counter() - t0}
+                record_error(r)
+                results.append(r)
+                continue
+            copies.append(copy_pool.submit(copy_file, path, parsed, t0))
+        results += [f.result() for f in copies]
+
+    ok = [r for r in results if r["status"] == "ok" and r["min_date"] is not None]
+    if ok:
+        lo, hi = min(r["min_date"] for r in ok), max(r["max_date"] for r in ok)
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                if refresh_stats:
+                    with span("populate_db.refresh_stats"):
+                        refresh_segment_stats(cur, lo)
+                        refresh_daily_index(cur, lo)
+                notify_loaded(cur, lo, hi)
+            raw.commit()
+        finally:
+            raw.close()
+
+    for r in sorted(results, key=lambda r: r["path"]):
+        if r["status"] == "ok":
+            print(f"[load_files] ok   {r['path']} ({r['rows']} linhas)")
+        else:
+            print(f"[load_files] ERRO {r['path']}: {r['error'].splitlines()[0]}")
+    elapsed = time.perf_counter() - t0
+    rows = sum(r["rows"] or 0 for r in ok)
+    print(f"[load_files] {len(ok)}/{len(results)} arquivo(s) ok, {rows} linhas em {elapsed:.2f}s")
+    return results
+
+
+def main():
+    load_dotenv()
+    csv_path = os.getenv("CSV_PATH", "./data/Operations_analyst_data.csv")
+    mode = os.getenv("LOAD_MODE", "copy").lower()
+    chunksize = int(os.getenv("LOAD_CHUNKSIZE", DEFAULT_CHUNKSIZE))
+    report_rate = os.getenv("LOAD_REPORT_RATE", "0") == "1"
+    refresh_stats = os.getenv("LOAD_REFRESH_STATS", "1") == "1"
+    compact = os.getenv("LOAD_COMPACT", "0") == "1"
+    if mode not in LOAD_MODES:
+        raise ValueError(f"LOAD_MODE inválido: {mode} (use um de {LOAD_MODES})")
+
+    # Inserir no Postgres (DB analytics, schema bi, tabela kpi_daily) ou no backend embutido
+    engine = SessionConnector().session()
+    if mode == "incremental" and engine.dialect.name != "postgresql":
+        raise ValueError("LOAD_MODE=incremental requer Postgres (use copy com KPI_BACKEND embutido)")
+    if os.path.isdir(csv_path) or glob.has_magic(csv_path):
+        # vários arquivos (diretório ou glob): carga paralela com status por arquivo
+        if mode != "copy" or engine.dialect.name != "postgresql":
+            raise ValueError("CSV_PATH com diretório/glob requer LOAD_MODE=copy e Postgres")
+        paths = resolve_csv_paths(csv_path)
+        if not paths:
+            raise ValueError(f"nenhum CSV encontrado em {csv_path}")
+        with span("populate_db.files"), profiled("populate_db"):
+            results = load_files(engine, paths, chunksize=chunksize, refresh_stats=refresh_stats,
+                                 force=os.getenv("LOAD_FORCE", "0") == "1")
+        if any(r["status"] != "ok" for r in results):
+            raise SystemExit(1)
+        return
+    with span(f"populate_db.{mode}"), profiled("populate_db"):
+        if mode == "copy":
+            total = load_copy(engine, csv_path, chunksize=chunksize, report_rate=report_rate,
+                              refresh_stats=refresh_stats, compact=compact)
+        elif mode == "incremental":
+            changed, total = load_incremental(engine, csv_path, chunksize=chunksize,
+                                              report_rate=report_rate, refresh_stats=refresh_stats)
+            print(f"[incremental] dias novos/alterados: {len(changed)}")
+        else:
+            total = load_append(engine, csv_path, compact=compact, refresh_stats=refresh_stats)
+    print(f"OK: inseridas {total} linhas em bi.kpi_daily (modo={mode}, backend={engine.dialect.name})")
 
 if __name__ == "__main__":
     main()
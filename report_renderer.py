@@ -0,0 +1,312 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# PDF
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.flowables import HRFlowable
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+
+THEME_PRIMARY   = colors.HexColor("#5B6CE1")  # azul
+THEME_SUCCESS   = colors.HexColor("#16A34A")  # verde
+THEME_DANGER    = colors.HexColor("#DC2626")  # vermelho
+THEME_TEXT      = colors.HexColor("#1F2937")  # cinza-900
+THEME_MUTED     = colors.HexColor("#6B7280")  # cinza-500
+THEME_BG_CARD   = colors.HexColor("#F3F4F6")  # cinza-100
+
+# Tabelas de alertas: cabeçalho + larguras por tipo (ver kpi_bot.alert_table)
+ALERT_TABLES = {
+    "hierarchy": (["Segmento", "Métrica", "Valor", "Média", "σ", "z"],
+                  [200, 60, 80, 80, 50, 40], 2),
+    "flat":      (["Entidade", "Produto", "Método", "Métrica", "Valor", "Média", "σ", "z"],
+                  [60, 80, 80, 60, 65, 65, 35, 35], 4),
+}
+
+_renderer = None  # ReportRenderer do processo (get_renderer / workers de render_many)
+
+
+def _fmt_money_br(x):
+    return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def _fmt_int_br(x):
+    return f"{int(x):,}".replace(",", ".")
+
+def _fmt_compact_money_br(x: float) -> str:
+    """R$ 243,1 M etc."""
+    absx = abs(x)
+    if absx >= 1_000_000_000:
+        return f"R$ {x/1_000_000_000:,.1f} B".replace(",", "X").replace(".", ",").replace("X", ".")
+    if absx >= 1_000_000:
+        return f"R$ {x/1_000_000:,.1f} M".replace(",", "X").replace(".", ",").replace("X", ".")
+    if absx >= 1_000:
+        return f"R$ {x/1_000:,.1f} k".replace(",", "X").replace(".", ",").replace("X", ".")
+    return _fmt_money_br(x)
+
+def _auto_font(value_str: str) -> int:
+    """Diminui fonte conforme o comprimento do texto."""
+    n = len(value_str)
+    if n <= 8:   return 20
+    if n <= 10:  return 18
+    if n <= 12:  return 16
+    if n <= 16:  return 14
+    return 12
+
+
+def on_page(canvas, doc):
+    # cabeçalho e rodapé
+    canvas.saveState()
+    w, h = A4
+    canvas.setStrokeColor(THEME_PRIMARY)
+    canvas.setFillColor(THEME_PRIMARY)
+    canvas.setLineWidth(1)
+    canvas.line(36, h-48, w-36, h-48)
+
+    canvas.setFillColor(THEME_TEXT)
+    canvas.setFont("Helvetica-Bold", 11)
+    canvas.drawString(36, h-40, "Relatório de KPIs • CloudWalk (demo)")
+    canvas.setFont("Helvetica", 9)
+    canvas.setFillColor(THEME_MUTED)
+    canvas.drawRightString(w-36, 20, f"Página {doc.page}")
+    canvas.restoreState()
+
+
+def _delta_str(delta, pct):
+    if delta is None or pct is None:
+        return ("—", THEME_MUTED)
+    if delta >= 0:
+        return (f"▲ {_fmt_compact_money_br(delta)} ({pct:.2f}%)", THEME_SUCCESS)
+    else:
+        return (f"▼ {_fmt_compact_money_br(delta)} ({pct:.2f}%)", THEME_DANGER)
+
+
+class ReportRenderer:
+    """
+    Renderizador de PDF reutilizável: estilos de parágrafo e de tabela são montados uma vez
+    no construtor; cada render só cria os flowables do relatório.
+
+    Payload (dict): today_kpi, comp_dict, alerts (tipo, linhas) de kpi_bot.alert_table,
+    text (string ou função sem argumentos, resolvida depois de montar as tabelas) e scope
+    opcional (público do relatório no fan-out, ex.: "entity=PF").
+    """
+
+    def __init__(self) -> None:
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(name='TitleMB', parent=styles['Heading1'],
+                                  fontSize=20, textColor=THEME_TEXT, leading=24, spaceAfter=6))
+        styles.add(ParagraphStyle(name='SubMB', parent=styles['BodyText'],
+                                  fontSize=10.5, textColor=THEME_MUTED, spaceAfter=8))
+        styles.add(ParagraphStyle(name='H2MB', parent=styles['Heading2'],
+                                  fontSize=13, textColor=THEME_TEXT, spaceBefore=10, spaceAfter=6))
+        # estilos do markdown leve (markdown_to_story)
+        styles.add(ParagraphStyle(name='MdTitleMB', parent=styles['Heading1'], fontSize=16, leading=20, spaceAfter=10))
+        styles.add(ParagraphStyle(name='BodyMB', parent=styles['BodyText'], fontSize=10.5, leading=14))
+        styles.add(ParagraphStyle(name='BulletMB', parent=styles['BodyText'], fontSize=10.5, leading=14, leftIndent=12))
+        styles.add(ParagraphStyle(name='KpiTitle', fontSize=9, textColor=THEME_MUTED, leading=11))
+        self.styles = styles
+        # valor dos cards: um estilo por tamanho de fonte (_auto_font)
+        self.value_styles = {
+            fs: ParagraphStyle(f"kpiValue{fs}", fontSize=fs, textColor=THEME_TEXT, leading=fs+2)
+            for fs in (12, 14, 16, 18, 20)
+        }
+
+        self.card_style = TableStyle([
+            ("BACKGROUND", (0,0), (-1,-1), THEME_BG_CARD),
+            ("BOX", (0,0), (-1,-1), 0.0, colors.white),
+            ("LEFTPADDING", (0,0), (-1,-1), 10),
+            ("RIGHTPADDING", (0,0), (-1,-1), 10),
+            ("TOPPADDING", (0,0), (-1,-1), 6),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
+            ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ])
+        self.composite_style = TableStyle([("VALIGN", (0,0), (-1,-1), "TOP")])
+        self.comp_style = TableStyle([
+            ("BACKGROUND", (0,0), (0,-1), colors.whitesmoke),
+            ("BOX", (0,0), (-1,-1), 0.25, colors.HexColor("#E5E7EB")),
+            ("INNERGRID", (0,0), (-1,-1), 0.25, colors.HexColor("#E5E7EB")),
+            ("LEFTPADDING", (0,0), (-1,-1), 6),
+            ("RIGHTPADDING", (0,0), (-1,-1), 6),
+            ("TOPPADDING", (0,0), (-1,-1), 3),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 3),
+            ("FONTSIZE", (0,0), (-1,-1), 9),
+        ])
+        self.alert_styles = {
+            kind: TableStyle([
+                ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#EEF2FF")),
+                ("TEXTCOLOR", (0,0), (-1,0), THEME_PRIMARY),
+                ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D1D5DB")),
+                ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+                ("FONTSIZE", (0,0), (-1,0), 9),
+                ("FONTSIZE", (0,1), (-1,-1), 8.5),
+                ("ALIGN", (first_num,1), (-1,-1), "RIGHT"),
+                ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
+            ])
+            for kind, (_, _, first_num) in ALERT_TABLES.items()
+        }
+
+    # ---------- blocos ----------
+    def markdown_to_story(self, md_text: str) -> list:
+        """Converte um markdown leve em elementos para o PDF."""
+        styles = self.styles
+        story = []
+
+        lines = md_text.strip().splitlines()
+        title_used = False
+        for ln in lines:
+            ln = ln.strip()
+            if not ln:
+                story.append(Spacer(1, 6))
+                continue
+            # títulos markdown simples
+            if ln.startswith("📊 **Resumo diário"):
+                story.append(Paragraph(ln.replace("**", ""), styles['MdTitleMB']))
+                title_used = True
+                continue
+            if ln.startswith("📈 **Comparações"):
+                story.append(Paragraph(ln.replace("**", ""), styles['Heading2']))
+                continue
+            if ln.startswith("⛳ **Alertas"):
+                story.append(Spacer(1, 8))
+                story.append(Paragraph(ln.replace("**", ""), styles['Heading2']))
+                continue
+            # bullets
+            if ln.startswith("- "):
+                story.append(Paragraph("• " + ln[2:], styles['BulletMB']))
+            else:
+                story.append(Paragraph(ln.replace("**", ""), styles['BodyMB']))
+
+        if not title_used and story:
+            story.insert(0, Paragraph("Relatório de KPIs", styles['MdTitleMB']))
+        return story
+
+    def _card(self, title: str, value_str: str) -> Table:
+        # linhas do card (1 coluna, 2 linhas)
+        title_p = Paragraph(f"<b>{title}</b>", self.styles['KpiTitle'])
+        fs = _auto_font(value_str)
+        value_p = Paragraph(
+            f'<para alignment="right"><font size="{fs}"><b>{value_str}</b></font></para>',
+            self.value_styles[fs]
+        )
+        t = Table([[title_p],[value_p]], colWidths=[170])
+        t.setStyle(self.card_style)
+        return t
+
+    def kpi_cards(self, today_kpi: dict, comp: dict) -> tuple[Table, Table]:
+        """
+        Três cards em 2 linhas cada: título (pequeno, muted) em cima,
+        valor grande abaixo (alinhado à direita). Evita truncar e permite quebra.
+        """
+        # valores compactos para caber melhor
+        composite = Table([[
+            self._card("TPV", _fmt_compact_money_br(today_kpi["tpv"])),
+            self._card("Transações", _fmt_int_br(today_kpi["tx"])),
+            self._card("Ticket Médio", _fmt_compact_money_br(today_kpi["avg_ticket"])),
+        ]], colWidths=[180,180,180])
+        composite.setStyle(self.composite_style)
+
+        # ----- comparações (mantém a tabela, mas com fonte um pouco menor) -----
+        rows, row_colors = [], []
+        keys = [("vs D-1", "dod"), ("vs W-1", "wow"), ("vs M-1", "mom")]
+        if "yoy_delta" in comp:  # comparações do índice diário (kpi_bot.index_comparisons)
+            keys += [("vs Y-1", "yoy"), ("MTD vs M-1", "mtd"), ("YTD vs A-1", "ytd")]
+        for i, (label, key) in enumerate(keys):
+            s, color = _delta_str(comp[f"{key}_delta"], comp[f"{key}_pct"])
+            rows.append([label, s])
+            row_colors.append(("TEXTCOLOR", (1,i), (1,i), color))
+        comp_tbl = Table(rows, colWidths=[70, 470])
+        comp_tbl.setStyle(self.comp_style)
+        comp_tbl.setStyle(TableStyle(row_colors))
+        return composite, comp_tbl
+
+    def alerts_table(self, kind: str | None, rows: list[list[str]]):
+        if not kind or not rows:
+            return Paragraph("✅ Sem alertas para hoje.", self.styles['BodyText'])
+        header, widths, _ = ALERT_TABLES[kind]
+        tbl = Table([header] + rows, hAlign="LEFT", colWidths=widths)
+        tbl.setStyle(self.alert_styles[kind])
+        return tbl
+
+    def text_section(self, text: str) -> list:
+        styles = self.styles
+        story = [Spacer(1, 12), Paragraph("Resumo em Texto", styles['H2MB'])]
+        # converte bullets simples do markdown em parágrafos
+        for ln in text.strip().splitlines():
+            ln = ln.strip()
+            if not ln:
+                story.append(Spacer(1, 2))
+            elif ln.startswith("• ") or ln.startswith("- "):
+                story.append(Paragraph("• " + ln[2:], styles['BodyText']))
+            else:
+                story.append(Paragraph(ln, styles['BodyText']))
+        return story
+
+    # ---------- documento ----------
+    def render(self, payload: dict, out=None):
+        """
+        Renderiza um relatório. `out`: caminho (grava o arquivo e devolve o caminho),
+        objeto file-like (ex.: BytesIO, devolvido) ou None (devolve os bytes do PDF).
+        """
+        styles = self.styles
+        today_kpi = payload["today_kpi"]
+        story = [
+            # Título + data
+            Paragraph("Relatório de KPIs", styles['TitleMB']),
+            Paragraph(f"Resumo Executivo — {today_kpi['date']}"
+                      + (f" — {payload['scope']}" if payload.get("scope") else ""), styles['SubMB']),
+            HRFlowable(width="100%", color=THEME_PRIMARY, thickness=1),
+            Spacer(1, 8),
+        ]
+        # Cards e comparações
+        cards, comps = self.kpi_cards(today_kpi, payload["comp_dict"])
+        story += [cards, Spacer(1, 10), comps]
+        # posição da seção de texto: preenchida no fim, depois de montar as tabelas
+        text_at = len(story)
+
+        # Alertas
+        story.append(Spacer(1, 12))
+        story.append(Paragraph(payload.get("alerts_title") or "Alertas", styles['H2MB']))
+        story.append(self.alerts_table(*(payload.get("alerts") or (None, []))))
+
+        # Seção "Insights em texto" (opcional, texto gerado pela IA)
+        text = payload["text"]
+        if callable(text):
+            text = text()
+        story[text_at:text_at] = self.text_section(text)
+
+        target = io.BytesIO() if out is None else out
+        doc = SimpleDocTemplate(
+            target, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=64, bottomMargin=36
+        )
+        doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+        return target.getvalue() if out is None else out
+
+
+def get_renderer() -> ReportRenderer:
+    """ReportRenderer do processo, criado na primeira chamada."""
+    global _renderer
+    if _renderer is None:
+        _renderer = ReportRenderer()
+    return _renderer
+
+
+def _render_job(args):
+    payload, out = args
+    return get_renderer().render(payload, out)
+
+
+def render_many(payloads: list[dict], outs: list | None = None, workers: int | None = None) -> list:
+    """
+    Renderiza vários relatórios. `outs` (caminhos, um por payload) ou None para receber os
+    bytes de cada PDF. workers=1 renderiza neste processo; senão num pool de processos
+    (RENDER_WORKERS, padrão os.cpu_count()), com um ReportRenderer por worker.
+    Os textos dos payloads precisam ser strings (funções não atravessam processos).
+    """
+    outs = outs if outs is not None else [None] * len(payloads)
+    jobs = list(zip(payloads, outs))
+    workers = workers or int(os.getenv("RENDER_WORKERS", 0)) or os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        return [_render_job(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
@@ -1,5 +1,7 @@
 CREATE SCHEMA IF NOT EXISTS bi AUTHORIZATION metabase;
 
+-- Particionada por mês (RANGE em date). As partições bi.kpi_daily_pAAAAMM são criadas pelo
+-- partitions.py antes de cada carga; bases antigas (tabela única) migram com 01_partition_kpi_daily.sql.
 CREATE TABLE IF NOT EXISTS bi.kpi_daily (
   date                    date        NOT NULL,       -- CSV: day -> date
   entity                  varchar(8)  NOT NULL,       -- PF/PJ
@@ -15,7 +17,80 @@ CREATE TABLE IF NOT EXISTS bi.kpi_daily (
     date, entity, product, price_tier,
     anticipation_method, payment_method, installments
   )
-);
+) PARTITION BY RANGE (date);
 
-CREATE INDEX IF NOT EXISTS kpi_daily_idx_date ON bi.kpi_daily(date);
+-- BRIN: a carga chega em ordem de data, então cada faixa de páginas cobre poucos dias
+-- (índice de poucos KB por partição, no lugar do B-tree em date)
+CREATE INDEX IF NOT EXISTS kpi_daily_brin_date ON bi.kpi_daily USING brin (date);
 CREATE INDEX IF NOT EXISTS kpi_daily_idx_dims ON bi.kpi_daily(entity, product, payment_method);
+
+-- Manifest da carga incremental (populate_db.py, LOAD_MODE=incremental):
+-- fingerprint por dia para detectar dias novos/alterados no CSV.
+CREATE TABLE IF NOT EXISTS bi.kpi_daily_manifest (
+  date          date        PRIMARY KEY,
+  row_count     int         NOT NULL,
+  content_hash  varchar(16) NOT NULL,       -- soma mod 2^64 dos hashes de linha (hex)
+  loaded_at     timestamptz NOT NULL DEFAULT now()
+);
+
+-- Status por arquivo da carga de vários CSVs (populate_db.py com CSV_PATH diretório/glob):
+-- arquivos já carregados com o mesmo hash são pulados; os com erro são tentados de novo.
+CREATE TABLE IF NOT EXISTS bi.kpi_load_files (
+  file_path     text        PRIMARY KEY,
+  file_hash     varchar(64) NOT NULL,       -- sha256 do conteúdo
+  status        varchar(8)  NOT NULL,       -- ok | error
+  row_count     int,
+  min_date      date,
+  max_date      date,
+  error         text,
+  seconds       float8,
+  loaded_at     timestamptz NOT NULL DEFAULT now()
+);
+
+-- Store de estatísticas por segmento (stats_store.py): acumulados de count/sum/sum² por
+-- (entity, product, payment_method) e dia, atualizado pelo populate_db.py a cada carga.
+CREATE TABLE IF NOT EXISTS bi.kpi_segment_stats (
+  date                date           NOT NULL,
+  entity              varchar(8)     NOT NULL,
+  product             varchar(64)    NOT NULL,
+  payment_method      varchar(32)    NOT NULL,
+  tpv                 float8         NOT NULL,
+  tx                  bigint         NOT NULL,
+  avg_ticket          float8,
+  n_cum               bigint         NOT NULL,
+  tpv_sum_cum         numeric        NOT NULL,
+  tpv_sq_cum          numeric        NOT NULL,
+  avg_ticket_sum_cum  numeric        NOT NULL,
+  avg_ticket_sq_cum   numeric        NOT NULL,
+  PRIMARY KEY (entity, product, payment_method, date)
+);
+
+-- Índice diário agregado (daily_index.py): uma linha por dia com TPV/Tx/Avg Ticket e os
+-- acumulados desde o início da base, atualizado pelo populate_db.py a cada carga.
+-- Comparações D-1/W-1/M-1/Y-1 são lookups; MTD/YTD, diferença de dois acumulados.
+CREATE TABLE IF NOT EXISTS bi.kpi_daily_totals (
+  date        date     PRIMARY KEY,
+  tpv         float8   NOT NULL,
+  tx          bigint   NOT NULL,
+  avg_ticket  float8,
+  tpv_cum     numeric  NOT NULL,
+  tx_cum      bigint   NOT NULL
+);
+
+-- Totais por dia e valor das dimensões de KPI_INDEX_DIMENSIONS (padrão entity,product),
+-- lidos pelo fan-out do kpi_bot.py (um relatório por PF/PJ, por produto, ...).
+CREATE TABLE IF NOT EXISTS bi.kpi_daily_totals_by (
+  dim    varchar(32)  NOT NULL,
+  value  varchar(64)  NOT NULL,
+  date   date         NOT NULL,
+  tpv    float8       NOT NULL,
+  tx     bigint       NOT NULL,
+  PRIMARY KEY (dim, value, date)
+);
+
+-- Dias carregados ainda sem refresh do índice (ex.: LOAD_REFRESH_STATS=0): com uma marca
+-- <= fim do período, o kpi_bot.py agrega das linhas brutas em vez de ler o índice.
+CREATE TABLE IF NOT EXISTS bi.kpi_daily_totals_stale (
+  since      date         NOT NULL,
+  marked_at  timestamptz  NOT NULL DEFAULT now()
+);
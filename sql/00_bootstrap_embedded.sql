@@ -0,0 +1,17 @@
+-- Schema para os backends embutidos (KPI_BACKEND=duckdb|sqlite; ver connectors.py).
+-- Mesmas colunas de bi.kpi_daily do 00_bootstrap.sql, sem a PK (cargas são em lote; o
+-- populate_db apaga os dias do CSV antes de inseri-los) e com amount_transacted em ponto
+-- flutuante. No SQLite, "bi" é o arquivo anexado (ATTACH) e o
+-- índice por data é criado pelo connectors.py (a sintaxe de índice difere entre os dois).
+CREATE TABLE IF NOT EXISTS bi.kpi_daily (
+  date                    date        NOT NULL,
+  entity                  varchar(8)  NOT NULL,
+  product                 varchar(64) NOT NULL,
+  price_tier              varchar(32),
+  anticipation_method     varchar(32),
+  payment_method          varchar(32) NOT NULL,
+  installments            int,
+  amount_transacted       double precision,
+  quantity_transactions   int,
+  quantity_of_merchants   int
+);
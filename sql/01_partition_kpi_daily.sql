@@ -0,0 +1,58 @@
+-- Migração de bi.kpi_daily (tabela única, bases criadas antes do particionamento) para a
+-- versão particionada por mês do 00_bootstrap.sql. Idempotente: não faz nada se a tabela já
+-- for particionada. Roda numa única transação: cria a tabela nova e as partições de todos os
+-- meses existentes, copia as linhas em ordem de data (bom para o BRIN) e remove a antiga.
+-- Bloqueia bi.kpi_daily durante a cópia; rode fora do horário de carga.
+DO $$
+DECLARE
+  m     date;
+  last  date;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'bi.kpi_daily'::regclass) = 'p' THEN
+    RAISE NOTICE 'bi.kpi_daily já é particionada; nada a migrar';
+    RETURN;
+  END IF;
+
+  ALTER TABLE bi.kpi_daily RENAME TO kpi_daily_legacy;
+  ALTER INDEX IF EXISTS bi.kpi_daily_pkey RENAME TO kpi_daily_legacy_pkey;
+  ALTER INDEX IF EXISTS bi.kpi_daily_idx_date RENAME TO kpi_daily_legacy_idx_date;
+  ALTER INDEX IF EXISTS bi.kpi_daily_idx_dims RENAME TO kpi_daily_legacy_idx_dims;
+  -- criado pelo 00_bootstrap.sql novo quando rodado sobre a tabela antiga
+  ALTER INDEX IF EXISTS bi.kpi_daily_brin_date RENAME TO kpi_daily_legacy_brin_date;
+
+  CREATE TABLE bi.kpi_daily (
+    date                    date        NOT NULL,
+    entity                  varchar(8)  NOT NULL,
+    product                 varchar(64) NOT NULL,
+    price_tier              varchar(32),
+    anticipation_method     varchar(32),
+    payment_method          varchar(32) NOT NULL,
+    installments            int,
+    amount_transacted       numeric(18,2),
+    quantity_transactions   int,
+    quantity_of_merchants   int,
+    PRIMARY KEY (
+      date, entity, product, price_tier,
+      anticipation_method, payment_method, installments
+    )
+  ) PARTITION BY RANGE (date);
+  CREATE INDEX kpi_daily_brin_date ON bi.kpi_daily USING brin (date);
+  CREATE INDEX kpi_daily_idx_dims ON bi.kpi_daily(entity, product, payment_method);
+
+  SELECT date_trunc('month', MIN(date))::date, date_trunc('month', MAX(date))::date
+    INTO m, last
+  FROM bi.kpi_daily_legacy;
+  WHILE m <= last LOOP
+    EXECUTE format(
+      'CREATE TABLE bi.%I PARTITION OF bi.kpi_daily FOR VALUES FROM (%L) TO (%L)',
+      'kpi_daily_p' || to_char(m, 'YYYYMM'), m, (m + interval '1 month')::date
+    );
+    m := (m + interval '1 month')::date;
+  END LOOP;
+
+  INSERT INTO bi.kpi_daily SELECT * FROM bi.kpi_daily_legacy ORDER BY date;
+  DROP TABLE bi.kpi_daily_legacy;
+  RAISE NOTICE 'bi.kpi_daily migrada para particionamento mensal';
+END $$;
+
+ANALYZE bi.kpi_daily;
@@ -0,0 +1,172 @@
+import os
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import text
+from dotenv import load_dotenv
+from connectors.connectors import SessionConnector
+
+# Granularidade do store (deve bater com kpi_bot.SEGMENT para ser usado nos alertas)
+STATS_SEGMENT = ["entity", "product", "payment_method"]
+STATS_TABLE = "bi.kpi_segment_stats"
+
+_SEG = ", ".join(STATS_SEGMENT)
+_SEG_JOIN = " AND ".join(f"s.{c} = t.{c}" for c in STATS_SEGMENT)
+_CUM_COLS = ["n_cum", "tpv_sum_cum", "tpv_sq_cum", "avg_ticket_sum_cum", "avg_ticket_sq_cum"]
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+  date                date           NOT NULL,
+  entity              varchar(8)     NOT NULL,
+  product             varchar(64)    NOT NULL,
+  payment_method      varchar(32)    NOT NULL,
+  tpv                 float8         NOT NULL,
+  tx                  bigint         NOT NULL,
+  avg_ticket          float8,
+  n_cum               bigint         NOT NULL,
+  tpv_sum_cum         numeric        NOT NULL,
+  tpv_sq_cum          numeric        NOT NULL,
+  avg_ticket_sum_cum  numeric        NOT NULL,
+  avg_ticket_sq_cum   numeric        NOT NULL,
+  PRIMARY KEY ({_SEG}, date)
+)
+"""
+
+# Recalcula os acumulados a partir de `since`, partindo do último acumulado anterior de cada
+# segmento. Custo proporcional aos dias novos, não ao histórico inteiro.
+REFRESH_SQL = f"""
+DELETE FROM {STATS_TABLE} WHERE date >= %(since)s;
+
+INSERT INTO {STATS_TABLE} (date, {_SEG}, tpv, tx, avg_ticket, {", ".join(_CUM_COLS)})
+WITH daily AS (
+  SELECT
+    date, {_SEG},
+    SUM(amount_transacted)::float8 AS tpv,
+    SUM(quantity_transactions)     AS tx
+  FROM bi.kpi_daily
+  WHERE date >= %(since)s
+    AND amount_transacted > 0 AND quantity_transactions > 0
+  GROUP BY date, {_SEG}
+),
+metrics AS (
+  SELECT d.*, tpv / NULLIF(tx, 0) AS avg_ticket FROM daily d
+),
+base AS (
+  SELECT DISTINCT ON ({_SEG}) {_SEG}, {", ".join(_CUM_COLS)}
+  FROM {STATS_TABLE}
+  WHERE date < %(since)s
+  ORDER BY {_SEG}, date DESC
+)
+SELECT
+  m.date, {", ".join(f"m.{c}" for c in STATS_SEGMENT)}, m.tpv, m.tx, m.avg_ticket,
+  COALESCE(b.n_cum, 0)              + COUNT(*) OVER w,
+  COALESCE(b.tpv_sum_cum, 0)        + SUM(m.tpv::numeric) OVER w,
+  COALESCE(b.tpv_sq_cum, 0)         + SUM(m.tpv::numeric ^ 2) OVER w,
+  COALESCE(b.avg_ticket_sum_cum, 0) + SUM(m.avg_ticket::numeric) OVER w,
+  COALESCE(b.avg_ticket_sq_cum, 0)  + SUM(m.avg_ticket::numeric ^ 2) OVER w
+FROM metrics m
+LEFT JOIN base b USING ({_SEG})
+WINDOW w AS (PARTITION BY {", ".join(f"m.{c}" for c in STATS_SEGMENT)} ORDER BY m.date
+             ROWS UNBOUNDED PRECEDING);
+"""
+
+
+def ensure_stats_table(cur):
+    cur.execute(DDL)
+
+
+def refresh_segment_stats(cur, since: date):
+    """
+    Atualiza o store a partir de `since` (inclusive) num cursor DBAPI já aberto,
+    dentro da transação da carga.
+    """
+    ensure_stats_table(cur)
+    cur.execute(REFRESH_SQL, {"since": since})
+
+
+def segment_alerts_stats(engine, target: date, window_days: int, z_alert: float) -> pd.DataFrame:
+    """
+    Alertas por segmento lendo só o store: para cada segmento com dado no dia-alvo,
+    o acumulado mais recente antes do alvo menos o acumulado antes do início da janela
+    dá count/sum/sum² da janela (2 buscas por índice por segmento).
+    """
+    sql = text(f"""
+        WITH hist AS (
+          SELECT
+            {", ".join(f"t.{c}" for c in STATS_SEGMENT)}, t.tpv, t.avg_ticket,
+            hi.n_cum - COALESCE(lo.n_cum, 0) AS n,
+            hi.tpv_sum_cum        - COALESCE(lo.tpv_sum_cum, 0)        AS tpv_s,
+            hi.tpv_sq_cum         - COALESCE(lo.tpv_sq_cum, 0)         AS tpv_sq,
+            hi.avg_ticket_sum_cum - COALESCE(lo.avg_ticket_sum_cum, 0) AS avg_ticket_s,
+            hi.avg_ticket_sq_cum  - COALESCE(lo.avg_ticket_sq_cum, 0)  AS avg_ticket_sq
+          FROM {STATS_TABLE} t
+          LEFT JOIN LATERAL (
+            SELECT {", ".join(_CUM_COLS)} FROM {STATS_TABLE} s
+            WHERE {_SEG_JOIN} AND s.date < :target
+            ORDER BY s.date DESC LIMIT 1
+          ) hi ON true
+          LEFT JOIN LATERAL (
+            SELECT {", ".join(_CUM_COLS)} FROM {STATS_TABLE} s
+            WHERE {_SEG_JOIN} AND s.date < :hist_start
+            ORDER BY s.date DESC LIMIT 1
+          ) lo ON true
+          WHERE t.date = :target
+        ),
+        stats AS (
+          SELECT
+            {_SEG}, tpv, avg_ticket,
+            (tpv_s / NULLIF(n, 0))::float8 AS tpv_ma,
+            (CASE WHEN n > 1 THEN sqrt(GREATEST((tpv_sq - tpv_s ^ 2 / n) / (n - 1), 0)) END)::float8 AS tpv_sd,
+            (avg_ticket_s / NULLIF(n, 0))::float8 AS avg_ticket_ma,
+            (CASE WHEN n > 1 THEN sqrt(GREATEST((avg_ticket_sq - avg_ticket_s ^ 2 / n) / (n - 1), 0)) END)::float8 AS avg_ticket_sd
+          FROM hist
+        ),
+        scored AS (
+          SELECT {_SEG}, 'tpv' AS metric, tpv AS value, tpv_ma AS ma, tpv_sd AS sd,
+                 (tpv - tpv_ma) / NULLIF(tpv_sd, 0) AS zscore
+          FROM stats
+          UNION ALL
+          SELECT {_SEG}, 'avg_ticket', COALESCE(avg_ticket, 0.0), avg_ticket_ma, avg_ticket_sd,
+                 (COALESCE(avg_ticket, 0.0) - avg_ticket_ma) / NULLIF(avg_ticket_sd, 0)
+          FROM stats
+        )
+        SELECT * FROM scored
+        WHERE zscore < :z_alert
+        ORDER BY zscore
+    """)
+    params = {
+        "target": target,
+        "hist_start": target - timedelta(days=window_days),
+        "z_alert": z_alert,
+    }
+    with engine.connect() as con:
+        alerts = pd.read_sql(sql, con, params=params)
+    cols = STATS_SEGMENT + ["metric", "value", "ma", "sd", "zscore"]
+    if alerts.empty:
+        return pd.DataFrame(columns=cols)
+    return alerts[cols].reset_index(drop=True)
+
+
+def rebuild(engine, since: date | None = None):
+    """Reconstrói o store (todo o histórico por padrão)."""
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            if since is None:
+                cur.execute("SELECT MIN(date) FROM bi.kpi_daily")
+                since = cur.fetchone()[0]
+            if since is not None:
+                refresh_segment_stats(cur, since)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return since
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    since = os.getenv("STATS_SINCE")
+    since = rebuild(SessionConnector().session(), date.fromisoformat(since) if since else None)
+    print(f"OK: {STATS_TABLE} atualizado a partir de {since}")
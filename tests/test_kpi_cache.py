@@ -0,0 +1,63 @@
+"""
+Cache local por dia (kpi_cache) sobre um backend embutido: a primeira leitura busca todos os
+dias no banco, a segunda só o watermark, e a leitura offline devolve as mesmas linhas.
+
+    python -m pytest -q tests/test_kpi_cache.py
+"""
+import os
+import sys
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from connectors.connectors import embedded_engine  # noqa: E402
+from kpi_cache import DayCache, load_range_cached  # noqa: E402
+from populate_db import load_copy  # noqa: E402
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "Operations_analyst_data.csv")
+DAYS = 10
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def loaded(request, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb_engine")
+    if not os.path.exists(CSV_PATH):
+        pytest.skip(f"CSV de exemplo ausente: {CSV_PATH}")
+    raw = pd.read_csv(CSV_PATH, low_memory=False)
+    days = pd.to_datetime(raw["day"]).dt.date
+    end = days.max()
+    start = end - timedelta(days=DAYS - 1)
+    csv_path = tmp_path / "sample.csv"
+    raw[days >= start].to_csv(csv_path, index=False)
+    engine = embedded_engine(request.param, str(tmp_path / f"kpi.{request.param}"))
+    load_copy(engine, str(csv_path))
+    return engine, start, end, raw[days >= start]
+
+
+def _per_day(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.assign(date=pd.to_datetime(df["date"]).dt.date)
+    return out.groupby("date")["amount_transacted"].agg(["size", "sum"])
+
+
+def test_cache_round_trip(loaded, tmp_path, capsys):
+    engine, start, end, expected = loaded
+    cache = DayCache(cache_dir=str(tmp_path / "cache"))
+    want = _per_day(expected.rename(columns={"day": "date"}))
+
+    first = load_range_cached(engine, start, end, cache, offline=False)
+    assert "buscado(s) no banco" in capsys.readouterr().out
+    assert len(first) == len(expected)
+    assert cache.days() == sorted(want.index)
+    pd.testing.assert_frame_equal(_per_day(first), want)
+
+    # segunda leitura: só o dia do watermark (ainda aberto) volta ao banco
+    second = load_range_cached(engine, start, end, cache, offline=False)
+    assert "1 buscado(s) no banco" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(_per_day(second), want)
+
+    offline = load_range_cached(None, start, end, cache, offline=True)
+    assert "0 buscado(s) no banco (offline)" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(_per_day(offline), want)
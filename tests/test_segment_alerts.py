@@ -0,0 +1,87 @@
+"""
+Regressão do segment_alerts vetorizado (somas por janela + z-score em NumPy) contra a
+versão anterior (groupby por dia-alvo), sobre o CSV de exemplo em data/.
+
+    python -m pytest -q tests/test_segment_alerts.py
+"""
+import os
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kpi_bot  # noqa: E402
+from kpi_bot import SEGMENT, WINDOW_DAYS, Z_ALERT  # noqa: E402
+from populate_db import normalize_chunk  # noqa: E402
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "Operations_analyst_data.csv")
+DAYS = 90
+COLUMNS = ["value", "ma", "sd", "zscore"]
+
+
+def legacy_segment_alerts(df: pd.DataFrame, target) -> pd.DataFrame:
+    # implementação anterior à vetorização, mantida aqui só como referência
+    grp_cols = ["date"] + SEGMENT
+    daily = (df.groupby(grp_cols, as_index=False)[["amount_transacted", "quantity_transactions"]].sum()
+               .rename(columns={"amount_transacted": "tpv", "quantity_transactions": "tx"}))
+    daily["avg_ticket"] = daily.apply(lambda r: (r["tpv"] / r["tx"]) if r["tx"] else 0.0, axis=1)
+
+    hist = daily[(daily["date"] < target) & (daily["date"] >= (target - timedelta(days=WINDOW_DAYS)))]
+    today = daily[daily["date"] == target].copy()
+    if today.empty:
+        return pd.DataFrame(columns=SEGMENT + ["metric", "value", "ma", "sd", "zscore"])
+
+    def _z(dfh, metric):
+        agg = dfh.groupby(SEGMENT)[metric].agg(["mean", "std"]).reset_index()
+        base = today[SEGMENT + [metric]].merge(agg, on=SEGMENT, how="left")
+        base["zscore"] = (base[metric] - base["mean"]) / base["std"].replace({0: pd.NA})
+        base["metric"] = metric
+        base = base.rename(columns={metric: "value", "mean": "ma", "std": "sd"})
+        return base[SEGMENT + ["metric", "value", "ma", "sd", "zscore"]]
+
+    z_tpv = _z(hist, "tpv")
+    z_avg = _z(hist.assign(avg_ticket=hist["tpv"] / hist["tx"].replace({0: pd.NA})), "avg_ticket")
+    alerts = pd.concat([z_tpv, z_avg], ignore_index=True)
+    alerts = alerts[(alerts["zscore"].notna()) & (alerts["zscore"] < Z_ALERT)]
+    return alerts.sort_values("zscore").reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def ops_df() -> pd.DataFrame:
+    if not os.path.exists(CSV_PATH):
+        pytest.skip(f"CSV de exemplo ausente: {CSV_PATH}")
+    df = normalize_chunk(pd.read_csv(CSV_PATH, low_memory=False))
+    # mesmo filtro do load_data(strict_positive=True)
+    return df[(df["amount_transacted"] > 0) & (df["quantity_transactions"] > 0)].reset_index(drop=True)
+
+
+def _target_days(df: pd.DataFrame) -> list:
+    days = sorted(df["date"].unique())
+    return days[-DAYS:]
+
+
+def _normalized(alerts: pd.DataFrame) -> pd.DataFrame:
+    keys = SEGMENT + ["metric"]
+    out = alerts[keys + COLUMNS].copy()
+    out[COLUMNS] = out[COLUMNS].astype(float)
+    return out.sort_values(keys).reset_index(drop=True)
+
+
+def test_matches_legacy_implementation(ops_df, monkeypatch):
+    monkeypatch.setenv("KPI_BASELINE", "mean")
+    monkeypatch.delenv("KPI_BASELINE_HORIZONS", raising=False)
+
+    checked = alerted = 0
+    for target in _target_days(ops_df):
+        expected = _normalized(legacy_segment_alerts(ops_df, target))
+        got = _normalized(kpi_bot.segment_alerts(ops_df, target))
+        assert got[SEGMENT + ["metric"]].equals(expected[SEGMENT + ["metric"]]), f"alertas diferentes em {target}"
+        assert np.allclose(got[COLUMNS].to_numpy(), expected[COLUMNS].to_numpy(), rtol=1e-9, equal_nan=True), \
+            f"valores diferentes em {target}"
+        checked += 1
+        alerted += len(expected)
+    assert checked == DAYS
+    assert alerted > 0  # a base de exemplo tem alertas na janela: o teste não passa no vazio